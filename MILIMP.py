@@ -4,14 +4,15 @@ import mili
 import time
 import shutil
 import pygame
-import pathlib
 import threading
 import faulthandler
+import multiprocessing
 
 pygame.mixer.pre_init(buffer=2048)
 
 from ui.common import *
 from ui.main_menus.history import HistoryUI
+from ui.main_menus.load_errors import LoadErrorsUI
 from ui.main_menus.settings import SettingsUI
 from ui.yt_search import YTSearchUI
 from ui.list_viewer import ListViewerUI
@@ -21,6 +22,19 @@ from ui.music_controls import MusicControlsUI
 from ui.playlist_viewer import PlaylistViewerUI
 from ui.extra.discord_presence import DiscordPresence
 from ui.main_menus.music_fullscreen import MusicFullscreenUI
+from ui.common.media_index import MEDIA_INDEX
+from ui.common.conversion import CONVERSION_QUEUE
+from ui.common.cover_loader import COVER_LOADER
+from ui.common.profiler import PROFILER
+from ui.common.deferred_imports import DEFERRED_IMPORTS
+from ui.common.media_probe import DURATION_PROBER, PROBE_URGENT
+from ui.common.folder_watcher import FOLDER_WATCHER
+from ui.common.ingest import INGEST
+from ui.common.load_errors import LOAD_ERRORS
+from ui.common.persistence import PERSISTENCE, save_missing_covers, clean_yt_temp
+from ui.common.library_snapshot import load_library, write_snapshot
+from ui.common.seek_stream import SEEK_STREAMS
+from ui.common.progressive import PROGRESSIVE, clean_previews
 from ui.common.data import (
     HistoryData,
     MusicData,
@@ -46,24 +60,35 @@ if "win" in sys.platform or os.name == "nt":
 
 class MILIMP(mili.GenericApp):
     def __init__(self):
-        self.init_pygame()
-        self.init_attributes()
-        self.init_data_folder_check()
-        self.init_load_settings()
-        self.init_loading_screen()
-        self.init_load_icons()
-        self.init_load_data()
-        self.init_mili_settings()
-        self.init_try_set_icon_mac()
-        self.make_bg_image()
-        self.init_health_check()
+        PROFILER.start(sys.argv)
+        for phase in [
+            self.init_pygame,
+            self.init_attributes,
+            self.init_data_folder_check,
+            self.init_load_settings,
+            self.init_loading_screen,
+            self.init_load_icons,
+            self.init_load_data,
+            self.init_mili_settings,
+            self.init_try_set_icon_mac,
+            self.make_bg_image,
+            self.init_health_check,
+        ]:
+            with PROFILER.phase(phase.__name__):
+                phase()
 
     def init_load_icons(self):
         ICONS.load()
         self.window.set_icon(ICONS.playlist_cover)
 
     def init_health_check(self):
-        thread = threading.Thread(target=health_check)
+        # the collector runs on a schedule, a launch in between only costs a comparison
+        if time.time() - self.health_check_last < self.health_check_days * 86400:
+            return
+        self.health_check_last = time.time()
+        thread = threading.Thread(
+            target=health_check, args=([p.get_save_data() for p in self.playlists],)
+        )
         thread.start()
 
     def init_pygame(self):
@@ -100,6 +125,7 @@ class MILIMP(mili.GenericApp):
         self.music_controls = MusicControlsUI(self)
         self.settings = SettingsUI(self)
         self.history = HistoryUI(self)
+        self.load_errors = LoadErrorsUI(self)
         self.discord_presence = DiscordPresence(self)
         self.keybinds = Keybinds(self)
         self.edit_keybinds = EditKeybindsUI(self)
@@ -115,6 +141,11 @@ class MILIMP(mili.GenericApp):
         self.maximized = False
         self.strip_youtube_id = False
         self.taskbar_height = 0
+        self.lazy_playlists = True
+        self.library_snapshot = False
+        self.gapless = True
+        self.health_check_days = 7
+        self.health_check_last = 0
         # status
         self.start_style = mili.PADLESS | {"spacing": 0}
         self.start_time = time.time()
@@ -135,7 +166,6 @@ class MILIMP(mili.GenericApp):
         self.split_screen = False
         self.split_w = self.window.size[0]
         self.split_size = self.window.size
-        self.startup_covers_toload: list[tuple[MusicData, str]] = []
         # bg effect/mili
         self.bg_effect_image = None
         self.bg_black_image = None
@@ -181,24 +211,28 @@ class MILIMP(mili.GenericApp):
         ]:
             if not os.path.exists(f"data/{name}"):
                 os.mkdir(f"data/{name}")
+        clean_previews()
+        MEDIA_INDEX.open("data/media_index.db")
 
-        playlist_data = load_json("data/playlists.json", [])
-        shutil.copyfile("data/playlists.json", "data/playlists_backup.json")
-        history_data = load_json("data/history.json", [])
+        with PROFILER.phase("read library"):
+            playlist_data, history_data = load_library(self.library_snapshot)
+        if os.path.exists("data/playlists.json"):
+            shutil.copyfile("data/playlists.json", "data/playlists_backup.json")
 
         for pdata in playlist_data:
             name = pdata["name"]
-            paths = [
-                pathlib.Path(path)
-                if isinstance(path, str)
-                else [pathlib.Path(path[0]), path[1]]
-                for path in pdata["paths"]
-            ]
-            self.playlists.append(
-                Playlist(
-                    name, paths, pdata.get("groups", []), ICONS.loading, startup=self
+            with PROFILER.phase(f"load playlist '{name}'"):
+                self.playlists.append(
+                    Playlist(
+                        name,
+                        pdata["paths"],
+                        pdata.get("groups", []),
+                        ICONS.loading,
+                        lazy=self.lazy_playlists,
+                        folder=pdata.get("folder", None),
+                        shuffle_data=pdata.get("shuffle", None),
+                    )
                 )
-            )
 
         for hdata in history_data:
             obj = HistoryData.load_from_data(hdata, self)
@@ -245,6 +279,14 @@ class MILIMP(mili.GenericApp):
                 "strip_youtube_id": False,
                 "taskbar_height": 0,
                 "videoclip_threaded": True,
+                "lazy_playlists": True,
+                "library_snapshot": False,
+                "gapless": True,
+                "convert_workers": CONVERSION_QUEUE.max_workers,
+                "convert_backend": CONVERSION_QUEUE.backend,
+                "profile_startup": False,
+                "health_check_days": 7,
+                "health_check_last": 0,
                 "yt_search": "",
                 "yt_fetch_amount": 7,
                 "yt_search_method": "yt-dlp",
@@ -267,6 +309,16 @@ class MILIMP(mili.GenericApp):
             self.strip_youtube_id = data.get("strip_youtube_id", False)
             self.taskbar_height = data.get("taskbar_height", 0)
             self.videoclip_threaded = data.get("videoclip_threaded", True)
+            self.lazy_playlists = data.get("lazy_playlists", True)
+            self.library_snapshot = data.get("library_snapshot", False)
+            self.gapless = data.get("gapless", True)
+            CONVERSION_QUEUE.set_workers(
+                data.get("convert_workers", CONVERSION_QUEUE.max_workers)
+            )
+            CONVERSION_QUEUE.set_backend(data.get("convert_backend", "process"))
+            PROFILER.setting = data.get("profile_startup", False)
+            self.health_check_days = data.get("health_check_days", 7)
+            self.health_check_last = data.get("health_check_last", 0)
             minip = self.music_controls.minip
             minip.last_size, minip.last_pos, minip.last_borderless = data.get(
                 "miniplayer", minip_data
@@ -373,15 +425,54 @@ class MILIMP(mili.GenericApp):
             or self.music.duration in [None, NotCached]
         ):
             return
+        if PROGRESSIVE.music is self.music:
+            if not PROGRESSIVE.playing:
+                return
+            # only what the converter wrote so far can be reached
+            if PROGRESSIVE.writing():
+                pos = min(pos, PROGRESSIVE.buffered())
+        try:
+            pygame.mixer.music.set_pos(pos)
+        except pygame.error:
+            # older mixers can't position wav and aiff, those are streamed again from the offset
+            if not PROGRESSIVE.seek(self.music, pos) and not SEEK_STREAMS.play(
+                self.music.audiopath, pos
+            ):
+                self.music.pos_supported = False
+                return
+            if self.music_paused:
+                pygame.mixer.music.pause()
+            self.music_controls.queue_next()
+        self.music_play_time = pygame.time.get_ticks()
+        self.music_play_offset = pos
+
+    def reload_music(self):
+        # playback goes on from the same position, what the mixer had queued is dropped
+        if not self.music.pos_supported:
+            return
+        pos = self.get_music_pos()
+        if PROGRESSIVE.music is self.music:
+            if not PROGRESSIVE.seek(self.music, pos):
+                return
+        else:
+            try:
+                pygame.mixer.music.load(self.music.audiopath)
+                pygame.mixer.music.play(0, pos)
+                SEEK_STREAMS.close()
+            except pygame.error:
+                if not SEEK_STREAMS.play(self.music.audiopath, pos):
+                    self.music.pos_supported = False
+                    return
+        if self.music_paused:
+            pygame.mixer.music.pause()
         self.music_play_time = pygame.time.get_ticks()
         self.music_play_offset = pos
-        pygame.mixer.music.set_pos(pos)
 
     def add_to_history(self):
         pos = self.get_music_pos()
         data = HistoryData(self.music, pos, self.music.duration)
         for olddata in self.history_data.copy():
-            if olddata.music is self.music:
+            if olddata.refers_to(self.music):
                 self.history_data.remove(olddata)
         self.history_data.append(data)
         if len(self.history_data) > HISTORY_LEN:
@@ -389,13 +480,49 @@ class MILIMP(mili.GenericApp):
 
     def remove_from_history(self, music: MusicData):
         for olddata in self.history_data.copy():
-            if olddata.music is music:
+            if olddata.refers_to(music):
                 self.history_data.remove(olddata)
 
-    def play_music(self, music: MusicData, idx):
-        if music.pending:
+    def sync_linked_folders(self):
+        for playlist, (change, *paths) in FOLDER_WATCHER.poll():
+            if change == "add":
+                playlist.sync_add(*paths)
+                continue
+            if change == "remove":
+                music = playlist.sync_remove(*paths)
+            else:
+                music = playlist.sync_rename(*paths)
+            if music is None:
+                continue
+            if music.pending:
+                CONVERSION_QUEUE.cancel(music)
+            if music is self.music:
+                self.end_music()
+            if music is self.menu_data:
+                self.close_menu()
+            self.remove_from_history(music)
+
+    def update_progressive(self):
+        state = PROGRESSIVE.update()
+        if state == "started":
+            self.music_play_time = pygame.time.get_ticks()
+            if self.music_paused:
+                pygame.mixer.music.pause()
+            self.music_controls.queue_next()
+        elif state == "converted":
+            self.play_music(self.music, self.music_index)
+        elif state == "failed":
+            self.end_music()
+
+    def play_music(self, music: MusicData, idx, queued=False):
+        # a converting track plays from the preview its conversion writes along the mp3
+        if not music.pending:
+            PROGRESSIVE.stop()
+        elif not PROGRESSIVE.start(music):
+            CONVERSION_QUEUE.promote(music)
             self.end_music()
             return
+        progressive = PROGRESSIVE.music is music
         if self.music_controls.async_videoclip is not None:
             self.music_controls.async_videoclip.alive = False
             if self.videoclip_threaded:
@@ -404,7 +531,15 @@ class MILIMP(mili.GenericApp):
 
         if self.music is not None:
             self.add_to_history()
-        if not os.path.exists(music.audiopath):
+        if not progressive and not os.path.exists(music.audiopath):
+            if music.audiopath != music.realpath and os.path.exists(music.realpath):
+                # the converted artifact was deleted externally, convert it again
+                MEDIA_INDEX.set_artifact(music.audiopath, False)
+                playlist = music.playlist
+                list_idx = playlist.musiclist.index(music)
+                playlist.remove(music.audiopath)
+                playlist.load_music(music.realpath, ICONS.loading, list_idx)
+                return
             music.playlist.remove(music.audiopath)
             pygame.display.message_box(
                 "Failed playing music",
@@ -417,10 +552,11 @@ class MILIMP(mili.GenericApp):
         self.music = music
         self.music_paused = False
         self.music_index = idx
+        music.playlist.shuffle_bag.start(music)
         self.music_start_time = time.time()
         self.music_play_offset = 0
         if self.music.duration is NotCached:
-            self.music.cache_duration()
+            DURATION_PROBER.request(self.music, PROBE_URGENT)
 
         if self.music.isvideo:
             self.music_controls.async_videoclip = AsyncVideoclipGetter(
@@ -440,13 +576,20 @@ class MILIMP(mili.GenericApp):
         self.music_controls.music_videoclip_cover = None
         self.music_controls.last_videoclip_cover = None
 
-        pygame.mixer.music.load(self.music.audiopath)
-        pygame.mixer.music.play(0)
+        if progressive:
+            # silent until the preview has its first seconds, unloading posts no end event
+            pygame.mixer.music.unload()
+        elif not queued:
+            # a queued track is already playing, the mixer switched to it on its own
+            pygame.mixer.music.load(self.music.audiopath)
+            pygame.mixer.music.play(0)
+        SEEK_STREAMS.close()
         pygame.mixer.music.set_endevent(MUSIC_ENDEVENT)
         pygame.mixer.music.set_volume(self.volume)
 
         self.music_play_time = pygame.time.get_ticks()
         self.discord_presence.update()
+        self.music_controls.queue_next()
 
     def end_music(self):
         if self.music_controls.async_videoclip is not None:
@@ -461,8 +604,11 @@ class MILIMP(mili.GenericApp):
         self.music = None
         self.music_paused = False
         self.bg_effect = False
+        self.music_controls.queued = None
         pygame.mixer.music.stop()
         pygame.mixer.music.unload()
+        SEEK_STREAMS.close()
+        PROGRESSIVE.stop()
         if self.music_controls.minip.window is not None:
             self.music_controls.minip.close()
         if self.music_videoclip is not None:
@@ -474,23 +620,16 @@ class MILIMP(mili.GenericApp):
     def save(self):
         if self.music is not None:
             self.add_to_history()
-        playlist_data = [
-            {
-                "name": p.name,
-                "paths": [
-                    [str(m.realpath), "converted"] if m.converted else str(m.realpath)
-                    for m in p.musiclist
-                ],
-                "groups": [group.get_save_data() for group in p.groups],
-            }
-            for p in self.playlists
-        ]
+        playlist_data = [p.get_save_data() for p in self.playlists]
         history_data = [history.get_save_data() for history in self.history_data]
-        write_json("data/playlists.json", playlist_data)
-        write_json("data/history.json", history_data)
+        PERSISTENCE.save_json("data/playlists.json", playlist_data)
+        PERSISTENCE.save_json("data/history.json", history_data)
+        if self.library_snapshot:
+            # queued after the json stores, the snapshot records which json it mirrors
+            PERSISTENCE.submit(write_snapshot, playlist_data, history_data)
         minip = self.music_controls.minip
         minip.save_state()
-        write_json(
+        PERSISTENCE.save_json(
             "data/settings.json",
             {
                 "volume": self.volume,
@@ -506,6 +645,14 @@ class MILIMP(mili.GenericApp):
                 "strip_youtube_id": self.strip_youtube_id,
                 "taskbar_height": self.taskbar_height,
                 "videoclip_threaded": self.videoclip_threaded,
+                "lazy_playlists": self.lazy_playlists,
+                "library_snapshot": self.library_snapshot,
+                "gapless": self.gapless,
+                "convert_workers": CONVERSION_QUEUE.max_workers,
+                "convert_backend": CONVERSION_QUEUE.backend,
+                "profile_startup": PROFILER.setting,
+                "health_check_days": self.health_check_days,
+                "health_check_last": self.health_check_last,
                 "yt_search": self.yt_search.search_entryline.text,
                 "yt_fetch_amount": self.yt_search.fetch_amount,
                 "yt_search_method": self.yt_search.search_method,
@@ -513,29 +660,25 @@ class MILIMP(mili.GenericApp):
                 "keybinds": self.keybinds.get_save_data(),
             },
         )
-        for playlist in self.playlists:
-            if playlist.cover is not None:
-                if not os.path.exists(f"data/covers/{playlist.name}.png"):
-                    pygame.image.save(
-                        playlist.cover, f"data/covers/{playlist.name}.png"
-                    )
+        PERSISTENCE.submit(
+            save_missing_covers,
+            [
+                (playlist.cover, f"data/covers/{playlist.name}.png")
+                for playlist in self.playlists
+                if playlist.cover is not None
+            ],
+        )
         if len(self.yt_search.video_results) > 0:
-            write_json(
+            PERSISTENCE.save_json(
                 "data/search_results.json",
                 [video.save() for video in self.yt_search.video_results],
             )
-        if os.path.exists("data/yt_temp"):
-            thumbs = set([video.thumbnail for video in self.yt_search.video_results])
-            channels = set([video.channel_id for video in self.yt_search.video_results])
-            for file in os.listdir("data/yt_temp"):
-                name = file.removesuffix(".png").removesuffix(".jpg")
-                if name.startswith("channel_"):
-                    if name.removeprefix("channel_") not in channels:
-                        os.remove(f"data/yt_temp/{file}")
-                else:
-                    if name not in thumbs:
-                        os.remove(f"data/yt_temp/{file}")
-        print("Data saved correctly")
+        PERSISTENCE.submit(
+            clean_yt_temp,
+            set([video.thumbnail for video in self.yt_search.video_results]),
+            set([video.channel_id for video in self.yt_search.video_results]),
+        )
+        PERSISTENCE.submit(MEDIA_INDEX.flush)
 
     def update(self):
         self.window.title = f"MILIMP (FPS: {self.clock.get_fps():.0f})"
@@ -543,14 +686,19 @@ class MILIMP(mili.GenericApp):
             self.last_save = pygame.time.get_ticks()
             self.save()
 
-        if self.startup_covers_toload is not None:
-            llen = len(self.startup_covers_toload)
-            if llen > 0:
-                for i in range(min(10, llen)):
-                    obj, path = self.startup_covers_toload.pop()
-                    obj.load_cover_async(path, ICONS.loading)
-            else:
-                self.startup_covers_toload = None
+        PROFILER.frame()
+        DEFERRED_IMPORTS.frame()
+        CONVERSION_QUEUE.poll()
+        self.update_progressive()
+        COVER_LOADER.update()
+        DURATION_PROBER.update()
+        INGEST.update()
+        self.sync_linked_folders()
+        LOAD_ERRORS.update()
+        if LOAD_ERRORS.unseen and self.modal_state == "none":
+            # one report for every failure so far, instead of a dialog per track
+            LOAD_ERRORS.unseen = False
+            self.modal_state = "load_errors"
 
         self.target_framerate = self.user_framerate
         if (
@@ -677,6 +825,8 @@ class MILIMP(mili.GenericApp):
                 self.history.ui()
             elif self.modal_state == "keybinds":
                 self.edit_keybinds.ui()
+            elif self.modal_state == "load_errors":
+                self.load_errors.ui()
 
             if not self.split_screen:
                 self.mili.id_checkpoint(5000)
@@ -1011,6 +1161,9 @@ class MILIMP(mili.GenericApp):
         elif self.modal_state == "fullscreen":
             if self.music_fullscreen.event(event):
                 return
+        elif self.modal_state == "load_errors":
+            if self.load_errors.event(event):
+                return
         if self.view_state == "list":
             self.list_viewer.event(event)
         elif self.view_state == "playlist":
@@ -1057,24 +1210,32 @@ class MILIMP(mili.GenericApp):
             self.music_controls.async_videoclip.alive = False
             if self.videoclip_threaded:
                 self.music_controls.async_videoclip.thread.join()
-        for playlist in self.playlists:
-            for music in playlist.musiclist:
-                if music.pending:
-                    btn = pygame.display.message_box(
-                        "Wait before closing",
-                        "Some tracks are still being converted. Please wait until they are converted "
-                        "before closing the application, otherwise the files will be corrupted.",
-                        "warn",
-                        None,
-                        ("Understood", "Close Anyways"),
-                    )
-                    if btn == 0:
-                        return
+        if any(
+            music.pending
+            for playlist in self.playlists
+            if playlist.loaded
+            for music in playlist.musiclist
+        ):
+            btn = pygame.display.message_box(
+                "Wait before closing",
+                "Some tracks are still being converted. Please wait until they are converted "
+                "before closing the application, otherwise the unfinished conversions will be cancelled.",
+                "warn",
+                None,
+                ("Understood", "Close Anyways"),
+            )
+            if btn == 0:
+                return
         self.save()
+        CONVERSION_QUEUE.shutdown()
+        PERSISTENCE.drain()
+        MEDIA_INDEX.close()
+        PROFILER.finish()
         print("Application quit")
         pygame.quit()
         raise SystemExit
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     MILIMP().run()
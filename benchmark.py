@@ -0,0 +1,567 @@
+import array
+import itertools
+import math
+import os
+import pathlib
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import wave
+
+IMPORT_BUDGET = 0.4
+DEFERRED_MODULES = [
+    "numpy",
+    "proglog",
+    "moviepy",
+    "webview",
+    "youtubesearchpython",
+    "urllib.request",
+    "tkinter.filedialog",
+]
+IMPORT_SCRIPT = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    "import MILIMP\n"
+    "loaded = [name for name in {modules} if name in sys.modules]\n"
+    "print(time.perf_counter() - start, *loaded)\n"
+)
+
+
+def benchmark_import_time():
+    # a fresh interpreter is needed, anything imported before would make the check meaningless
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT.format(modules=DEFERRED_MODULES)],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    if result.returncode != 0:
+        print(result.stderr)
+        return False
+    # the app prints its own banners while importing, the measurement is the last line
+    elapsed, *loaded = result.stdout.strip().splitlines()[-1].split()
+    elapsed = float(elapsed)
+    print(
+        f"import MILIMP: {elapsed * 1000:.1f} ms (budget {IMPORT_BUDGET * 1000:.0f} ms)"
+    )
+    if loaded:
+        print(f"  imported at startup but should be deferred: {', '.join(loaded)}")
+    return elapsed <= IMPORT_BUDGET and not loaded
+
+
+LIBRARY_PLAYLISTS = 40
+LIBRARY_TRACKS = 50000
+LIBRARY_FOLDER_SIZE = 12
+LIBRARY_REPEATS = 5
+
+
+def make_library():
+    # albums of a dozen tracks, a few of them videos that were converted
+    playlists = []
+    per_playlist = LIBRARY_TRACKS // LIBRARY_PLAYLISTS
+    for p in range(LIBRARY_PLAYLISTS):
+        paths = []
+        for t in range(per_playlist):
+            folder = f"/mnt/music/Artist {p}/Album {t // LIBRARY_FOLDER_SIZE}"
+            if t % 10 == 0:
+                paths.append([f"{folder}/{t:02} Track {t}.mp4", "converted"])
+            else:
+                paths.append(f"{folder}/{t:02} Track {t}.mp3")
+        playlists.append(
+            {
+                "name": f"Playlist {p}",
+                "paths": paths,
+                "groups": [],
+                "folder": None,
+                "shuffle": None,
+            }
+        )
+    history = [
+        {
+            "audiopath": playlists[0]["paths"][i * 10 + 1],
+            "position": i * 1.5,
+            "playlist": playlists[0]["name"],
+            "duration": 180.0,
+        }
+        for i in range(100)
+    ]
+    return playlists, history
+
+
+def measure(function, *args):
+    # tracing slows python loops far more than c parsers, time and memory are measured apart
+    elapsed = math.inf
+    for _ in range(LIBRARY_REPEATS):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    tracemalloc.start()
+    function(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def load_parsed_json(load_library):
+    # what startup used to do, every saved path became a path object before anything was shown
+    playlists, history = load_library(False)
+    for pdata in playlists:
+        pdata["paths"] = [
+            pathlib.Path(path)
+            if isinstance(path, str)
+            else [pathlib.Path(path[0]), path[1]]
+            for path in pdata["paths"]
+        ]
+    return playlists, history
+
+
+def benchmark_library_load():
+    from ui.common import library_snapshot
+    from ui.common.persistence import PERSISTENCE
+
+    playlists, history = make_library()
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as folder:
+        # the stores are relative to the data folder, like in the app
+        os.chdir(folder)
+        try:
+            os.mkdir("data")
+            PERSISTENCE.save_json(library_snapshot.PLAYLISTS_PATH, playlists)
+            PERSISTENCE.save_json(library_snapshot.HISTORY_PATH, history)
+            PERSISTENCE.submit(library_snapshot.write_snapshot, playlists, history)
+            PERSISTENCE.drain()
+            results = [
+                (name, *measure(function, *args))
+                for name, function, args in [
+                    (
+                        "json, parsed up front",
+                        load_parsed_json,
+                        [library_snapshot.load_library],
+                    ),
+                    ("json", library_snapshot.load_library, [False]),
+                    ("snapshot", library_snapshot.load_library, [True]),
+                ]
+            ]
+            sizes = {
+                "json": os.path.getsize(library_snapshot.PLAYLISTS_PATH),
+                "snapshot": os.path.getsize(library_snapshot.SNAPSHOT_PATH),
+            }
+        finally:
+            os.chdir(cwd)
+    for name, _, elapsed, peak in results:
+        print(
+            f"load {LIBRARY_TRACKS} tracks from {name}: {elapsed * 1000:.1f} ms, "
+            f"peak {peak / 1024**2:.1f} MB"
+        )
+    print(
+        f"  json {sizes['json'] / 1024:.0f} KB, snapshot {sizes['snapshot'] / 1024:.0f} KB"
+    )
+    (_, json_result, _, json_peak), (_, snapshot_result, _, snapshot_peak) = results[1:]
+    if snapshot_result != json_result:
+        print("  the snapshot doesn't load the same library as the json files")
+        return False
+    # the c json parser keeps up on a warm cache, the snapshot wins on bytes read and memory
+    return snapshot_peak <= json_peak and sizes["snapshot"] <= sizes["json"]
+
+
+def benchmark_music_footprint():
+    from ui.common import CONVERT_SUPPORTED, VIDEO_SUPPORTED, parse_music_stem
+    from ui.common.data import MusicData
+
+    playlists, _ = make_library()
+    paths = [
+        path[0] if isinstance(path, list) else path
+        for pdata in playlists
+        for path in pdata["paths"]
+    ]
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    musics = [MusicData.placeholder(pathlib.Path(path), None) for path in paths]
+    # loading hashes the path for the playlist tables, that is part of the footprint
+    for music in musics:
+        hash(music.realpath)
+    footprint = (tracemalloc.get_traced_memory()[0] - start) / len(musics)
+    tracemalloc.stop()
+
+    class App:
+        strip_youtube_id = True
+
+    app = App()
+    start = time.perf_counter()
+    for music in musics:
+        _ = music.display_stem(app), music.isvideo, music.isconvertible
+    cached = (time.perf_counter() - start) / len(musics)
+    start = time.perf_counter()
+    for music in musics:
+        # what every visible row used to pay on each frame
+        extension = music.realpath.suffix.lower()[1:]
+        parse_music_stem(music.realpath.stem, True)
+        _ = (
+            extension in VIDEO_SUPPORTED
+            and not music.realpath.stem.endswith("novideo"),
+            extension in CONVERT_SUPPORTED,
+        )
+    recomputed = (time.perf_counter() - start) / len(musics)
+    print(
+        f"{len(musics)} tracks: {footprint:.0f} bytes per track with its path, "
+        f"{sys.getsizeof(musics[0])} bytes per instance"
+    )
+    print(
+        f"  row fields: {cached * 1e9:.0f} ns cached, {recomputed * 1e9:.0f} ns recomputed"
+    )
+    return cached < recomputed
+
+
+GAP_TRACKS = 10
+GAP_TRACK_LENGTH = 0.4
+GAP_FREQUENCY = 44100
+GAP_BUFFER = 512
+GAP_SCRIPT = (
+    "import sys, benchmark\nbenchmark.play_through_app(sys.argv[1], sys.argv[2:])\n"
+)
+
+
+def play_through_app(mode, tracks):
+    import pygame
+
+    pygame.init()
+    pygame.mixer.init(GAP_FREQUENCY, -16, 1, GAP_BUFFER)
+    print(*pygame.mixer.get_init())
+    from MILIMP import MILIMP
+    from ui.common import MUSIC_ENDEVENT
+    from ui.common.data import Playlist
+    from ui.music_controls import MusicControlsUI
+
+    class Stub:
+        def update(self, *args): ...
+
+        set_scroll_to_music = update
+
+    class GapApp:
+        # only what play_music and the end of track handling touch, the interface isn't built
+        play_music = MILIMP.play_music
+        gapless = mode == "queue"
+        music_loops = shuffle = loops = videoclip_threaded = False
+        volume = 1
+
+        def __init__(self):
+            self.music = None
+            self.music_index = 0
+            self.discord_presence = self.playlist_viewer = Stub()
+            self.music_controls = object.__new__(MusicControlsUI)
+            self.music_controls.app = self
+            self.music_controls.queued = None
+            self.music_controls.async_videoclip = None
+
+        def add_to_history(self): ...
+
+        def end_music(self):
+            self.music = None
+
+    playlist = Playlist("gap", [])
+    for track in tracks:
+        playlist.add_placeholder(pathlib.Path(track)).pending = False
+    app = GapApp()
+    app.play_music(playlist.play_order[0], 0)
+    clock = pygame.time.Clock()
+    while app.music is not None and pygame.time.get_ticks() < 10000:
+        for event in pygame.event.get(MUSIC_ENDEVENT):
+            app.music_controls.event(event)
+        clock.tick(60)
+    pygame.mixer.quit()
+
+
+def write_tone(path):
+    with wave.open(path, "wb") as file:
+        file.setnchannels(1)
+        file.setsampwidth(2)
+        file.setframerate(GAP_FREQUENCY)
+        file.writeframes(
+            array.array("h", [4000] * int(GAP_FREQUENCY * GAP_TRACK_LENGTH)).tobytes()
+        )
+
+
+def silent_runs(samples):
+    # the tracks never go quiet, every silence between the first and last sample is a gap
+    sound = [i for i, sample in enumerate(samples) if sample != 0]
+    runs = []
+    for previous, current in itertools.pairwise(sound):
+        if current - previous > 1:
+            runs.append(current - previous - 1)
+    return runs
+
+
+def measure_gaps(folder, mode, tracks):
+    output = os.path.join(folder, f"{mode}.raw")
+    # the disk driver writes what would reach the speakers, at the speed it would reach them
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            GAP_SCRIPT,
+            mode,
+            *tracks,
+        ],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=os.environ
+        | {
+            "SDL_AUDIODRIVER": "disk",
+            "SDL_DISKAUDIOFILE": output,
+            "SDL_VIDEODRIVER": "dummy",
+            "PYGAME_HIDE_SUPPORT_PROMPT": "1",
+        },
+        check=False,
+    )
+    if result.returncode != 0:
+        print(result.stderr)
+        return None
+    frequency, _, channels = map(int, result.stdout.split()[:3])
+    samples = array.array("h")
+    with open(output, "rb") as file:
+        samples.frombytes(file.read())
+    if sys.byteorder == "big":
+        samples.byteswap()
+    runs = silent_runs(samples[::channels])
+    if len(runs) > GAP_TRACKS - 1:
+        print(f"  {mode}: {len(runs)} gaps for {GAP_TRACKS} tracks, a track stuttered")
+    return [run / frequency for run in runs]
+
+
+def benchmark_track_gap():
+    with tempfile.TemporaryDirectory() as folder:
+        tracks = [os.path.join(folder, f"track {i}.wav") for i in range(GAP_TRACKS)]
+        for track in tracks:
+            write_tone(track)
+        # the app with gapless off loads on the end event like before, on it queues the next track
+        gaps = {mode: measure_gaps(folder, mode, tracks) for mode in ["load", "queue"]}
+    if None in gaps.values():
+        return False
+    for mode, mode_gaps in gaps.items():
+        print(
+            f"{mode} on track end: {sum(mode_gaps) / (GAP_TRACKS - 1) * 1000:.1f} ms average gap, "
+            f"{max(mode_gaps, default=0) * 1000:.1f} ms longest"
+        )
+    # a queued track starts with the next mixer buffer, the rest of the last one is all that's left
+    longest = max(gaps["queue"], default=0)
+    return longest <= GAP_BUFFER / GAP_FREQUENCY and sum(gaps["queue"]) <= sum(
+        gaps["load"]
+    )
+
+
+ORDER_SIZES = [1000, 10000]
+ORDER_GROUPS = 50
+ORDER_SKIPS = 1000
+ORDER_SCALING = 3
+
+
+def make_grouped_playlist(size):
+    from ui.common.data import Playlist, PlaylistGroup
+
+    playlist = Playlist(f"{size} tracks", [])
+    for i in range(size):
+        playlist.add_placeholder(
+            pathlib.Path(
+                f"/mnt/music/Album {i // LIBRARY_FOLDER_SIZE}/{i:05} Track.mp3"
+            )
+        )
+    # every group takes an album out of the list and sits between the ungrouped tracks
+    musics = playlist.musiclist.copy()
+    step = size // ORDER_GROUPS
+    for g in range(ORDER_GROUPS):
+        group = PlaylistGroup(f"Group {g}", playlist, [], g * step // 2)
+        playlist.groups.append(group)
+        for music in musics[g * step : g * step + LIBRARY_FOLDER_SIZE]:
+            group.add(music)
+    return playlist
+
+
+def time_skips(playlist, rebuild):
+    musics = playlist.musiclist[:: len(playlist.musiclist) // ORDER_SKIPS]
+    start = time.perf_counter()
+    for music in musics:
+        if rebuild:
+            playlist.invalidate_order()
+        # what a skip asks for, the position of the current track and the track after it
+        idx = playlist.index_of(music)
+        playlist.play_order[(idx + 1) % len(playlist.play_order)]
+    return (time.perf_counter() - start) / len(musics)
+
+
+def benchmark_play_order():
+    costs = {}
+    for size in ORDER_SIZES:
+        playlist = make_grouped_playlist(size)
+        rebuilt = time_skips(playlist, True)
+        costs[size] = time_skips(playlist, False)
+        print(
+            f"skip in {size} tracks, {ORDER_GROUPS} groups: "
+            f"{costs[size] * 1e6:.2f} us cached, {rebuilt * 1e6:.0f} us rebuilt"
+        )
+    small, big = costs[ORDER_SIZES[0]], costs[ORDER_SIZES[-1]]
+    return big <= small * ORDER_SCALING
+
+
+SEEK_LENGTH = 3600
+SEEK_RATE = 44100
+SEEK_COUNT = 50
+SEEK_READ = 65536
+SEEK_BUDGET = 0.005
+SEEK_MEMORY_BUDGET = 1024 * 1024
+
+
+def write_long_wav(path):
+    # an hour of silence as a sparse file, the size is real but nothing is written
+    size = SEEK_LENGTH * SEEK_RATE * 4
+    with open(path, "wb") as file:
+        file.write(
+            struct.pack(
+                "<4sI4s4sIHHIIHH4sI",
+                b"RIFF",
+                36 + size,
+                b"WAVE",
+                b"fmt ",
+                16,
+                1,
+                2,
+                SEEK_RATE,
+                SEEK_RATE * 4,
+                4,
+                16,
+                b"data",
+                size,
+            )
+        )
+        file.truncate(44 + size)
+    return size
+
+
+def benchmark_seek_stream():
+    from ui.common.seek_stream import SEEK_STREAMS
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "long.wav")
+        size = write_long_wav(path)
+        positions = [SEEK_LENGTH * i / SEEK_COUNT for i in range(SEEK_COUNT)]
+        tracemalloc.start()
+        start = time.perf_counter()
+        for pos in positions:
+            # what the mixer does with a fresh stream, the header first and a buffer of samples
+            with SEEK_STREAMS.open(path, pos) as stream, wave.open(stream) as reader:
+                frames = reader.getnframes()
+                reader.readframes(SEEK_READ // 4)
+            if frames != int((SEEK_LENGTH - pos) * SEEK_RATE):
+                print(f"  the stream at {pos:.0f}s has {frames} frames")
+                return False
+        elapsed = (time.perf_counter() - start) / SEEK_COUNT
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    print(
+        f"seek in a {size / 1024**2:.0f} MB wav: {elapsed * 1000:.2f} ms per seek, "
+        f"{peak / 1024:.0f} KB peak"
+    )
+    return elapsed <= SEEK_BUDGET and peak <= SEEK_MEMORY_BUDGET
+
+
+PREVIEW_LENGTH = 60
+PREVIEW_BUDGET = 1
+
+
+def write_source(path, frames):
+    with wave.open(path, "wb") as file:
+        file.setnchannels(2)
+        file.setsampwidth(2)
+        file.setframerate(SEEK_RATE)
+        file.writeframes(frames.tobytes())
+
+
+def read_frames(file):
+    with wave.open(file) as reader:
+        # mixer sized reads, the ones past the written end wait for the converter
+        return b"".join(iter(lambda: reader.readframes(SEEK_READ // 4), b""))
+
+
+def benchmark_progressive_playback():
+    import pygame
+
+    from ui.common.conversion import CONVERSION_QUEUE
+    from ui.common.data import Playlist, open_audioclip
+    from ui.common.media_handles import MEDIA_HANDLES
+    from ui.common.progressive import PROGRESSIVE
+    from ui.common.seek_stream import SEEK_STREAMS
+
+    frames = array.array("h", range(-16384, 16384)) * (
+        PREVIEW_LENGTH * SEEK_RATE * 2 // 32768
+    )
+    # the preview is played for real, into a device that discards it
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    pygame.mixer.init(SEEK_RATE, -16, 2)
+    CONVERSION_QUEUE.set_backend("thread")
+    with tempfile.TemporaryDirectory() as folder:
+        source = os.path.join(folder, "track.wav")
+        write_source(source, frames)
+        music = Playlist("progressive", []).add_placeholder(pathlib.Path(source))
+        clip = MEDIA_HANDLES.open(open_audioclip, source)
+        start = time.perf_counter()
+        CONVERSION_QUEUE.submit(music, clip, os.path.join(folder, "track.mp3"))
+        PROGRESSIVE.start(music)
+        # what the frame loop does, the track starts once the preview has its first seconds
+        while (state := PROGRESSIVE.update()) is None:
+            time.sleep(0.001)
+        first_audio = time.perf_counter() - start
+        if state != "started":
+            print(f"  the preview didn't start playing: '{state}'")
+            return False
+        with SEEK_STREAMS.open(PROGRESSIVE.path, 0, PROGRESSIVE.growing()) as stream:
+            played = read_frames(stream)
+        while music.pending and music.load_exc is None:
+            time.sleep(0.001)
+        converted = time.perf_counter() - start
+        with open(PROGRESSIVE.path, "rb") as file:
+            written = read_frames(file)
+        pygame.mixer.music.unload()
+        SEEK_STREAMS.close()
+        PROGRESSIVE.stop()
+        PROGRESSIVE.update()
+        clip.close()
+    pygame.mixer.quit()
+    print(
+        f"{PREVIEW_LENGTH}s track converting: first audio after "
+        f"{first_audio * 1000:.0f} ms, mp3 done after {converted * 1000:.0f} ms"
+    )
+    if music.load_exc is not None:
+        print(f"  the conversion failed: '{music.load_exc}'")
+        return False
+    if played != written:
+        print("  the stream didn't give back what the converter wrote")
+        return False
+    return first_audio <= PREVIEW_BUDGET and first_audio < converted
+
+
+BENCHMARKS = {
+    "import": benchmark_import_time,
+    "library": benchmark_library_load,
+    "music": benchmark_music_footprint,
+    "gap": benchmark_track_gap,
+    "order": benchmark_play_order,
+    "seek": benchmark_seek_stream,
+    "progressive": benchmark_progressive_playback,
+}
+
+
+def main(names):
+    failed = []
+    for name in names or BENCHMARKS.keys():
+        if not BENCHMARKS[name]():
+            failed.append(name)
+    if failed:
+        print(f"Failed: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,135 +1,150 @@
 import os
 import sys
 import json
+import time
+import hashlib
 import pathlib
-
-
-class Playlist:
-    def __init__(self, name, filepaths):
-        self.name = name
-        self.filepaths = [
-            pathlib.Path(p) if isinstance(p, str) else [pathlib.Path(p[0]), p[1]]
-            for p in filepaths
-        ]
-        self.mp3_paths = []
-        self.cover_path = f"{self.name}.png"
-        self.cover_paths = []
-
-        for path in self.filepaths:
-            if isinstance(path, list):
-                path = path[0]
-                mp3_path = f"{self.name}_{path.stem}.mp3"
-                self.mp3_paths.append(mp3_path)
-            if path.suffix[1:].lower() in [
-                "mp4",
-                "webm",
-                "avi",
-                "mkv",
-                "mov",
-                "flv",
-                "wmv",
-                "m4v",
-                "3gp",
-                "mpeg",
-                "mpg",
-                "ogv",
-                "mts",
-                "ts",
-                "aac",
-                "m4a",
-                "wma",
-                "alac",
-                "amr",
-                "au",
-                "snd",
-                "mpc",
-                "tta",
-                "caf",
-            ]:
-                mp3_path = f"{self.name}_{path.stem}.mp3"
-                self.mp3_paths.append(mp3_path)
-            cover_path = f"{self.name}_{path.stem}.png"
-            self.cover_paths.append(cover_path)
-
-
-def check_iterate(playlists: list[Playlist], path, mode):
-    for playlist in playlists:
-        if mode == "cover":
-            if playlist.cover_path == path:
-                return True
-        elif mode == "mp3":
-            if path in playlist.mp3_paths:
-                return True
-        elif mode == "covers":
-            if path in playlist.cover_paths:
-                return True
-    return False
-
-
-def main():
-    do_remove = len(sys.argv) > 1 and sys.argv[1] == "--remove"
-
-    data = []
-    if os.path.exists("data/playlists.json"):
-        with open("data/playlists.json", "r") as file:
-            data = json.load(file)
-
-    playlists = [Playlist(pdata["name"], pdata["paths"]) for pdata in data]
-
-    anyf1 = False
-    if os.path.exists("data/covers"):
-        for file in os.listdir("data/covers"):
-            if not check_iterate(playlists, file, "cover"):
-                path = f"data/covers/{file}"
-                if do_remove:
-                    print(f"Removing unused playlist cover: '{path}'")
-                    os.remove(path)
-                else:
-                    print(f"Found unused playlist cover: '{path}'")
-                anyf1 = True
-
-    anyf2 = False
-    if os.path.exists("data/music_covers"):
-        for file in os.listdir("data/music_covers"):
-            if not check_iterate(playlists, file, "covers"):
-                path = f"data/music_covers/{file}"
-                if do_remove:
-                    print(f"Removing unused music cover: '{path}'")
-                    os.remove(path)
-                else:
-                    print(f"Found unused music cover: '{path}'")
-                anyf2 = True
-
-    anyf3 = False
-    if os.path.exists("data/mp3_converted"):
-        for file in os.listdir("data/mp3_converted"):
-            if not check_iterate(playlists, file, "mp3"):
-                path = f"data/mp3_converted/{file}"
-                if do_remove:
-                    print(f"Removing unused MP3 file: '{path}'")
-                    os.remove(path)
-                else:
-                    print(f"Found unused MP3 file: '{path}'")
-                anyf3 = True
-
-    if not anyf1 and not anyf2 and not anyf3:
-        print("No unused files found")
-    else:
-        if not anyf1:
-            print("No unused playlist covers found")
-        if not anyf2:
-            print("No unused music covers found")
-        if not anyf3:
-            print("No unused MP3 files found")
-
-    if anyf1 or anyf2 or anyf3:
-        if do_remove:
-            return
+from ui.common import VIDEO_SUPPORTED, CONVERT_SUPPORTED
+from ui.common.thumbnails import cover_paths
+from ui.common.media_index import MEDIA_INDEX
+from ui.common.persistence import write_atomic
+
+CATEGORIES = [
+    ("playlist cover", "data/covers"),
+    ("music cover", "data/music_covers"),
+    ("MP3 file", "data/mp3_converted"),
+]
+REPORT_PATH = "data/health_check.json"
+MEDIA_INDEX_PATH = "data/media_index.db"
+DIGEST_LENGTH = 32
+HEX_DIGITS = frozenset("0123456789abcdef")
+
+
+def is_digest_name(name):
+    # covers keep their digest before the thumbnail variant, '<digest>@row.png'
+    stem = name.split(".")[0].split("@")[0]
+    return len(stem) == DIGEST_LENGTH and set(stem) <= HEX_DIGITS
+
+
+def referenced_names(playlists_data):
+    # one set per folder replaces scanning every playlist for every file
+    referenced = {folder: set() for _, folder in CATEGORIES}
+    needs_mp3 = set(VIDEO_SUPPORTED) | set(CONVERT_SUPPORTED)
+    unresolved = False
+    for pdata in playlists_data:
+        name = pdata["name"]
+        referenced["data/covers"].add(f"{name}.png")
+        for path in pdata["paths"]:
+            converted = isinstance(path, list)
+            path = pathlib.Path(path[0] if converted else path)
+            # tracks that were never loaded since the switch to digests still use the legacy names
+            stems = [f"{name}_{path.stem}"]
+            digest = MEDIA_INDEX.cached_digest(path)
+            if digest is not None:
+                stems.append(digest)
+            else:
+                unresolved = True
+            for stem in stems:
+                if converted or path.suffix[1:].lower() in needs_mp3:
+                    referenced["data/mp3_converted"].add(f"{stem}.mp3")
+                referenced["data/music_covers"].update(cover_paths(f"{stem}.png"))
+    return referenced, unresolved
+
+
+def get_fingerprint(referenced):
+    # adding or removing files changes the folder mtime, editing playlists changes the names
+    digest = hashlib.blake2b(digest_size=16)
+    for _, folder in CATEGORIES:
+        digest.update(folder.encode())
+        if os.path.exists(folder):
+            digest.update(str(os.stat(folder).st_mtime_ns).encode())
+        for name in sorted(referenced[folder]):
+            digest.update(name.encode())
+    return digest.hexdigest()
+
+
+def collect(referenced, unresolved, remove=False):
+    report = {}
+    for category, folder in CATEGORIES:
+        unused = []
+        reclaimable = 0
+        if os.path.exists(folder):
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if not entry.is_file() or entry.name in referenced[folder]:
+                        continue
+                    # without the digest of every track, any digest named file may still be in use
+                    if not unresolved or not is_digest_name(entry.name):
+                        unused.append(entry.path.replace("\\", "/"))
+                        reclaimable += entry.stat().st_size
+        for path in unused:
+            if remove:
+                print(f"Removing unused {category}: '{path}'")
+                os.remove(path)
+            else:
+                print(f"Found unused {category}: '{path}'")
+        report[category] = {"files": len(unused), "bytes": reclaimable}
+    return report
+
+
+def load_report():
+    if os.path.exists(REPORT_PATH):
+        try:
+            with open(REPORT_PATH, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            ...
+    return {}
+
+
+def print_summary(unused, removed):
+    for category, result in unused.items():
+        if result["files"] == 0:
+            print(f"No unused {category}s found")
+        else:
+            action = "Reclaimed" if removed else "Reclaimable"
+            print(
+                f"{action} {result['bytes'] / 1024 / 1024:.2f} MiB "
+                f"from {result['files']} unused {category}s"
+            )
+    if not removed and any(result["files"] > 0 for result in unused.values()):
         print()
         print(
             "Run health_check.py with the --remove cli argument to automatically delete the unused files"
         )
 
 
+def main(playlists_data=None, remove=False):
+    if playlists_data is None:
+        playlists_data = []
+        if os.path.exists("data/playlists.json"):
+            with open("data/playlists.json", "r") as file:
+                playlists_data = json.load(file)
+
+    if MEDIA_INDEX.connection is None and os.path.exists(MEDIA_INDEX_PATH):
+        MEDIA_INDEX.open(MEDIA_INDEX_PATH)
+    referenced, unresolved = referenced_names(playlists_data)
+    fingerprint = get_fingerprint(referenced)
+    report = load_report()
+    if not remove and report.get("fingerprint", None) == fingerprint:
+        print("No changes since the last health check")
+        print_summary(report["unused"], False)
+        return report
+
+    unused = collect(referenced, unresolved, remove)
+    if unresolved:
+        print(
+            "Some tracks aren't in the media index yet, files named after a digest were kept"
+        )
+    print_summary(unused, remove)
+    if remove:
+        # the removal itself changed the folders, which are clean from now on
+        fingerprint = get_fingerprint(referenced)
+        unused = {category: {"files": 0, "bytes": 0} for category in unused}
+    report = {"time": time.time(), "fingerprint": fingerprint, "unused": unused}
+    write_atomic(REPORT_PATH, json.dumps(report, indent=4))
+    return report
+
+
 if __name__ == "__main__":
-    main()
+    main(remove="--remove" in sys.argv[1:])
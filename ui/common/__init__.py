@@ -13,41 +13,45 @@ MINIP_PREFERRED_SIZES = 200, 200
 UI_SIZES = (480, 720)
 SURF = pygame.Surface((10, 10), pygame.SRCALPHA)
 USE_FAST_VIDEO = True
-VIDEO_SUPPORTED = [
-    "mp4",
-    "webm",
-    "avi",
-    "mkv",
-    "mov",
-    "flv",
-    "wmv",
-    "m4v",
-    "3gp",
-    "mpeg",
-    "mpg",
-    "ogv",
-    "mts",
-    "ts",
-]
-CONVERT_SUPPORTED = [
-    "aac",
-    "m4a",
-    "wma",
-    "alac",
-    "amr",
-    "au",
-    "snd",
-    "mpc",
-    "tta",
-    "caf",
-    "webm",
-]
+VIDEO_SUPPORTED = frozenset(
+    [
+        "mp4",
+        "webm",
+        "avi",
+        "mkv",
+        "mov",
+        "flv",
+        "wmv",
+        "m4v",
+        "3gp",
+        "mpeg",
+        "mpg",
+        "ogv",
+        "mts",
+        "ts",
+    ]
+)
+CONVERT_SUPPORTED = frozenset(
+    [
+        "aac",
+        "m4a",
+        "wma",
+        "alac",
+        "amr",
+        "au",
+        "snd",
+        "mpc",
+        "tta",
+        "caf",
+        "webm",
+    ]
+)
+# membership is checked per file and per track, the tables are sets
 FORMATS = (
     VIDEO_SUPPORTED
-    + CONVERT_SUPPORTED
-    + ["wav", "mp3", "ogg", "flac", "opus", "wv", "mod", "aiff"]
+    | CONVERT_SUPPORTED
+    | frozenset(["wav", "mp3", "ogg", "flac", "opus", "wv", "mod", "aiff"])
 )
-POS_UNSUPPORTED = ["wav", "opus", "wv", "aiff"]
 MUSIC_ENDEVENT = pygame.event.custom_type()
 HISTORY_LEN = 100
 RESIZE_SIZE = 3
@@ -56,6 +60,7 @@ DISCORD_COOLDOWN = 20000
 BIG_COVER_COOLDOWN = 300
 SAVE_COOLDOWN = 60000 * 2
 TOOLTIP_COOLDOWN = 1200
+INDETERMINATE_PERIOD = 1400
 SPLIT_SCREEN = 1.7
 RATIO_MIN = 0.52
 BG_CV = 3
@@ -152,10 +157,10 @@ def handle_wheel_scroll(
         scrollbar.scroll_moved()
 
 
-def parse_music_stem(app: "MILIMP", stem: str):
+def parse_music_stem(stem: str, strip_youtube_id=False):
     if stem.endswith("novideo"):
         stem = stem.removesuffix("novideo")
-    if app.strip_youtube_id:
+    if strip_youtube_id:
         if len(stem) >= 14:
             if stem.endswith("]") and stem[-13] == "[" and stem[-14] == " ":
                 return stem[:-14]
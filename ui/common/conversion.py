@@ -0,0 +1,496 @@
+import concurrent.futures
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import typing
+import wave
+
+import pygame
+
+from ui.common.media_index import MEDIA_INDEX
+from ui.common.thumbnails import cover_paths, save_thumbnails
+
+if typing.TYPE_CHECKING:
+    import moviepy
+    import numpy
+
+PRIORITY_USER = 0
+PRIORITY_NORMAL = 1
+PROGRESS_INTERVAL = 0.2
+PREVIEW_SUFFIX = ".preview.wav"
+PREVIEW_CHUNK = 2000
+PREVIEW_RATE = 44100
+
+CHILD_EVENTS = None
+CHILD_CANCELLED = None
+CHILD_PREVIEWS = None
+
+
+class ConversionCancelled(Exception): ...
+
+
+class ConversionRestarted(Exception): ...
+
+
+def init_child(events, cancelled, previews):
+    global CHILD_EVENTS, CHILD_CANCELLED, CHILD_PREVIEWS
+    CHILD_EVENTS = events
+    CHILD_CANCELLED = cancelled
+    CHILD_PREVIEWS = previews
+
+
+def preview_path(new_path):
+    return os.path.splitext(new_path)[0] + PREVIEW_SUFFIX
+
+
+def save_cover(clip: "moviepy.VideoClip", cover_path):
+    frame: numpy.ndarray = clip.get_frame(clip.duration / 2)
+    surface = pygame.image.frombytes(frame.tobytes(), clip.size, "RGB")
+    pygame.image.save(surface, cover_path)
+    return save_thumbnails(surface, cover_path)["row"]
+
+
+def remove_partial(path):
+    if path is not None and os.path.exists(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def write_preview(audiofile, new_path, preview, logger):
+    from moviepy.audio.io.ffmpeg_audiowriter import FFMPEG_AudioWriter
+
+    # one decode feeds both files, the wav can be played while the mp3 is still being encoded
+    fps = audiofile.fps or PREVIEW_RATE
+    writer = FFMPEG_AudioWriter(
+        new_path, fps, 2, audiofile.nchannels, codec="libmp3lame"
+    )
+    try:
+        with open(preview, "wb") as file, wave.open(file, "wb") as wav:
+            wav.setnchannels(audiofile.nchannels)
+            wav.setsampwidth(2)
+            wav.setframerate(fps)
+            # the header announces the whole track, the player waits for what isn't written yet
+            wav.setnframes(int(audiofile.duration * fps))
+            for chunk in audiofile.iter_chunks(
+                chunksize=PREVIEW_CHUNK, quantize=True, nbytes=2, fps=fps, logger=logger
+            ):
+                writer.write_frames(chunk)
+                wav.writeframesraw(chunk.tobytes())
+                file.flush()
+    finally:
+        writer.close()
+
+
+def write_audio(audiofile, new_path, make_logger, get_preview):
+    preview = get_preview()
+    while True:
+        try:
+            if preview is None:
+                audiofile.write_audiofile(new_path, logger=make_logger(preview))
+            else:
+                write_preview(audiofile, new_path, preview, make_logger(preview))
+            return
+        except ConversionRestarted:
+            # the track was played while converting, the audio starts over with a preview
+            preview = get_preview()
+
+
+def transcode_process(job_id, kind, source, new_path, cover_path):
+    import moviepy
+
+    from ui.common.conversion_loggers import ChildConversionLogger
+
+    def make_logger(preview):
+        return ChildConversionLogger(
+            job_id, CHILD_EVENTS, CHILD_CANCELLED, CHILD_PREVIEWS, preview
+        )
+
+    clip = None
+    cancelled = False
+    try:
+        if kind == "video":
+            clip = moviepy.VideoFileClip(source)
+            if cover_path is not None:
+                save_cover(clip, cover_path)
+                CHILD_EVENTS.put(("cover", job_id, cover_path))
+            if new_path is not None:
+                write_audio(
+                    clip.audio,
+                    new_path,
+                    make_logger,
+                    lambda: CHILD_PREVIEWS.get(job_id, None),
+                )
+        else:
+            clip = moviepy.AudioFileClip(source)
+            write_audio(
+                clip, new_path, make_logger, lambda: CHILD_PREVIEWS.get(job_id, None)
+            )
+        CHILD_EVENTS.put(("done", job_id, None))
+    except ConversionCancelled:
+        cancelled = True
+    except Exception as e:
+        CHILD_EVENTS.put(("error", job_id, str(e)))
+    finally:
+        if clip is not None:
+            clip.close()
+    if cancelled:
+        # the interrupted ffmpeg writer only exits once the traceback holding it is released
+        remove_partial(new_path)
+        CHILD_EVENTS.put(("cancelled", job_id, None))
+
+
+class ConversionJob:
+    def __init__(self, id_, music, clip, new_path, cover_path, priority, order):
+        self.id = id_
+        self.music = music
+        self.clip = clip
+        self.kind = "video" if music.isvideo else "audio"
+        self.source = str(music.realpath)
+        self.new_path = new_path
+        self.cover_path = cover_path
+        self.priority = priority
+        self.order = order
+        self.progress = 0
+        self.running = False
+        self.cancelled = False
+        self.preview_path = None
+        self.followers = []
+
+    @property
+    def sort_key(self):
+        return (self.priority, self.order)
+
+    @property
+    def musics(self):
+        return [self.music, *self.followers]
+
+
+class ConversionQueue:
+    def __init__(self):
+        self.queue = queue.PriorityQueue()
+        self.jobs: dict = {}
+        self.targets: dict[str, ConversionJob] = {}
+        self.process_jobs: dict[int, ConversionJob] = {}
+        self.workers: list[threading.Thread] = []
+        self.max_workers = os.cpu_count() or 1
+        self.backend = "process"
+        self.executor: concurrent.futures.ProcessPoolExecutor = None
+        self.manager = None
+        self.events = None
+        self.cancelled = None
+        self.previews = None
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+        self.positions = {}
+        self.positions_dirty = False
+
+    def set_workers(self, amount):
+        self.max_workers = max(1, int(amount))
+
+    def set_backend(self, backend):
+        if backend in ["process", "thread"]:
+            self.backend = backend
+
+    def start_processes(self):
+        # forked children would inherit the pipes of the open ffmpeg readers and keep them alive
+        context = multiprocessing.get_context("spawn")
+        try:
+            self.manager = context.Manager()
+            self.events = self.manager.Queue()
+            self.cancelled = self.manager.dict()
+            self.previews = self.manager.dict()
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                self.max_workers,
+                context,
+                init_child,
+                (self.events, self.cancelled, self.previews),
+            )
+        except (
+            OSError,
+            EOFError,
+            ImportError,
+            RuntimeError,
+            multiprocessing.ProcessError,
+        ):
+            # platforms without working process semaphores fall back to threads
+            self.backend = "thread"
+
+    def submit(self, music, clip, new_path, cover_path=None, priority=PRIORITY_NORMAL):
+        if self.backend == "process" and self.executor is None:
+            self.start_processes()
+        if self.backend == "process" and clip is not None:
+            # the workers open their own clip, keeping this one would hold an ffmpeg reader per track
+            clip.close()
+        with self.lock:
+            old_job = self.jobs.get(music, None)
+            if old_job is not None:
+                self.detach(old_job, music)
+            target = str(new_path if new_path is not None else cover_path)
+            shared = self.targets.get(target, None)
+            if (
+                shared is not None
+                and not shared.cancelled
+                and cover_path in [None, shared.cover_path]
+            ):
+                # the artifacts are named after the content, identical sources wait for one conversion
+                if self.backend != "process" and clip is not None:
+                    clip.close()
+                shared.followers.append(music)
+                self.jobs[music] = shared
+                self.positions_dirty = True
+                return shared
+            order = next(self.counter)
+            if priority == PRIORITY_USER:
+                order = -order
+            job = ConversionJob(
+                next(self.counter),
+                music,
+                clip,
+                None if new_path is None else str(new_path),
+                cover_path,
+                priority,
+                order,
+            )
+            self.jobs[music] = job
+            self.targets[target] = job
+            self.positions_dirty = True
+            self.queue.put((*job.sort_key, job))
+            self.workers = [worker for worker in self.workers if worker.is_alive()]
+            if len(self.workers) < self.max_workers:
+                worker = threading.Thread(target=self.worker_loop, daemon=True)
+                self.workers.append(worker)
+                worker.start()
+        return job
+
+    def promote(self, music):
+        with self.lock:
+            job = self.jobs.get(music, None)
+            if job is None or job.running or job.cancelled:
+                return
+            # the stale entry is skipped by the workers since its key doesn't match anymore
+            job.priority = PRIORITY_USER
+            job.order = -next(self.counter)
+            self.positions_dirty = True
+            self.queue.put((*job.sort_key, job))
+
+    def request_preview(self, music):
+        with self.lock:
+            job = self.jobs.get(music, None)
+            if job is None or job.cancelled or job.new_path is None:
+                return None
+            if job.preview_path is None:
+                job.preview_path = preview_path(job.new_path)
+                # a preview left over by a crash would be read before the writer truncates it
+                remove_partial(job.preview_path)
+                if self.previews is not None:
+                    self.previews[job.id] = job.preview_path
+            return job.preview_path
+
+    def is_previewing(self, music, path):
+        job = self.jobs.get(music, None)
+        return job is not None and job.preview_path == path
+
+    def detach(self, job: ConversionJob, music):
+        # the conversion keeps running as long as another track waits for it
+        if music is job.music and not job.followers:
+            job.cancelled = True
+            return False
+        if music is job.music:
+            job.music = job.followers.pop(0)
+        else:
+            job.followers.remove(music)
+        self.jobs.pop(music)
+        self.positions_dirty = True
+        return True
+
+    def cancel(self, music):
+        with self.lock:
+            job = self.jobs.get(music, None)
+            if job is None:
+                return
+            if self.detach(job, music):
+                music.load_exc = ConversionCancelled("Conversion cancelled")
+                return
+            if job.running:
+                if job.id in self.process_jobs:
+                    self.cancelled[job.id] = True
+            else:
+                self.jobs.pop(music)
+                self.positions_dirty = True
+                music.load_exc = ConversionCancelled("Conversion cancelled")
+
+    def cancel_playlist(self, playlist):
+        for music in list(self.jobs.keys()):
+            if music.playlist is playlist:
+                self.cancel(music)
+
+    def get_job(self, music) -> ConversionJob | None:
+        return self.jobs.get(music, None)
+
+    def position(self, music):
+        with self.lock:
+            if self.positions_dirty:
+                waiting = sorted(
+                    (job for job in self.jobs.values() if not job.running),
+                    key=lambda job: job.sort_key,
+                )
+                self.positions = {
+                    music: i + 1
+                    for i, job in enumerate(waiting)
+                    for music in job.musics
+                }
+                self.positions_dirty = False
+            return self.positions.get(music, None)
+
+    def worker_loop(self):
+        while True:
+            priority, order, job = self.queue.get()
+            if job is None:
+                return
+            with self.lock:
+                if (
+                    job.cancelled
+                    or job.running
+                    or (priority, order) != job.sort_key
+                    or self.jobs.get(job.music, None) is not job
+                ):
+                    continue
+                job.running = True
+                self.positions_dirty = True
+            if self.backend == "process":
+                self.run_process(job)
+            else:
+                self.run_thread(job)
+
+    def run_thread(self, job: ConversionJob):
+        from ui.common.conversion_loggers import ConversionLogger
+
+        try:
+            # the pool may have closed the clip while the job waited, it is reopened here
+            with job.clip.use() as clip:
+                if job.cover_path is not None:
+                    try:
+                        cover = save_cover(clip, job.cover_path)
+                        MEDIA_INDEX.set_artifact(job.cover_path, True)
+                    except Exception:
+                        cover = None
+                    for music in job.musics:
+                        music.cover = cover
+                if job.new_path is not None:
+                    write_audio(
+                        clip.audio if job.kind == "video" else clip,
+                        job.new_path,
+                        lambda preview: ConversionLogger(job, preview),
+                        lambda: job.preview_path,
+                    )
+        except Exception as e:
+            exc = e.with_traceback(None)
+        else:
+            self.finish(job)
+            return
+        if isinstance(exc, ConversionCancelled):
+            remove_partial(job.new_path)
+        self.fail(job, exc)
+
+    def run_process(self, job: ConversionJob):
+        with self.lock:
+            self.process_jobs[job.id] = job
+        try:
+            future = self.executor.submit(
+                transcode_process,
+                job.id,
+                job.kind,
+                job.source,
+                job.new_path,
+                job.cover_path,
+            )
+            # only blocks this dispatcher, the outcome arrives through the event queue
+            future.result()
+        except Exception as e:
+            with self.lock:
+                self.process_jobs.pop(job.id, None)
+            self.fail(job, e)
+
+    def poll(self):
+        if self.events is None:
+            return
+        while True:
+            try:
+                event, job_id, value = self.events.get_nowait()
+            except (queue.Empty, EOFError, OSError):
+                return
+            job = self.process_jobs.get(job_id, None)
+            if job is None:
+                continue
+            if event == "progress":
+                job.progress = value
+                continue
+            if event == "cover":
+                for path in cover_paths(value):
+                    MEDIA_INDEX.set_artifact(path, True)
+                for music in job.musics:
+                    music.load_cover_async(value)
+                continue
+            with self.lock:
+                self.process_jobs.pop(job_id, None)
+                self.cancelled.pop(job_id, None)
+            if event == "done":
+                self.finish(job)
+            elif event == "cancelled":
+                self.fail(job, ConversionCancelled("Conversion cancelled"))
+            elif event == "error":
+                if job.cover_path is not None:
+                    for music in job.musics:
+                        music.cover = None
+                self.fail(job, Exception(value))
+
+    def finish(self, job: ConversionJob):
+        if job.new_path is not None:
+            MEDIA_INDEX.set_artifact(job.new_path, True)
+        for music in self.release(job):
+            music.pending = False
+            if music.audio_converting:
+                music.converted = True
+            music.audio_converting = False
+
+    def fail(self, job: ConversionJob, exc):
+        for music in self.release(job):
+            music.load_exc = exc
+
+    def release(self, job: ConversionJob):
+        with self.lock:
+            musics = job.musics
+            for music in musics:
+                if self.jobs.get(music, None) is job:
+                    self.jobs.pop(music)
+            for target, target_job in list(self.targets.items()):
+                if target_job is job:
+                    self.targets.pop(target)
+            if self.previews is not None:
+                self.previews.pop(job.id, None)
+            self.positions_dirty = True
+        return musics
+
+    def shutdown(self):
+        with self.lock:
+            for job in self.jobs.values():
+                job.cancelled = True
+                if job.id in self.process_jobs:
+                    self.cancelled[job.id] = True
+            workers = self.workers
+            self.workers = []
+            for _ in workers:
+                self.queue.put((-1, next(self.counter), None))
+        for worker in workers:
+            worker.join(5)
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+            self.manager.shutdown()
+            self.executor = None
+
+
+CONVERSION_QUEUE = ConversionQueue()
@@ -0,0 +1,52 @@
+import time
+
+import proglog
+
+from ui.common.conversion import (
+    PROGRESS_INTERVAL,
+    ConversionCancelled,
+    ConversionRestarted,
+)
+
+
+class ConversionLogger(proglog.ProgressBarLogger):
+    def __init__(self, job, preview=None):
+        super().__init__()
+        self.job = job
+        self.preview = preview
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        # moviepy reports every written chunk, which is also where a cancel can interrupt it
+        if self.job.cancelled:
+            raise ConversionCancelled("Conversion cancelled")
+        if self.job.preview_path != self.preview:
+            raise ConversionRestarted("Preview requested")
+        if attr == "index":
+            total = self.bars[bar]["total"]
+            if total:
+                self.job.progress = min(1, (value + 1) / total)
+
+
+class ChildConversionLogger(proglog.ProgressBarLogger):
+    def __init__(self, job_id, events, cancelled, previews, preview=None):
+        super().__init__()
+        self.job_id = job_id
+        self.events = events
+        self.cancelled = cancelled
+        self.previews = previews
+        self.preview = preview
+        self.last_report = 0
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        # reaching the parent costs a round trip, so it is only done a few times per second
+        now = time.perf_counter()
+        if attr != "index" or now - self.last_report < PROGRESS_INTERVAL:
+            return
+        self.last_report = now
+        if self.job_id in self.cancelled:
+            raise ConversionCancelled("Conversion cancelled")
+        if self.preview is None and self.job_id in self.previews:
+            raise ConversionRestarted("Preview requested")
+        total = self.bars[bar]["total"]
+        if total:
+            self.events.put(("progress", self.job_id, min(1, (value + 1) / total)))
@@ -0,0 +1,107 @@
+import collections
+import itertools
+import queue
+import threading
+import time
+
+import pygame
+
+from ui.common.profiler import PROFILER
+
+PRIORITY_VISIBLE = 0
+PRIORITY_PREFETCH = 1
+PRIORITY_BACKGROUND = 2
+COVER_WORKERS = 4
+FINALIZE_BUDGET = 0.004
+
+
+class CoverRequest:
+    def __init__(self, key, path, decode, on_done, priority, order):
+        self.key = key
+        self.path = path
+        self.decode = decode
+        self.on_done = on_done
+        self.priority = priority
+        self.order = order
+        self.running = False
+
+    @property
+    def sort_key(self):
+        return (self.priority, self.order)
+
+
+class CoverLoader:
+    def __init__(self, workers):
+        self.queue = queue.PriorityQueue()
+        self.requests: dict = {}
+        self.finished = collections.deque()
+        self.workers = workers
+        self.threads: list[threading.Thread] = []
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def request(self, key, path, decode, on_done, priority=PRIORITY_BACKGROUND):
+        with self.lock:
+            # a newer request for the same key makes the queued one stale
+            request = CoverRequest(
+                key, path, decode, on_done, priority, next(self.counter)
+            )
+            self.requests[key] = request
+            self.queue.put((*request.sort_key, request))
+            if len(self.threads) < self.workers:
+                thread = threading.Thread(target=self.worker_loop, daemon=True)
+                self.threads.append(thread)
+                thread.start()
+
+    def bump(self, key, priority):
+        with self.lock:
+            request = self.requests.get(key, None)
+            if request is None or request.running or request.priority <= priority:
+                return
+            request.priority = priority
+            request.order = next(self.counter)
+            self.queue.put((*request.sort_key, request))
+
+    def cancel(self, key):
+        with self.lock:
+            self.requests.pop(key, None)
+
+    def is_loading(self, key):
+        return key in self.requests
+
+    def worker_loop(self):
+        while True:
+            priority, order, request = self.queue.get()
+            with self.lock:
+                if (
+                    self.requests.get(request.key, None) is not request
+                    or request.running
+                    or (priority, order) != request.sort_key
+                ):
+                    continue
+                request.running = True
+            try:
+                surface = request.decode(request.path)
+            except (pygame.error, OSError, ValueError):
+                # a corrupt file must still reach update, the row falls back to no cover
+                surface = None
+            self.finished.append((request, surface))
+
+    def update(self):
+        # convert_alpha needs the display, so decoded surfaces are finalized here within a time budget
+        start = time.perf_counter()
+        while len(self.finished) > 0:
+            request, surface = self.finished.popleft()
+            with self.lock:
+                if self.requests.get(request.key, None) is not request:
+                    continue
+                self.requests.pop(request.key)
+            if surface is not None:
+                surface = surface.convert_alpha()
+                PROFILER.count("covers_decoded")
+            request.on_done(request.path, surface)
+            if time.perf_counter() - start >= FINALIZE_BUDGET:
+                break
+
+
+COVER_LOADER = CoverLoader(COVER_WORKERS)
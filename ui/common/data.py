@@ -1,41 +1,47 @@
-import numpy
 import pygame
 import pathlib
-import threading
 import subprocess
 from ui.common import *
-import moviepy
+from ui.common.media_index import MEDIA_INDEX
+from ui.common.media_handles import MEDIA_HANDLES
+from ui.common.conversion import CONVERSION_QUEUE, ConversionCancelled
+from ui.common.media_probe import DURATION_PROBER
+from ui.common.thumbnails import (
+    THUMBNAIL_CACHE,
+    cover_paths,
+    load_thumbnail,
+    rename_cover,
+    save_thumbnails,
+)
+from ui.common.cover_loader import COVER_LOADER, PRIORITY_BACKGROUND
+from ui.common.profiler import PROFILER
+from ui.common.deferred_imports import DEFERRED_IMPORTS
+from ui.common.folder_watcher import FOLDER_WATCHER
+from ui.common.ingest import INGEST
+from ui.common.load_errors import LOAD_ERRORS
+from ui.common.shuffle import ShuffleBag
+from ui.common.relocation import entry_path
 
+if typing.TYPE_CHECKING:
+    import moviepy
 
-try:
-    import webview
-except ImportError:
-    webview = None
 
+def decode_music_cover(path):
+    return load_thumbnail(path, "row")
 
-def load_cover_async(path, obj):
-    obj.cover = pygame.image.load(path).convert_alpha()
 
+def open_videoclip(path) -> "moviepy.VideoFileClip":
+    import moviepy
 
-def get_cover_async(music: "MusicData", videofile: moviepy.VideoClip, cover_path):
-    try:
-        frame: numpy.ndarray = videofile.get_frame(videofile.duration / 2)
-        surface = pygame.image.frombytes(frame.tobytes(), videofile.size, "RGB")
-        pygame.image.save(surface, cover_path)
-        music.cover = surface
-    except Exception:
-        music.cover = None
+    PROFILER.count("moviepy_clips")
+    return moviepy.VideoFileClip(str(path))
 
 
-def convert_music_async(music: "MusicData", audiofile: moviepy.AudioClip, new_path):
-    try:
-        audiofile.write_audiofile(str(new_path))
-        music.pending = False
-        if music.audio_converting:
-            music.converted = True
-        music.audio_converting = False
-    except Exception as e:
-        music.load_exc = e
+def open_audioclip(path) -> "moviepy.AudioFileClip":
+    import moviepy
+
+    PROFILER.count("moviepy_clips")
+    return moviepy.AudioFileClip(str(path))
 
 
 class YTVideoFormat:
@@ -190,7 +196,7 @@ class AsyncYTEmbed:
     def __init__(self, video: YTVideoResult, shift=False):
         self.video = video
         self.url = self.video.embed_url
-        if os.path.exists("ytembed.py") and webview:
+        if os.path.exists("ytembed.py") and DEFERRED_IMPORTS.is_available("webview"):
             start = "py ytembed.py"
         else:
             start = "ytembed.exe"
@@ -233,9 +239,7 @@ class AsyncVideoclipGetter:
 
     def load_videoclip(self):
         try:
-            self.videoclip = moviepy.VideoFileClip(
-                self.realpath
-            )
+            self.videoclip = open_videoclip(self.realpath)
         except Exception as e:
             self.alive = False
             print(e)
@@ -249,7 +253,7 @@ class AsyncVideoclipGetter:
             return
         self.clock.tick(min(self.videoclip.fps + 5, self.framerate))
         frame = self.videoclip.get_frame(self.time)
-        self.output = pygame.surfarray.make_surface(numpy.transpose(frame, (1, 0, 2)))
+        self.output = pygame.surfarray.make_surface(frame.transpose((1, 0, 2)))
         self.scaled_output = {}
         small_output = None
         smallest = float("inf")
@@ -269,7 +273,35 @@ class AsyncVideoclipGetter:
         self.videoclip = None
 
 
+class MusicLoadError(Exception): ...
+
+
+class MusicMissingError(MusicLoadError): ...
+
+
 class MusicData:
+    # a large library holds tens of thousands of these, slots drop the per instance dict
+    __slots__ = (
+        "audio_converting",
+        "audiofile",
+        "audiopath",
+        "converted",
+        "cover",
+        "digest",
+        "duration",
+        "group",
+        "isconvertible",
+        "isvideo",
+        "load_exc",
+        "pending",
+        "playlist",
+        "pos_supported",
+        "realpath",
+        "realstem",
+        "short_title",
+        "title",
+        "videofile",
+    )
     audiopath: pathlib.Path
     realpath: pathlib.Path
     cover: pygame.Surface
@@ -278,20 +310,33 @@ class MusicData:
     pending: bool
     audio_converting: bool
     converted: bool
-    load_exc = None
+    digest: str
+    load_exc: Exception | None
     group: "PlaylistGroup|None"
+    realstem: str
+    title: str
+    short_title: str
+    isvideo: bool
+    isconvertible: bool
+    pos_supported: bool
 
     @classmethod
-    def load(
-        cls,
-        realpath,
-        playlist: "Playlist",
-        loading_image=None,
-        converted=False,
-        startup=None,
-    ):
+    def placeholder(cls, realpath, playlist: "Playlist", converted=False):
         self = MusicData()
         self.realpath = realpath
+        # the rows read these every frame, the path never changes so they are computed once
+        extension = realpath.suffix.lower()[1:]
+        self.realstem = realpath.stem
+        # both titles are the stem itself unless a suffix is stripped, they cost no extra string
+        self.title = parse_music_stem(self.realstem)
+        self.short_title = parse_music_stem(self.title, True)
+        self.isvideo = extension in VIDEO_SUPPORTED and not self.realstem.endswith(
+            "novideo"
+        )
+        self.isconvertible = extension in CONVERT_SUPPORTED
+        # positioning is tried on every track, the ones the mixer can't seek are marked when it fails
+        self.pos_supported = True
+        self.audiopath = realpath
         self.playlist = playlist
         self.cover = None
         self.duration = NotCached
@@ -300,115 +345,139 @@ class MusicData:
         self.load_exc = None
         self.converted = converted
         self.group = None
+        self.digest = None
+        return self
 
-        cover_path = f"data/music_covers/{playlist.name}_{self.realstem}.png"
-        if not os.path.exists(realpath):
-            pygame.display.message_box(
-                "Could not load music",
-                f"Could not load music '{realpath}' as the file doesn't exist anymore. Music will be skipped.",
-                "error",
-                None,
-                ("Understood",),
-            )
+    @classmethod
+    def load(
+        cls,
+        realpath,
+        playlist: "Playlist",
+        loading_image=None,
+        converted=False,
+    ):
+        self = cls.placeholder(realpath, playlist, converted)
+        try:
+            clip = self.prepare()
+        except MusicLoadError as e:
+            playlist.report_load_error(self.entry, e)
             return
-
+        return self.attach(clip, loading_image)
+
+    def ready(self):
+        # true when prepare would neither hash the file nor open a clip
+        record = MEDIA_INDEX.lookup(self.realpath)
+        if record is None:
+            return True
+        self.digest = record["digest"]
+        if self.digest is None:
+            return False
         if self.isvideo:
-            new_path = pathlib.Path(
-                f"data/mp3_converted/{playlist.name}_{self.realstem}.mp3"
-            ).resolve()
+            return MEDIA_INDEX.artifact_exists(
+                self.converted_path
+            ) and MEDIA_INDEX.artifact_exists(self.cover_path)
+        if self.isconvertible:
+            return MEDIA_INDEX.artifact_exists(self.converted_path)
+        return True
 
-            if os.path.exists(new_path) and os.path.exists(cover_path):
-                self.load_cover_async(cover_path, loading_image, startup=startup)
-                self.audiopath = new_path
-                return self
+    def prepare(self):
+        # safe to run on the ingest workers, anything touching the interface waits for attach
+        realpath = self.realpath
+        record = MEDIA_INDEX.lookup(realpath)
+        if record is None:
+            raise MusicMissingError(
+                f"Could not load music '{realpath}' as the file doesn't exist anymore. Music will be skipped."
+            )
+        if record["duration"] is not None:
+            self.duration = record["duration"]
+        self.digest = MEDIA_INDEX.digest(record)
+        if self.digest is None:
+            raise MusicLoadError(
+                f"Could not load music '{realpath}' as the file couldn't be read. Music will be skipped."
+            )
+        self.migrate_legacy_artifacts()
 
+        if self.isvideo:
+            new_path = self.converted_path
+            need_audio = not MEDIA_INDEX.artifact_exists(new_path)
+            if not need_audio and MEDIA_INDEX.artifact_exists(self.cover_path):
+                return None
+            if record["has_audio"] is False:
+                raise MusicLoadError(
+                    f"Could not convert '{realpath}' to audio format: the video has no associated audio. Music will be skipped."
+                )
             try:
-                videofile = moviepy.VideoFileClip(str(realpath))
-            except Exception:
-                pygame.display.message_box(
-                    "Could not load music",
-                    f"The app tried to load '{realpath}' as a video file and failed. If this was an audio file with a common video extension, suffix the file with \"novideo\".",
-                    "error",
-                    None,
-                    ("Understood",),
+                # waits for a free slot when too many clips are open already
+                videofile = MEDIA_HANDLES.open(open_videoclip, realpath)
+                with videofile.use() as clip:
+                    has_audio, duration = clip.audio is not None, clip.duration
+                MEDIA_INDEX.update(
+                    realpath, kind="video", has_audio=has_audio, duration=duration
                 )
-                return
-            self.videofile = videofile
-            if not os.path.exists(cover_path):
-                try:
-                    self.pending = True
-                    if loading_image is not None:
-                        self.cover = loading_image
-                    thread = threading.Thread(
-                        target=get_cover_async, args=(self, videofile, cover_path)
-                    )
-                    thread.start()
-                except Exception:
-                    self.cover = None
-            else:
-                self.load_cover_async(cover_path, loading_image, startup=startup)
-
-            if os.path.exists(new_path):
-                self.audiopath = new_path
-                return self
-
-            audiofile = videofile.audio
-            if audiofile is None:
-                pygame.display.message_box(
-                    "Could not load music",
-                    f"Could not convert '{realpath}' to audio format: the video has no associated audio. Music will be skipped.",
-                    "error",
-                    None,
-                    ("Understood",),
+            except Exception:
+                raise MusicLoadError(
+                    f"The app tried to load '{realpath}' as a video file and failed. If this was an audio file with a common video extension, suffix the file with \"novideo\"."
+                ) from None
+            if self.duration is NotCached:
+                self.duration = duration
+            if need_audio and not has_audio:
+                videofile.close()
+                raise MusicLoadError(
+                    f"Could not convert '{realpath}' to audio format: the video has no associated audio. Music will be skipped."
                 )
-                return
-            self.audiopath = new_path
-            self.pending = True
-            thread = threading.Thread(
-                target=convert_music_async, args=(self, audiofile, new_path)
-            )
-            thread.start()
-            return self
+            return videofile
         elif self.isconvertible:
-            new_path = pathlib.Path(
-                f"data/mp3_converted/{playlist.name}_{self.realstem}.mp3"
-            ).resolve()
-
-            if os.path.exists(cover_path):
-                self.load_cover_async(cover_path, loading_image, startup=startup)
-            if os.path.exists(new_path):
-                self.audiopath = new_path
-                return self
-
+            if MEDIA_INDEX.artifact_exists(self.converted_path):
+                return None
             try:
-                audiofile = moviepy.AudioFileClip(str(realpath))
-                self.audiofile = audiofile
-            except Exception as e:
-                pygame.display.message_box(
-                    "Could not load music",
-                    f"Could not convert and load '{realpath}' to Mp3 due to an external exception: '{e}'.",
-                    "error",
-                    None,
-                    ("Understood",),
+                audiofile = MEDIA_HANDLES.open(open_audioclip, realpath)
+                with audiofile.use() as clip:
+                    duration = clip.duration
+                MEDIA_INDEX.update(
+                    realpath, kind="audio", has_audio=True, duration=duration
                 )
-                return
-            self.audiopath = new_path
+            except Exception as e:
+                raise MusicLoadError(
+                    f"Could not convert and load '{realpath}' to Mp3 due to an external exception: '{e}'."
+                ) from None
+            if self.duration is NotCached:
+                self.duration = duration
+            return audiofile
+        elif record["kind"] is None:
+            MEDIA_INDEX.update(realpath, kind="audio", has_audio=True)
+        return None
+
+    def attach(self, clip, loading_image=None):
+        cover_path = self.cover_path
+        self.audiopath = self.resolved_audiopath
+        if clip is None:
+            if MEDIA_INDEX.artifact_exists(cover_path):
+                self.load_cover_async(cover_path, loading_image)
+            return self
+
+        if self.isvideo:
+            self.videofile = clip
+            need_cover = not MEDIA_INDEX.artifact_exists(cover_path)
+            need_audio = not MEDIA_INDEX.artifact_exists(self.audiopath)
+            if need_cover:
+                if loading_image is not None:
+                    self.cover = loading_image
+            else:
+                self.load_cover_async(cover_path, loading_image)
             self.pending = True
-            thread = threading.Thread(
-                target=convert_music_async, args=(self, audiofile, new_path)
+            CONVERSION_QUEUE.submit(
+                self,
+                clip,
+                self.audiopath if need_audio else None,
+                cover_path if need_cover else None,
             )
-            thread.start()
-            return self
         else:
-            if os.path.exists(cover_path):
-                self.load_cover_async(cover_path, loading_image, startup=startup)
-            if self.converted:
-                self.audiopath = pathlib.Path(
-                    f"data/mp3_converted/{playlist.name}_{self.realstem}.mp3"
-                ).resolve()
-            else:
-                self.audiopath = realpath
-            return self
+            self.audiofile = clip
+            if MEDIA_INDEX.artifact_exists(cover_path):
+                self.load_cover_async(cover_path, loading_image)
+            self.pending = True
+            CONVERSION_QUEUE.submit(self, clip, self.audiopath)
+        return self
 
     def check(self):
         if not self.pending:
@@ -420,6 +489,8 @@ class MusicData:
                 del self.videofile
         if self.load_exc is None:
             return False
+        load_exc = self.load_exc
+        cancelled = isinstance(load_exc, ConversionCancelled)
         if self.audio_converting:
             self.audio_converting = False
             self.pending = False
@@ -427,17 +498,25 @@ class MusicData:
             self.playlist.musictable.pop(self.audiopath)
             self.audiopath = self.realpath
             self.playlist.musictable[self.audiopath] = self
-            pygame.display.message_box(
-                "Could not convert music",
-                f"Could not convert '{self.realpath}' to MP3 due to external exception: '{self.load_exc}'.",
-                "error",
-                None,
-                ("Understood",),
-            )
+            if not cancelled:
+                pygame.display.message_box(
+                    "Could not convert music",
+                    f"Could not convert '{self.realpath}' to MP3 due to external exception: '{load_exc}'.",
+                    "error",
+                    None,
+                    ("Understood",),
+                )
+            return False
+        if cancelled:
+            # the row stays unconverted, playing it starts the conversion again
+            self.pending = False
+            self.load_exc = None
+            if self.cover is self.playlist.loading_image:
+                self.cover = None
             return False
         pygame.display.message_box(
             "Could not load music",
-            f"Could not convert '{self.realpath}' to audio format due to external exception: '{self.load_exc}'. Music will be removed.",
+            f"Could not convert '{self.realpath}' to audio format due to external exception: '{load_exc}'. Music will be removed.",
             "error",
             None,
             ("Understood",),
@@ -445,58 +524,103 @@ class MusicData:
         self.playlist.remove(self.audiopath)
         return True
 
-    def load_cover_async(self, path, loading_image=None, startup=None):
+    def load_cover_async(self, path, loading_image=None, priority=PRIORITY_BACKGROUND):
         if loading_image is not None:
             self.cover = loading_image
-        if startup is None:
-            thread = threading.Thread(target=load_cover_async, args=(path, self))
-            thread.start()
-        else:
-            startup.startup_covers_toload.append((self, path))
+        COVER_LOADER.request(
+            self, path, decode_music_cover, self.cover_loaded, priority
+        )
 
-    def cache_duration(self):
-        try:
-            soundfile = moviepy.AudioFileClip(str(self.audiopath))
-            self.duration = soundfile.duration
-            soundfile.close()
-        except Exception:
-            self.duration = None
+    def cover_loaded(self, path, surface):
+        self.cover = surface
+        if surface is None:
+            MEDIA_INDEX.set_artifact(path, False)
+
+    def cover_variant(self, variant):
+        if self.cover is None or self.pending:
+            return self.cover
+        surface = THUMBNAIL_CACHE.get(self.cover_path, variant)
+        if surface is None:
+            return self.cover
+        return surface
+
+    def set_cover(self, surface: pygame.Surface):
+        pygame.image.save(surface, self.cover_path)
+        MEDIA_INDEX.set_artifact(self.cover_path, True)
+        THUMBNAIL_CACHE.forget(self.cover_path)
+        thumbnails = save_thumbnails(surface, self.cover_path)
+        for variant in ["bar", "full"]:
+            THUMBNAIL_CACHE.put(self.cover_path, variant, thumbnails[variant])
+        self.cover = thumbnails["row"]
+
+    def set_probed_duration(self, duration):
+        if self.duration is NotCached:
+            self.duration = duration
 
     def cover_or(self, default):
         if self.cover is None:
             return default
         return self.cover
 
+    def migrate_legacy_artifacts(self):
+        # artifacts used to be named after the playlist and the track, they move to the digest once
+        legacy_stem = f"{self.playlist.name}_{self.realstem}"
+        legacy_audio = self.legacy_audiopath
+        if MEDIA_INDEX.artifact_exists(legacy_audio):
+            self.playlist.legacy_paths[legacy_audio] = self
+            if MEDIA_INDEX.artifact_exists(self.converted_path):
+                MEDIA_INDEX.remove_artifact(legacy_audio)
+            else:
+                MEDIA_INDEX.rename_artifact(legacy_audio, self.converted_path)
+        legacy_cover = f"data/music_covers/{legacy_stem}.png"
+        if MEDIA_INDEX.artifact_exists(legacy_cover):
+            if MEDIA_INDEX.artifact_exists(self.cover_path):
+                for path in cover_paths(legacy_cover):
+                    MEDIA_INDEX.remove_artifact(path)
+            else:
+                rename_cover(legacy_cover, self.cover_path)
+
     @property
-    def realstem(self):
-        return self.realpath.stem
+    def legacy_audiopath(self):
+        return pathlib.Path(
+            f"data/mp3_converted/{self.playlist.name}_{self.realstem}.mp3"
+        ).resolve()
 
     @property
-    def realname(self):
-        return self.realpath.name
+    def converted_path(self):
+        return pathlib.Path(f"data/mp3_converted/{self.digest}.mp3").resolve()
 
     @property
-    def realextension(self):
-        return self.realpath.suffix
+    def cover_path(self):
+        return f"data/music_covers/{self.digest}.png"
+
+    @property
+    def entry(self):
+        return [self.realpath, "converted"] if self.converted else self.realpath
 
     @property
-    def isvideo(self):
-        return self.realpath.suffix.lower()[
-            1:
-        ] in VIDEO_SUPPORTED and not self.realpath.stem.endswith("novideo")
+    def resolved_audiopath(self):
+        if self.isvideo or self.isconvertible or self.converted:
+            return self.converted_path
+        return self.realpath
 
     @property
-    def isconvertible(self):
-        return self.realpath.suffix.lower()[1:] in CONVERT_SUPPORTED
+    def realname(self):
+        return self.realpath.name
 
     @property
-    def pos_supported(self):
-        return self.realpath.suffix.lower()[1:] not in POS_UNSUPPORTED
+    def realextension(self):
+        return self.realpath.suffix
+
+    def display_stem(self, app: "MILIMP"):
+        return self.short_title if app.strip_youtube_id else self.title
 
 
 class HistoryData:
     def __init__(self, music: MusicData, position, duration):
         self.music = music
+        self.playlist = music.playlist if music is not None else None
+        self.audiopath = music.audiopath if music is not None else None
         self.position = position
         if duration is NotCached:
             duration = "not cached"
@@ -505,14 +629,44 @@ class HistoryData:
             if int(self.position) >= int(self.duration - 0.01):
                 self.position = 0
 
+    def resolve(self):
+        # lazy playlists only build their tracks once the entry is actually shown
+        if self.music is None and self.playlist is not None:
+            self.music = self.playlist.find_music(self.audiopath)
+            if self.music is None:
+                # tracks still on the ingest workers are only found once they attach
+                if INGEST.get_progress(self.playlist) is not None:
+                    return None
+                self.playlist = None
+                return None
+            self.audiopath = self.music.audiopath
+            if self.music.duration is NotCached and self.duration not in [
+                None,
+                "not cached",
+            ]:
+                self.music.duration = self.duration
+        return self.music
+
+    def relocate(self, locate):
+        # entries of tracks missing at startup stay unresolved until a relocation finds them
+        if self.music is None and self.playlist is not None:
+            new_path = locate(self.audiopath)
+            if new_path is not None:
+                self.audiopath = new_path
+
+    def refers_to(self, music: MusicData):
+        if self.music is not None:
+            return self.music is music
+        return self.playlist is music.playlist and self.audiopath == music.audiopath
+
     def get_save_data(self):
         duration = self.duration
         if duration is NotCached:
             duration = "not cached"
         return {
-            "audiopath": str(self.music.audiopath),
+            "audiopath": str(self.audiopath),
             "position": self.position,
-            "playlist": self.music.playlist.name,
+            "playlist": self.playlist.name,
             "duration": duration,
         }
 
@@ -525,9 +679,16 @@ class HistoryData:
                 break
         if playlist is None:
             return
-        musicobj = playlist.musictable.get(pathlib.Path(data["audiopath"]), None)
+        audiopath = pathlib.Path(data["audiopath"])
+        musicobj = playlist.find_music(audiopath) if playlist.loaded else None
         if musicobj is None:
-            return
+            # missing tracks keep their entry, a relocation may still bring them back
+            if playlist.loaded and len(playlist.missing) <= 0:
+                return
+            history = HistoryData(None, data["position"], data["duration"])
+            history.playlist = playlist
+            history.audiopath = audiopath
+            return history
         if data["duration"] is not None and data["duration"] != "not cached":
             musicobj.duration = data["duration"]
         return HistoryData(musicobj, data["position"], data["duration"])
@@ -561,103 +722,537 @@ class PlaylistGroup:
             "paths": [str(music.audiopath) for music in self.musics],
         }
 
+    def add(self, music: "MusicData", idx=-1):
+        music.group = self
+        if idx != -1:
+            self.musics.insert(idx, music)
+        else:
+            self.musics.append(music)
+        self.playlist.invalidate_order()
+
     def remove(self, music: "MusicData"):
         self.musics.remove(music)
         music.group = None
         music.playlist.musiclist.remove(music)
         music.playlist.musiclist.insert(self.idx, music)
+        music.playlist.invalidate_order()
+
+
+def parse_entry(entry):
+    if isinstance(entry, list):
+        return [pathlib.Path(entry[0]), entry[1]]
+    return pathlib.Path(entry)
 
 
 class Playlist:
     def __init__(
-        self, name, filepaths, groups_data=None, loading_image=None, startup=None
+        self,
+        name,
+        filepaths,
+        groups_data=None,
+        loading_image=None,
+        lazy=False,
+        folder=None,
+        shuffle_data=None,
     ):
         self.name = name
         self.cover = None
+        self.folder = folder
         if groups_data is None:
             groups_data = []
-        self.groups: list[PlaylistGroup] = []
+        self.loading_image = loading_image
+        self.stub_paths = None
+        self.stub_groups = None
+        self.stub_shuffle = None
+        self.stub_parsed = True
 
         if os.path.exists(f"data/covers/{self.name}.png"):
             if loading_image is not None:
                 self.cover = loading_image
-            thread = threading.Thread(
-                target=load_cover_async,
-                args=(f"data/covers/{self.name}.png", self),
+            COVER_LOADER.request(
+                self,
+                f"data/covers/{self.name}.png",
+                pygame.image.load,
+                self.cover_loaded,
             )
-            thread.start()
 
-        self.musiclist: list[MusicData] = []
-        self.musictable: dict[pathlib.Path, MusicData] = {}
+        self._musiclist: list[MusicData] = []
+        self._musictable: dict[pathlib.Path, MusicData] = {}
+        self._realtable: dict[pathlib.Path, MusicData] = {}
+        self._groups: list[PlaylistGroup] = []
+        # the play order is never changed in place, a list handed out can still be iterated
+        self._play_order: list[MusicData] = None
+        self._play_positions: dict[MusicData, int] = {}
+        self._positions_valid = 0
+        self.legacy_paths: dict[pathlib.Path, MusicData] = {}
+        self.group_slots: dict[pathlib.Path, tuple] = {}
+        self.missing = []
+        self.shuffle_bag = ShuffleBag(self)
+        if lazy:
+            # saved entries only become paths once something needs them, most never do at startup
+            self.stub_paths = filepaths
+            self.stub_groups = groups_data
+            self.stub_shuffle = shuffle_data
+            self.stub_parsed = False
+        else:
+            self.build(
+                [parse_entry(path) for path in filepaths],
+                groups_data,
+                loading_image,
+                shuffle_data,
+            )
+        if self.folder is not None:
+            FOLDER_WATCHER.watch(self)
+
+    def build(self, filepaths, groups_data, loading_image=None, shuffle_data=None):
         for path in filepaths:
-            self.load_music(path, loading_image, startup=startup)
+            self.load_music(path, loading_image, defer=True)
+        if shuffle_data is not None:
+            self.shuffle_bag.load_from_data(
+                shuffle_data,
+                [
+                    self._realtable.get(path[0] if isinstance(path, list) else path)
+                    for path in filepaths
+                ],
+            )
 
         if len(groups_data) > 0 and isinstance(groups_data[0], PlaylistGroup):
-            self.groups = groups_data
+            self._groups = groups_data
         else:
             for gdata in groups_data:
-                self.groups.append(
-                    PlaylistGroup(
-                        gdata["name"],
-                        self,
-                        [
-                            self.musictable[pathlib.Path(gdpath)]
-                            for gdpath in gdata["paths"]
-                        ],
-                        gdata.get("idx", 0),
-                        gdata.get("collapsed", True),
-                        gdata.get("mode", "h"),
-                    )
+                gdpaths = [pathlib.Path(gdpath) for gdpath in gdata["paths"]]
+                group = PlaylistGroup(
+                    gdata["name"],
+                    self,
+                    [
+                        music
+                        for gdpath in gdpaths
+                        if (music := self.find_music(gdpath)) is not None
+                    ],
+                    gdata.get("idx", 0),
+                    gdata.get("collapsed", True),
+                    gdata.get("mode", "h"),
                 )
+                self._groups.append(group)
+                # the deferred tracks only know their converted path once they attach
+                for rank, gdpath in enumerate(gdpaths):
+                    if self.find_music(gdpath) is None:
+                        self.group_slots[gdpath] = (group, gdpaths, rank)
+        self.invalidate_order()
+
+    def join_group_slot(self, music: MusicData):
+        for path in [music.audiopath, music.legacy_audiopath]:
+            slot = self.group_slots.pop(path, None)
+            if slot is None:
+                continue
+            group, gdpaths, rank = slot
+            before = set(gdpaths[:rank])
+            group.add(
+                music,
+                sum(
+                    1
+                    for other in group.musics
+                    if other.audiopath in before or other.legacy_audiopath in before
+                ),
+            )
+            return
+
+    def find_music(self, audiopath) -> "MusicData | None":
+        # groups and history saved before the digest names still refer to the old converted files
+        music = self.musictable.get(audiopath, None)
+        if music is None:
+            music = self.legacy_paths.get(audiopath, None)
+        return music
+
+    def uses_digest(self, digest):
+        if self.stub_paths is not None:
+            return any(
+                MEDIA_INDEX.cached_digest(path[0] if isinstance(path, list) else path)
+                == digest
+                for path in self.stub_paths
+            )
+        return any(music.digest == digest for music in self._musiclist)
+
+    def cover_loaded(self, path, surface):
+        self.cover = surface
+        if surface is None:
+            MEDIA_INDEX.set_artifact(path, False)
+
+    def materialize(self):
+        if self.stub_paths is None:
+            return
+        filepaths, groups_data = self.parse_stubs(), self.stub_groups
+        shuffle_data = self.stub_shuffle
+        self.stub_paths = self.stub_groups = self.stub_shuffle = None
+        with PROFILER.phase(f"materialize playlist '{self.name}'"):
+            self.build(filepaths, groups_data, self.loading_image, shuffle_data)
+
+    def parse_stubs(self):
+        if not self.stub_parsed:
+            self.stub_paths = [parse_entry(path) for path in self.stub_paths]
+            self.stub_parsed = True
+        return self.stub_paths
 
     @property
-    def realpaths(self):
-        return [music.realpath for music in self.musiclist]
+    def loaded(self):
+        return self.stub_paths is None
 
-    def get_group_sorted_musics(self, paths=False, groups=False):
-        ungrouped_musics = [
-            (music.audiopath if paths else music)
-            for music in self.musiclist
-            if music.group is None
-        ]
-        i_offset = 0
+    @property
+    def track_count(self):
+        if self.stub_paths is not None:
+            return len(self.stub_paths)
+        return len(self._musiclist)
+
+    @property
+    def musiclist(self) -> list[MusicData]:
+        self.materialize()
+        return self._musiclist
+
+    @property
+    def musictable(self) -> dict[pathlib.Path, MusicData]:
+        self.materialize()
+        return self._musictable
+
+    @property
+    def groups(self) -> list[PlaylistGroup]:
+        self.materialize()
+        return self._groups
+
+    def get_save_data(self):
+        if self.stub_paths is not None:
+            # the writer thread serializes these later, relocations keep rewriting the stubs
+            paths = self.stub_paths
+            groups = [
+                dict(gdata, paths=list(gdata["paths"])) for gdata in self.stub_groups
+            ]
+            shuffle = self.stub_shuffle
+            if shuffle is not None:
+                shuffle = {
+                    key: list(value) if isinstance(value, list) else value
+                    for key, value in shuffle.items()
+                }
+        else:
+            # missing tracks stay saved until they are relocated or removed from the report
+            paths = [music.entry for music in self._musiclist] + self.missing
+            groups = [group.get_save_data() for group in self._groups]
+            if INGEST.get_progress(self) is not None:
+                # tracks still on the ingest workers keep their place in their group
+                for path, (group, _, rank) in self.group_slots.items():
+                    if group not in self._groups:
+                        continue
+                    gpaths = groups[self._groups.index(group)]["paths"]
+                    gpaths.insert(min(rank, len(gpaths)), str(path))
+            shuffle = self.shuffle_bag.get_save_data()
+        return {
+            "name": self.name,
+            "paths": [
+                [str(path[0]), path[1]] if isinstance(path, list) else str(path)
+                for path in paths
+            ],
+            "groups": groups,
+            "folder": self.folder,
+            "shuffle": shuffle,
+        }
+
+    @property
+    def realpaths(self):
+        if self.stub_paths is not None:
+            return {
+                path[0] if isinstance(path, list) else path
+                for path in self.parse_stubs()
+            }
+        return self._realtable.keys()
+
+    def sorted_groups_order(self):
+        order = [music for music in self.musiclist if music.group is None]
         for group in sorted(self.groups, key=lambda g: g.idx):
-            if groups:
+            if len(group.musics) > 0:
+                order.insert(group.idx, group)
+        return order
+
+    @property
+    def play_order(self) -> list[MusicData]:
+        if self._play_order is None:
+            order = [music for music in self.musiclist if music.group is None]
+            i_offset = 0
+            for group in sorted(self.groups, key=lambda g: g.idx):
                 if len(group.musics) > 0:
-                    ungrouped_musics.insert(group.idx, group)
-            elif len(group.musics) > 0:
-                ungrouped_musics = (
-                    ungrouped_musics[: group.idx + i_offset]
-                    + (
-                        [music.audiopath for music in group.musics]
-                        if paths
-                        else group.musics
-                    )
-                    + ungrouped_musics[group.idx + i_offset :]
-                )
-                i_offset += len(group.musics) - 1
-        return ungrouped_musics
+                    order[group.idx + i_offset : group.idx + i_offset] = group.musics
+                    i_offset += len(group.musics) - 1
+            self._play_order = order
+            self._positions_valid = 0
+        return self._play_order
+
+    def index_of(self, music: MusicData):
+        order = self.play_order
+        # positions past the first change are refreshed once, when something asks for them
+        if self._positions_valid < len(order):
+            for i in range(self._positions_valid, len(order)):
+                self._play_positions[order[i]] = i
+            self._positions_valid = len(order)
+        return self._play_positions[music]
+
+    def invalidate_order(self):
+        self._play_order = None
+        self._play_positions = {}
+        self._positions_valid = 0
+
+    def order_appended(self, music: MusicData):
+        # an ungrouped track after an ungrouped one plays last, no group moves around it
+        if self._play_order is None:
+            return
+        if len(self._play_order) > 0 and self._play_order[-1].group is not None:
+            self.invalidate_order()
+            return
+        self._play_order.append(music)
 
-    def load_music(self, path, loading_image=None, idx=-1, startup=None):
+    def order_removed(self, music: MusicData):
+        if self._play_order is None:
+            return
+        pos = self._play_positions.pop(music, None)
+        if pos is None or pos >= self._positions_valid:
+            pos = self._play_order.index(music)
+        # groups keep their slot among the ungrouped tracks, one placed after it moves up past a track
+        for group in self._groups:
+            if len(group.musics) <= 0:
+                continue
+            group_pos = self._play_positions.get(group.musics[-1], None)
+            if (
+                group_pos is None
+                or group_pos >= self._positions_valid
+                or group_pos > pos
+            ):
+                self.invalidate_order()
+                return
+        self._play_order = self._play_order[:pos] + self._play_order[pos + 1 :]
+        self._positions_valid = min(self._positions_valid, pos)
+
+    def order_regrouped(self, group: PlaylistGroup):
+        # a group plays as one stretch, reordering inside it rewrites only that stretch
+        if self._play_order is None:
+            return
+        positions = [self.index_of(music) for music in group.musics]
+        start = min(positions)
+        if max(positions) - start + 1 != len(positions):
+            self.invalidate_order()
+            return
+        order = self._play_order.copy()
+        order[start : start + len(positions)] = group.musics
+        self._play_order = order
+        self._positions_valid = min(self._positions_valid, start)
+
+    def get_group_sorted_musics(self, paths=False, groups=False):
+        if groups:
+            return self.sorted_groups_order()
+        if paths:
+            return [music.audiopath for music in self.play_order]
+        return self.play_order
+
+    def load_music(self, path, loading_image=None, idx=-1, defer=False):
         converted = False
         if isinstance(path, list):
             path = path[0]
             converted = True
-        if path in self.musictable or path in self.realpaths:
+        if path in self.musictable or path in self._realtable:
             return
-        music_data = MusicData.load(
-            path, self, loading_image, converted, startup=startup
-        )
+        if defer and not MusicData.placeholder(path, self, converted).ready():
+            # hashing the file or opening its clip would hold the frame, the ingest workers do it
+            INGEST.add_placeholders(
+                self, [[path, "converted"] if converted else path], idx
+            )
+            return
+        music_data = MusicData.load(path, self, loading_image, converted)
         if music_data is None:
             return
+        if music_data.audiopath in self.musictable:
+            # identical content converts to the same file, the playlist already has it
+            print(f"Skipped '{path}' as the playlist already has a copy of it")
+            return
         if idx != -1:
             self.musiclist.insert(idx, music_data)
+            self.invalidate_order()
         else:
             self.musiclist.append(music_data)
+            self.order_appended(music_data)
         self.musictable[music_data.audiopath] = music_data
+        self._realtable[music_data.realpath] = music_data
+        self.shuffle_bag.add(music_data)
+
+    def add_placeholder(self, path, idx=-1):
+        converted = False
+        if isinstance(path, list):
+            path = path[0]
+            converted = True
+        if path in self.musictable or path in self._realtable:
+            return
+        music = MusicData.placeholder(path, self, converted)
+        music.pending = True
+        music.cover = self.loading_image
+        if idx != -1:
+            self.musiclist.insert(idx, music)
+            self.invalidate_order()
+        else:
+            self.musiclist.append(music)
+            self.order_appended(music)
+        self.musictable[music.audiopath] = music
+        self._realtable[music.realpath] = music
+        self.shuffle_bag.add(music)
+        return music
+
+    def finish_placeholder(self, music: MusicData, clip, exc):
+        if self.musictable.get(music.audiopath, None) is not music:
+            # the row was removed while the workers were still busy with it
+            if clip is not None:
+                clip.close()
+            return
+        music.pending = False
+        if exc is not None:
+            self.remove(music.audiopath)
+            if not isinstance(exc, MusicLoadError):
+                exc = MusicLoadError(
+                    f"Could not load music '{music.realpath}' due to an external exception: '{exc}'. Music will be skipped."
+                )
+            self.report_load_error(music.entry, exc)
+            return
+        if self.musictable.get(music.resolved_audiopath, music) is not music:
+            # identical content converts to the same file, the playlist already has it
+            self.remove(music.audiopath)
+            if clip is not None:
+                clip.close()
+            print(
+                f"Skipped '{music.realpath}' as the playlist already has a copy of it"
+            )
+            return
+        self.musictable.pop(music.audiopath)
+        music.attach(clip, self.loading_image)
+        self.musictable[music.audiopath] = music
+        if len(self.group_slots) > 0:
+            self.join_group_slot(music)
+
+    def report_load_error(self, path, exc: MusicLoadError):
+        missing = isinstance(exc, MusicMissingError)
+        if missing:
+            self.missing.append(path)
+        LOAD_ERRORS.add(self, path, str(exc), missing)
+
+    def missing_paths(self):
+        if self.stub_paths is None:
+            return [entry_path(path) for path in self.missing]
+        # a playlist that was never opened isn't checked track by track, only the folders that are gone
+        folders = {}
+        missing = []
+        for stub in self.parse_stubs():
+            path = entry_path(stub)
+            present = folders.get(path.parent, None)
+            if present is None:
+                present = folders[path.parent] = os.path.isdir(path.parent)
+            if not present:
+                missing.append(path)
+        return missing
+
+    def relocate_missing(self, locate):
+        # locate returns where a missing path moved to, or None when it wasn't found
+        renamed = {}
+        relocated = []
+        for path in self.missing.copy():
+            converted = isinstance(path, list)
+            new_path = locate(path[0] if converted else path)
+            if new_path is None or not new_path.exists():
+                continue
+            self.missing.remove(path)
+            renamed[path[0] if converted else path] = new_path
+            relocated.append([new_path, path[1]] if converted else new_path)
+        if self.stub_paths is not None:
+            for i, stub in enumerate(self.parse_stubs()):
+                converted = isinstance(stub, list)
+                new_path = locate(stub[0] if converted else stub)
+                if new_path is None:
+                    continue
+                renamed[stub[0] if converted else stub] = new_path
+                self.stub_paths[i] = [new_path, stub[1]] if converted else new_path
+            for gdata in self.stub_groups:
+                gdata["paths"] = [
+                    str(renamed.get(pathlib.Path(gdpath), gdpath))
+                    for gdpath in gdata["paths"]
+                ]
+        # the records keep their digest, the converted files and covers are found again as they are
+        for old_path, new_path in renamed.items():
+            MEDIA_INDEX.rename(old_path, new_path)
+        INGEST.submit(self, relocated)
+        if self.folder is not None:
+            folder = locate(pathlib.Path(self.folder))
+            if folder is not None:
+                FOLDER_WATCHER.unwatch(self)
+                self.folder = str(folder)
+                FOLDER_WATCHER.watch(self)
+        return len(renamed)
+
+    def detach_workers(self):
+        # a playlist leaving the app must not get callbacks from work it started
+        CONVERSION_QUEUE.cancel_playlist(self)
+        DURATION_PROBER.cancel_playlist(self)
+        FOLDER_WATCHER.unwatch(self)
+        INGEST.cancel_playlist(self)
 
     def remove(self, path):
         music = self.musictable.pop(path)
-        self.musiclist.remove(music)
+        self._realtable.pop(music.realpath, None)
+        # the group puts the track back into the list, it has to leave the group first
         if music.group is not None:
             music.group.remove(music)
+        self.musiclist.remove(music)
+        self.order_removed(music)
+        self.shuffle_bag.discard(music)
+        return music
+
+    def sync_add(self, path):
+        if self.stub_paths is not None:
+            if path not in self.realpaths:
+                self.stub_paths.append(path)
+            return
+        INGEST.submit(self, [path])
+
+    def sync_remove(self, path):
+        if self.stub_paths is not None:
+            self.stub_paths = [
+                stub
+                for stub in self.parse_stubs()
+                if (stub[0] if isinstance(stub, list) else stub) != path
+            ]
+            # the saved shuffle points at positions that just moved
+            self.stub_shuffle = None
+            return
+        music = self._realtable.get(path, None)
+        if music is not None:
+            return self.remove(music.audiopath)
+
+    def sync_rename(self, old_path, new_path):
+        MEDIA_INDEX.rename(old_path, new_path)
+        if self.stub_paths is not None:
+            for i, stub in enumerate(self.parse_stubs()):
+                if isinstance(stub, list) and stub[0] == old_path:
+                    self.stub_paths[i] = [new_path, stub[1]]
+                elif stub == old_path:
+                    self.stub_paths[i] = new_path
+            for gdata in self.stub_groups:
+                gdata["paths"] = [
+                    str(new_path) if gdpath == str(old_path) else gdpath
+                    for gdpath in gdata["paths"]
+                ]
+            return
+        music = self._realtable.get(old_path, None)
+        if music is None:
+            return
+        idx = self.musiclist.index(music)
+        group = music.group
+        group_idx = None if group is None else group.musics.index(music)
+        self.remove(music.audiopath)
+        self.load_music(
+            [new_path, "converted"] if music.converted else new_path,
+            self.loading_image,
+            idx,
+        )
+        new_music = self._realtable.get(new_path, None)
+        if group is not None and new_music is not None:
+            group.add(new_music, group_idx)
+        return music
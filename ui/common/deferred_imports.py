@@ -0,0 +1,56 @@
+import importlib
+import importlib.util
+import threading
+
+from ui.common.profiler import PROFILER
+
+WARM_MODULES = [
+    "numpy",
+    "proglog",
+    "moviepy",
+    "urllib.request",
+    "tkinter.filedialog",
+]
+
+
+class DeferredImports:
+    def __init__(self, warm_modules):
+        self.warm_modules = warm_modules
+        self.available: dict[str, bool] = {}
+        self.frames = 0
+        self.warm_thread: threading.Thread = None
+
+    def is_available(self, name):
+        # finding the spec doesn't execute the module, so optional backends can be checked for free
+        if name not in self.available:
+            try:
+                self.available[name] = importlib.util.find_spec(name) is not None
+            except (ImportError, ValueError):
+                self.available[name] = False
+        return self.available[name]
+
+    def load(self, name):
+        if not self.is_available(name):
+            return None
+        try:
+            return importlib.import_module(name)
+        except ImportError:
+            self.available[name] = False
+            return None
+
+    def frame(self):
+        # the second update means the first frame was presented, the heavy modules can load behind it
+        if self.warm_thread is not None:
+            return
+        self.frames += 1
+        if self.frames >= 2:
+            self.warm_thread = threading.Thread(target=self.warm_loop, daemon=True)
+            self.warm_thread.start()
+
+    def warm_loop(self):
+        for name in self.warm_modules:
+            with PROFILER.phase(f"warm import {name}"):
+                self.load(name)
+
+
+DEFERRED_IMPORTS = DeferredImports(WARM_MODULES)
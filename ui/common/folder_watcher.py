@@ -0,0 +1,129 @@
+import collections
+import os
+import pathlib
+import threading
+import time
+
+from ui.common import FORMATS
+from ui.common.profiler import PROFILER
+
+WATCH_INTERVAL = 2
+WATCH_CHANGES_PER_FRAME = 8
+
+
+def scan_folder(folder: pathlib.Path):
+    # inode, size and mtime survive a rename, so they identify the file between two scans
+    entries = {}
+    try:
+        with os.scandir(folder) as it:
+            for entry in it:
+                if not entry.is_file():
+                    continue
+                if os.path.splitext(entry.name)[1][1:].lower() not in FORMATS:
+                    continue
+                stat = entry.stat()
+                entries[folder / entry.name] = (
+                    entry.inode(),
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                )
+    except OSError:
+        return None
+    return entries
+
+
+class WatchedFolder:
+    def __init__(self, playlist, folder: pathlib.Path, known: set[pathlib.Path]):
+        self.playlist = playlist
+        self.folder = folder
+        self.known = known
+        self.entries: dict[pathlib.Path, tuple] = None
+        self.settling: dict[pathlib.Path, tuple] = {}
+
+
+class FolderWatcher:
+    def __init__(self, interval):
+        self.interval = interval
+        self.watched: dict = {}
+        self.changes = collections.deque()
+        self.thread: threading.Thread = None
+        self.wake = threading.Event()
+        self.lock = threading.Lock()
+
+    def watch(self, playlist):
+        folder = pathlib.Path(playlist.folder).resolve()
+        # only the tracks inside the folder are mirrored, tracks added by hand stay untouched
+        known = {path for path in playlist.realpaths if path.parent == folder}
+        with self.lock:
+            self.watched[playlist] = WatchedFolder(playlist, folder, known)
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.worker_loop, daemon=True)
+            self.thread.start()
+        self.wake.set()
+
+    def unwatch(self, playlist):
+        with self.lock:
+            self.watched.pop(playlist, None)
+
+    def is_watching(self, playlist):
+        return playlist in self.watched
+
+    def worker_loop(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            with self.lock:
+                watched = list(self.watched.values())
+            for state in watched:
+                self.scan(state)
+
+    def scan(self, state: WatchedFolder):
+        entries = scan_folder(state.folder)
+        if entries is None:
+            # an unplugged drive or a missing share would otherwise empty the playlist
+            return
+        PROFILER.count("folder_scans")
+        if state.entries is None:
+            # the first scan compares against the playlist saved while nothing watched the folder
+            previous = {path: None for path in state.known}
+        else:
+            previous = state.entries
+        removed = {path: previous[path] for path in previous if path not in entries}
+        renamed_from = {
+            signature: path
+            for path, signature in removed.items()
+            if signature is not None and signature[0]
+        }
+        stable = {}
+        settling = {}
+        changes = []
+        for path, signature in entries.items():
+            if path in previous:
+                stable[path] = signature
+            elif signature in renamed_from:
+                old_path = renamed_from.pop(signature)
+                removed.pop(old_path)
+                stable[path] = signature
+                changes.append(("rename", old_path, path))
+            elif state.settling.get(path, None) == signature:
+                # the file didn't change since the previous scan, the copy is complete
+                stable[path] = signature
+                changes.append(("add", path))
+            else:
+                settling[path] = signature
+        changes.extend(("remove", path) for path in removed)
+        state.entries = stable
+        state.settling = settling
+        for change in changes:
+            self.changes.append((state, change))
+
+    def poll(self):
+        # a few changes per frame keep large drops from stalling the interface
+        for _ in range(min(WATCH_CHANGES_PER_FRAME, len(self.changes))):
+            state, change = self.changes.popleft()
+            if self.watched.get(state.playlist, None) is not state:
+                continue
+            yield state.playlist, change
+
+
+FOLDER_WATCHER = FolderWatcher(WATCH_INTERVAL)
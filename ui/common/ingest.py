@@ -0,0 +1,142 @@
+import collections
+import os
+import pathlib
+import queue
+import threading
+import time
+
+from ui.common.library_scanner import scan_tree
+from ui.common.profiler import PROFILER
+
+INGEST_WORKERS = 4
+
+
+class IngestProgress:
+    def __init__(self):
+        self.total = 0
+        self.done = 0
+        self.scanning = 0
+        self.found = 0
+        self.start = time.perf_counter()
+
+    @property
+    def finished(self):
+        return self.done >= self.total and self.scanning <= 0
+
+    @property
+    def throughput(self):
+        elapsed = time.perf_counter() - self.start
+        return self.done / elapsed if elapsed > 0 else 0
+
+
+class IngestPipeline:
+    def __init__(self, workers):
+        self.queue = queue.Queue()
+        self.finished = collections.deque()
+        self.progress: dict = {}
+        self.items: set = set()
+        self.workers = workers
+        self.threads: list[threading.Thread] = []
+
+    def submit(self, playlist, paths, idx=-1):
+        files = []
+        for path in paths:
+            if os.path.isdir(path[0] if isinstance(path, list) else path):
+                self.scan(playlist, path)
+            else:
+                files.append(path)
+        self.add_placeholders(playlist, files, idx)
+
+    def scan(self, playlist, folder, route=None, recursive=True):
+        # the folders stream in as they are listed, the route decides where their tracks go
+        progress = self.progress.setdefault(playlist, IngestProgress())
+        progress.scanning += 1
+        self.put(("scan", playlist, (pathlib.Path(folder), route, recursive)))
+
+    def add_placeholders(self, playlist, paths, idx=-1):
+        progress = self.progress.setdefault(playlist, IngestProgress())
+        musics = []
+        for path in paths:
+            music = playlist.add_placeholder(path, idx)
+            if music is None:
+                continue
+            if idx != -1:
+                idx += 1
+            progress.total += 1
+            musics.append(music)
+            self.items.add(music)
+            self.put(("probe", playlist, music))
+        if progress.finished:
+            self.progress.pop(playlist)
+        return musics
+
+    def put(self, item):
+        self.queue.put(item)
+        if len(self.threads) < self.workers:
+            thread = threading.Thread(target=self.worker_loop, daemon=True)
+            self.threads.append(thread)
+            thread.start()
+
+    def cancel_playlist(self, playlist):
+        self.progress.pop(playlist, None)
+        self.items = {music for music in self.items if music.playlist is not playlist}
+
+    def is_ingesting(self, music):
+        return music in self.items
+
+    def get_progress(self, playlist) -> IngestProgress | None:
+        return self.progress.get(playlist, None)
+
+    def worker_loop(self):
+        while True:
+            stage, playlist, value = self.queue.get()
+            if playlist not in self.progress:
+                continue
+            if stage == "scan":
+                root, route, recursive = value
+                with PROFILER.phase(f"ingest scan '{root}'"):
+                    for folder, files in scan_tree(root, recursive):
+                        if playlist not in self.progress:
+                            break
+                        self.finished.append(
+                            ("scanned", playlist, (folder, files, route), None)
+                        )
+                self.finished.append((stage, playlist, None, None))
+                continue
+            # opening the clips is what used to freeze the window, the rest is cheap in comparison
+            try:
+                result = (value.prepare(), None)
+            except Exception as e:
+                result = (None, e)
+            PROFILER.count("ingested_tracks")
+            self.finished.append((stage, playlist, value, result))
+
+    def update(self):
+        while len(self.finished) > 0:
+            stage, playlist, value, result = self.finished.popleft()
+            progress = self.progress.get(playlist, None)
+            if progress is None:
+                if result is not None and result[0] is not None:
+                    result[0].close()
+                continue
+            if stage == "scanned":
+                folder, files, route = value
+                progress.found += len(files)
+                if route is None:
+                    self.add_placeholders(playlist, files)
+                else:
+                    route(folder, files)
+                continue
+            if stage == "scan":
+                progress.scanning -= 1
+                if progress.finished:
+                    self.progress.pop(playlist)
+                continue
+            self.items.discard(value)
+            playlist.finish_placeholder(value, *result)
+            progress.done += 1
+            if progress.finished:
+                self.progress.pop(playlist)
+
+
+INGEST = IngestPipeline(INGEST_WORKERS)
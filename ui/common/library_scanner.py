@@ -0,0 +1,40 @@
+import concurrent.futures
+import os
+import pathlib
+
+from ui.common import FORMATS
+
+SCAN_WORKERS = 8
+
+
+def scan_directory(folder: pathlib.Path):
+    files, subfolders = [], []
+    try:
+        with os.scandir(folder) as it:
+            for entry in it:
+                try:
+                    # symlinked folders are skipped, they could loop back into the tree
+                    if entry.is_dir(follow_symlinks=False):
+                        subfolders.append(folder / entry.name)
+                    elif os.path.splitext(entry.name)[1][1:].lower() in FORMATS:
+                        files.append(folder / entry.name)
+                except OSError:
+                    continue
+    except OSError:
+        ...
+    files.sort()
+    subfolders.sort()
+    return folder, files, subfolders
+
+
+def scan_tree(root, recursive=True):
+    # a network mount is latency bound, listing a whole level at once hides the round trips
+    level = [pathlib.Path(root).resolve()]
+    with concurrent.futures.ThreadPoolExecutor(SCAN_WORKERS) as executor:
+        while len(level) > 0:
+            next_level = []
+            for folder, files, subfolders in executor.map(scan_directory, level):
+                yield folder, files
+                if recursive:
+                    next_level.extend(subfolders)
+            level = next_level
@@ -0,0 +1,228 @@
+import array
+import json
+import math
+import os
+import struct
+import sys
+
+from ui.common import load_json
+from ui.common.persistence import PERSISTENCE, write_atomic
+from ui.common.profiler import PROFILER
+
+SNAPSHOT_PATH = "data/library.bin"
+SNAPSHOT_MAGIC = b"MILS"
+SNAPSHOT_VERSION = 2
+PLAYLISTS_PATH = "data/playlists.json"
+HISTORY_PATH = "data/history.json"
+NO_STRING = 0xFFFFFFFF
+HEADER = struct.Struct("<4sHQqQqIIIII")
+PLAYLIST = struct.Struct("<IIIII")
+HISTORY = struct.Struct("<IIIdd")
+TRACK_CONVERTED = 0x80000000
+
+
+def file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def source_stamp(path, content):
+    # only a json file the writer left with exactly this content can be mirrored
+    if PERSISTENCE.snapshots.get(path, None) != json.dumps(content):
+        return None
+    return file_stamp(path)
+
+
+def split_path(path):
+    # the prefix keeps its trailing separator, joining them back is a plain concatenation
+    name = os.path.basename(path)
+    return path[: len(path) - len(name)], name
+
+
+class StringTable:
+    def __init__(self):
+        self.strings: list[str] = []
+        self.indices: dict[str, int] = {}
+
+    def intern(self, string):
+        if string is None:
+            return NO_STRING
+        idx = self.indices.get(string, None)
+        if idx is None:
+            idx = self.indices[string] = len(self.strings)
+            self.strings.append(string)
+        return idx
+
+    def encode(self):
+        return "\0".join(self.strings).encode()
+
+
+def decode_strings(data, offset, size):
+    if size <= 0:
+        return []
+    return data[offset : offset + size].decode().split("\0")
+
+
+def encode_snapshot(playlists_data, history_data, stamps):
+    # tracks share their folders, each prefix is stored once and the records point to it
+    texts, prefixes, names = StringTable(), StringTable(), StringTable()
+    records = []
+    for pdata in playlists_data:
+        tracks = array.array("I")
+        for path in pdata["paths"]:
+            converted = isinstance(path, list)
+            prefix, name = split_path(path[0] if converted else path)
+            tracks.append(prefixes.intern(prefix) | (TRACK_CONVERTED * converted))
+            tracks.append(names.intern(name))
+        if sys.byteorder == "big":
+            tracks.byteswap()
+        shuffle = pdata.get("shuffle", None)
+        records.append(
+            PLAYLIST.pack(
+                texts.intern(pdata["name"]),
+                texts.intern(pdata["folder"]),
+                texts.intern(json.dumps(pdata["groups"])),
+                texts.intern(None if shuffle is None else json.dumps(shuffle)),
+                len(pdata["paths"]),
+            )
+        )
+        records.append(tracks.tobytes())
+    for hdata in history_data:
+        prefix, name = split_path(hdata["audiopath"])
+        duration = hdata["duration"]
+        records.append(
+            HISTORY.pack(
+                texts.intern(hdata["playlist"]),
+                prefixes.intern(prefix),
+                names.intern(name),
+                hdata["position"],
+                # nan stands for a duration that wasn't cached, -1 for no duration at all
+                math.nan
+                if duration == "not cached"
+                else -1
+                if duration is None
+                else duration,
+            )
+        )
+    blobs = [texts.encode(), prefixes.encode(), names.encode()]
+    header = HEADER.pack(
+        SNAPSHOT_MAGIC,
+        SNAPSHOT_VERSION,
+        *stamps[0],
+        *stamps[1],
+        *[len(blob) for blob in blobs],
+        len(playlists_data),
+        len(history_data),
+    )
+    return b"".join([header, *blobs, *records])
+
+
+def decode_snapshot(data: bytes):
+    (
+        magic,
+        version,
+        playlists_size,
+        playlists_mtime,
+        history_size,
+        history_mtime,
+        texts_size,
+        prefixes_size,
+        names_size,
+        playlists,
+        histories,
+    ) = HEADER.unpack_from(data)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        return None
+    # the json files stay the source of truth, once they change the snapshot is ignored
+    stamps = [(playlists_size, playlists_mtime), (history_size, history_mtime)]
+    if [file_stamp(PLAYLISTS_PATH), file_stamp(HISTORY_PATH)] != stamps:
+        return None
+    offset = HEADER.size
+    texts = decode_strings(data, offset, texts_size)
+    offset += texts_size
+    prefixes = decode_strings(data, offset, prefixes_size)
+    offset += prefixes_size
+    names = decode_strings(data, offset, names_size)
+    offset += names_size
+
+    playlists_data = []
+    for _ in range(playlists):
+        name, folder, groups, shuffle, count = PLAYLIST.unpack_from(data, offset)
+        offset += PLAYLIST.size
+        tracks = array.array("I")
+        tracks.frombytes(data[offset : offset + tracks.itemsize * count * 2])
+        offset += tracks.itemsize * count * 2
+        if sys.byteorder == "big":
+            tracks.byteswap()
+        records = iter(tracks)
+        playlists_data.append(
+            {
+                "name": texts[name],
+                "paths": [
+                    [prefixes[prefix ^ TRACK_CONVERTED] + names[idx], "converted"]
+                    if prefix & TRACK_CONVERTED
+                    else prefixes[prefix] + names[idx]
+                    for prefix, idx in zip(records, records)
+                ],
+                "groups": json.loads(texts[groups]),
+                "folder": None if folder == NO_STRING else texts[folder],
+                "shuffle": None if shuffle == NO_STRING else json.loads(texts[shuffle]),
+            }
+        )
+    history_data = []
+    for playlist, prefix, idx, position, duration in HISTORY.iter_unpack(
+        data[offset : offset + HISTORY.size * histories]
+    ):
+        history_data.append(
+            {
+                "audiopath": prefixes[prefix] + names[idx],
+                "position": position,
+                "playlist": texts[playlist],
+                "duration": "not cached"
+                if math.isnan(duration)
+                else None
+                if duration < 0
+                else duration,
+            }
+        )
+    return playlists_data, history_data
+
+
+def write_snapshot(playlists_data, history_data):
+    stamps = [
+        source_stamp(PLAYLISTS_PATH, playlists_data),
+        source_stamp(HISTORY_PATH, history_data),
+    ]
+    if None in stamps:
+        # a newer save is still queued, its own snapshot follows it
+        return
+    data = encode_snapshot(playlists_data, history_data, stamps)
+    if PERSISTENCE.snapshots.get(SNAPSHOT_PATH, None) == data:
+        PROFILER.count("stores_unchanged")
+        return
+    write_atomic(SNAPSHOT_PATH, data)
+    PERSISTENCE.snapshots[SNAPSHOT_PATH] = data
+    PROFILER.count("stores_written")
+
+
+def read_snapshot():
+    if not os.path.exists(SNAPSHOT_PATH):
+        return None
+    with open(SNAPSHOT_PATH, "rb") as file:
+        data = file.read()
+    try:
+        return decode_snapshot(data)
+    except (struct.error, UnicodeDecodeError, IndexError, ValueError):
+        return None
+
+
+def load_library(use_snapshot=True):
+    # both formats give back the saved entries, the playlists turn them into paths when needed
+    if use_snapshot:
+        snapshot = read_snapshot()
+        if snapshot is not None:
+            return snapshot
+    return load_json(PLAYLISTS_PATH, []), load_json(HISTORY_PATH, [])
@@ -0,0 +1,58 @@
+import time
+
+from ui.common.persistence import PERSISTENCE
+
+LOAD_ERRORS_PATH = "data/load_errors.log"
+
+
+def append_log(lines):
+    with open(LOAD_ERRORS_PATH, "a", encoding="utf-8") as file:
+        file.write("".join(f"{line}\n" for line in lines))
+
+
+class LoadError:
+    def __init__(self, playlist, path, message, missing):
+        self.playlist = playlist
+        self.path = path
+        self.message = message
+        self.missing = missing
+
+    @property
+    def realpath(self):
+        return self.path[0] if isinstance(self.path, list) else self.path
+
+
+class LoadErrorReport:
+    def __init__(self):
+        self.errors: list[LoadError] = []
+        self.unlogged: list[str] = []
+        self.unseen = False
+
+    def add(self, playlist, path, message, missing=False):
+        # collected instead of shown right away, a broken library would mean one dialog per track
+        self.errors.append(LoadError(playlist, path, message, missing))
+        self.unlogged.append(
+            f"{time.strftime('%Y-%m-%d %H:%M:%S')} [{playlist.name}] {message}"
+        )
+        self.unseen = True
+
+    def update(self):
+        if len(self.unlogged) > 0:
+            PERSISTENCE.submit(append_log, self.unlogged)
+            self.unlogged = []
+
+    def prune(self, playlists):
+        # relocated tracks left the missing list of their playlist, their errors are solved
+        self.errors = [
+            error
+            for error in self.errors
+            if error.playlist in playlists
+            and (not error.missing or error.path in error.playlist.missing)
+        ]
+
+    def clear(self):
+        self.errors = []
+        self.unseen = False
+
+
+LOAD_ERRORS = LoadErrorReport()
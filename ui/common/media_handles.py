@@ -0,0 +1,121 @@
+import collections
+import contextlib
+import threading
+
+from ui.common.profiler import PROFILER
+
+MAX_OPEN_CLIPS = 16
+
+
+class MediaHandle:
+    def __init__(self, pool: "MediaHandlePool", opener, path):
+        self.pool = pool
+        self.opener = opener
+        self.path = path
+        self.clip = None
+        self.pins = 0
+        self.opening = False
+        self.closed = False
+
+    @contextlib.contextmanager
+    def use(self):
+        # a pinned clip is never closed by the pool, an evicted one is reopened here
+        clip = self.pool.pin(self)
+        try:
+            yield clip
+        finally:
+            self.pool.unpin(self)
+
+    def close(self):
+        self.pool.release(self)
+
+
+class MediaHandlePool:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.handles: collections.OrderedDict[MediaHandle, None] = (
+            collections.OrderedDict()
+        )
+        self.condition = threading.Condition()
+        self.peak = 0
+
+    @property
+    def live(self):
+        return len(self.handles)
+
+    def open(self, opener, path) -> MediaHandle:
+        # opening right away surfaces errors to the producer instead of the consumer
+        handle = MediaHandle(self, opener, path)
+        try:
+            with handle.use():
+                ...
+        except Exception:
+            handle.close()
+            raise
+        return handle
+
+    def pin(self, handle: MediaHandle):
+        with self.condition:
+            if handle.closed:
+                raise ValueError(f"The media handle for '{handle.path}' is closed")
+            handle.pins += 1
+            # another thread opening the same clip is waited for, a second reader would leak
+            while handle.opening:
+                self.condition.wait()
+            if handle in self.handles:
+                self.handles.move_to_end(handle)
+                return handle.clip
+            handle.opening = True
+            self.reserve()
+            self.handles[handle] = None
+            self.peak = max(self.peak, len(self.handles))
+        try:
+            clip = handle.opener(handle.path)
+        except Exception:
+            with self.condition:
+                handle.opening = False
+                handle.pins -= 1
+                self.handles.pop(handle, None)
+                self.condition.notify_all()
+            raise
+        PROFILER.count("clips_opened")
+        with self.condition:
+            handle.clip = clip
+            handle.opening = False
+            self.condition.notify_all()
+        return clip
+
+    def reserve(self):
+        # the least recently used idle clip makes room, producers wait when every clip is in use
+        while len(self.handles) >= self.capacity:
+            for handle in self.handles:
+                if handle.pins <= 0 and handle.clip is not None:
+                    self.evict(handle)
+                    PROFILER.count("clips_evicted")
+                    break
+            else:
+                PROFILER.count("clip_waits")
+                self.condition.wait()
+
+    def evict(self, handle: MediaHandle):
+        self.handles.pop(handle, None)
+        if handle.clip is not None:
+            handle.clip.close()
+            handle.clip = None
+
+    def unpin(self, handle: MediaHandle):
+        with self.condition:
+            handle.pins -= 1
+            if handle.closed and handle.pins <= 0:
+                self.evict(handle)
+            self.condition.notify_all()
+
+    def release(self, handle: MediaHandle):
+        with self.condition:
+            handle.closed = True
+            if handle.pins <= 0:
+                self.evict(handle)
+            self.condition.notify_all()
+
+
+MEDIA_HANDLES = MediaHandlePool(MAX_OPEN_CLIPS)
@@ -0,0 +1,222 @@
+import hashlib
+import os
+import sqlite3
+import threading
+
+MEDIA_COLUMNS = (
+    "realpath",
+    "size",
+    "mtime",
+    "duration",
+    "kind",
+    "has_audio",
+    "digest",
+)
+DIGEST_CHUNK = 1024 * 1024
+
+
+def file_digest(path, size):
+    # artifacts are shared and duplicates skipped by digest, a sample could match different files
+    digest = hashlib.blake2b(size.to_bytes(8, "little"), digest_size=16)
+    with open(path, "rb") as file:
+        while chunk := file.read(DIGEST_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaIndex:
+    def __init__(self):
+        self.path = None
+        self.connection: sqlite3.Connection = None
+        self.records: dict[str, dict] = {}
+        self.artifacts: dict[str, bool] = {}
+        self.dirty_records: set[str] = set()
+        self.dirty_artifacts: set[str] = set()
+        self.lock = threading.RLock()
+
+    def open(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS media (realpath TEXT PRIMARY KEY, size INTEGER, "
+            "mtime INTEGER, duration REAL, kind TEXT, has_audio INTEGER, digest TEXT)"
+        )
+        columns = [
+            row[1] for row in self.connection.execute("PRAGMA table_info(media)")
+        ]
+        if "digest" not in columns:
+            self.connection.execute("ALTER TABLE media ADD COLUMN digest TEXT")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS artifacts (path TEXT PRIMARY KEY, present INTEGER)"
+        )
+        self.connection.commit()
+        with self.lock:
+            self.records = {
+                row[0]: self.make_record(*row)
+                for row in self.connection.execute(
+                    f"SELECT {', '.join(MEDIA_COLUMNS)} FROM media"
+                )
+            }
+            self.artifacts = {
+                path: bool(present)
+                for path, present in self.connection.execute(
+                    "SELECT path, present FROM artifacts"
+                )
+            }
+
+    def make_record(
+        self,
+        realpath,
+        size,
+        mtime,
+        duration=None,
+        kind=None,
+        has_audio=None,
+        digest=None,
+    ):
+        return {
+            "realpath": realpath,
+            "size": size,
+            "mtime": mtime,
+            "duration": duration,
+            "kind": kind,
+            "has_audio": None if has_audio is None else bool(has_audio),
+            "digest": digest,
+        }
+
+    def lookup(self, realpath):
+        # a single stat replaces the exists check and validates the cached facts
+        key = str(realpath)
+        try:
+            stat = os.stat(key)
+        except OSError:
+            return None
+        with self.lock:
+            record = self.records.get(key)
+            if (
+                record is None
+                or record["size"] != stat.st_size
+                or record["mtime"] != stat.st_mtime_ns
+            ):
+                record = self.make_record(key, stat.st_size, stat.st_mtime_ns)
+                self.records[key] = record
+                self.dirty_records.add(key)
+            return record
+
+    def update(self, realpath, **facts):
+        key = str(realpath)
+        with self.lock:
+            record = self.records.get(key)
+            if record is None:
+                record = self.lookup(key)
+                if record is None:
+                    return
+            record.update(facts)
+            self.dirty_records.add(key)
+
+    def digest(self, record):
+        if record["digest"] is None:
+            try:
+                digest = file_digest(record["realpath"], record["size"])
+            except OSError:
+                return None
+            with self.lock:
+                record["digest"] = digest
+                self.dirty_records.add(record["realpath"])
+        return record["digest"]
+
+    def cached_digest(self, realpath):
+        with self.lock:
+            record = self.records.get(str(realpath), None)
+            return None if record is None else record["digest"]
+
+    def rename(self, old_realpath, new_realpath):
+        # renaming keeps size and mtime, so everything known about the file stays valid
+        old_key, new_key = str(old_realpath), str(new_realpath)
+        with self.lock:
+            record = self.records.pop(old_key, None)
+            if record is None:
+                return
+            record["realpath"] = new_key
+            self.records[new_key] = record
+            self.dirty_records.add(old_key)
+            self.dirty_records.add(new_key)
+
+    def forget(self, realpath):
+        key = str(realpath)
+        with self.lock:
+            if key in self.records:
+                self.records.pop(key)
+                self.dirty_records.add(key)
+
+    def artifact_exists(self, path):
+        key = os.path.abspath(path)
+        with self.lock:
+            present = self.artifacts.get(key, None)
+            if present is None:
+                present = os.path.exists(key)
+                self.set_artifact(key, present)
+            return present
+
+    def set_artifact(self, path, present=True):
+        key = os.path.abspath(path)
+        with self.lock:
+            if self.artifacts.get(key, None) is present:
+                return
+            self.artifacts[key] = present
+            self.dirty_artifacts.add(key)
+
+    def remove_artifact(self, path):
+        if os.path.exists(path):
+            os.remove(path)
+        self.set_artifact(path, False)
+
+    def rename_artifact(self, old_path, new_path):
+        if os.path.exists(old_path) and not os.path.exists(new_path):
+            os.rename(old_path, new_path)
+            self.set_artifact(old_path, False)
+            self.set_artifact(new_path, True)
+
+    def flush(self):
+        if self.connection is None:
+            return
+        with self.lock:
+            if not self.dirty_records and not self.dirty_artifacts:
+                return
+            records = [
+                self.records[key] for key in self.dirty_records if key in self.records
+            ]
+            removed = [(key,) for key in self.dirty_records if key not in self.records]
+            artifacts = [
+                (key, int(self.artifacts[key])) for key in self.dirty_artifacts
+            ]
+            self.dirty_records = set()
+            self.dirty_artifacts = set()
+            self.connection.executemany(
+                f"INSERT OR REPLACE INTO media ({', '.join(MEDIA_COLUMNS)}) VALUES ({', '.join('?' * len(MEDIA_COLUMNS))})",
+                [
+                    tuple(
+                        int(record[col])
+                        if col == "has_audio" and record[col] is not None
+                        else record[col]
+                        for col in MEDIA_COLUMNS
+                    )
+                    for record in records
+                ],
+            )
+            self.connection.executemany("DELETE FROM media WHERE realpath = ?", removed)
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO artifacts (path, present) VALUES (?, ?)",
+                artifacts,
+            )
+            self.connection.commit()
+
+    def close(self):
+        if self.connection is None:
+            return
+        self.flush()
+        self.connection.close()
+        self.connection = None
+
+
+MEDIA_INDEX = MediaIndex()
@@ -0,0 +1,331 @@
+import collections
+import itertools
+import os
+import queue
+import struct
+import threading
+
+from ui.common.media_handles import MEDIA_HANDLES
+from ui.common.media_index import MEDIA_INDEX
+from ui.common.profiler import PROFILER
+
+PROBE_URGENT = 0
+PROBE_PREFETCH = 1
+PROBE_WORKERS = 2
+OGG_TAIL_SIZE = 65536
+MP3_SYNC_WINDOW = 65536
+
+MP3_BITRATES = {
+    (3, 3): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (3, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (3, 1): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 3): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 1): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    0: [11025, 12000, 8000],
+}
+
+
+def skip_id3(file):
+    header = file.read(10)
+    if len(header) == 10 and header[:3] == b"ID3":
+        size = 0
+        for byte in header[6:10]:
+            size = (size << 7) | (byte & 0x7F)
+        # the footer flag adds a copy of the header at the end of the tag
+        return 10 + size + (10 if header[5] & 0x10 else 0)
+    return 0
+
+
+def probe_wav(file):
+    riff = file.read(12)
+    if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:12] != b"WAVE":
+        return None
+    byte_rate = None
+    while True:
+        chunk = file.read(8)
+        if len(chunk) < 8:
+            return None
+        name, size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+        if name == b"fmt ":
+            fmt = file.read(size + size % 2)
+            byte_rate = struct.unpack("<I", fmt[8:12])[0]
+        elif name == b"data":
+            if not byte_rate:
+                return None
+            # streamed writers leave the size unset, the rest of the file is the data then
+            remaining = os.fstat(file.fileno()).st_size - file.tell()
+            return min(size, remaining) / byte_rate
+        else:
+            file.seek(size + size % 2, os.SEEK_CUR)
+
+
+def extended_to_float(data):
+    exponent = ((data[0] << 8) | data[1]) & 0x7FFF
+    mantissa = int.from_bytes(data[2:10], "big")
+    if exponent == 0 and mantissa == 0:
+        return 0
+    return mantissa * 2.0 ** (exponent - 16383 - 63)
+
+
+def probe_aiff(file):
+    form = file.read(12)
+    if len(form) < 12 or form[:4] != b"FORM" or form[8:12] not in [b"AIFF", b"AIFC"]:
+        return None
+    while True:
+        chunk = file.read(8)
+        if len(chunk) < 8:
+            return None
+        name, size = chunk[:4], struct.unpack(">I", chunk[4:])[0]
+        if name == b"COMM":
+            comm = file.read(18)
+            frames = struct.unpack(">I", comm[2:6])[0]
+            rate = extended_to_float(comm[8:18])
+            return frames / rate if rate else None
+        file.seek(size + size % 2, os.SEEK_CUR)
+
+
+def probe_flac(file):
+    file.seek(skip_id3(file))
+    if file.read(4) != b"fLaC":
+        return None
+    header = file.read(4)
+    if len(header) < 4 or header[0] & 0x7F != 0:
+        return None
+    info = file.read(34)
+    if len(info) < 34:
+        return None
+    value = int.from_bytes(info[10:18], "big")
+    rate, samples = value >> 44, value & ((1 << 36) - 1)
+    if not rate or not samples:
+        return None
+    return samples / rate
+
+
+def parse_mp3_frame(data, i):
+    if i + 4 > len(data) or data[i] != 0xFF or data[i + 1] & 0xE0 != 0xE0:
+        return None
+    version, layer = (data[i + 1] >> 3) & 3, (data[i + 1] >> 1) & 3
+    bitrate_idx, rate_idx = data[i + 2] >> 4, (data[i + 2] >> 2) & 3
+    if version == 1 or layer == 0 or bitrate_idx in [0, 15] or rate_idx == 3:
+        return None
+    rate = MP3_SAMPLE_RATES[version][rate_idx]
+    bitrate = MP3_BITRATES[(3 if version == 3 else 2, layer)][bitrate_idx] * 1000
+    padding = (data[i + 2] >> 1) & 1
+    if layer == 3:
+        samples, length = 384, (12 * bitrate // rate + padding) * 4
+    elif layer == 1 and version != 3:
+        samples, length = 576, 72 * bitrate // rate + padding
+    else:
+        samples, length = 1152, 144 * bitrate // rate + padding
+    if version == 3:
+        side_info = 17 if data[i + 3] >> 6 == 3 else 32
+    else:
+        side_info = 9 if data[i + 3] >> 6 == 3 else 17
+    return rate, bitrate, samples, length, side_info
+
+
+def probe_mp3(file):
+    start = skip_id3(file)
+    file.seek(start)
+    data = file.read(MP3_SYNC_WINDOW)
+    i = data.find(b"\xff")
+    while i != -1:
+        frame = parse_mp3_frame(data, i)
+        # a lone sync pattern inside garbage is ruled out by requiring the next frame to follow
+        if frame is not None and (
+            i + frame[3] + 4 > len(data) or parse_mp3_frame(data, i + frame[3])
+        ):
+            break
+        i = data.find(b"\xff", i + 1)
+    else:
+        return None
+    rate, bitrate, samples, _, side_info = frame
+    # a vbr encoder stores the frame count in the first frame, either as a xing or a vbri header
+    xing = i + 4 + side_info
+    if data[xing : xing + 4] in [b"Xing", b"Info"]:
+        flags = struct.unpack(">I", data[xing + 4 : xing + 8])[0]
+        if flags & 1:
+            frames = struct.unpack(">I", data[xing + 8 : xing + 12])[0]
+            return frames * samples / rate
+    vbri = i + 4 + 32
+    if data[vbri : vbri + 4] == b"VBRI":
+        frames = struct.unpack(">I", data[vbri + 14 : vbri + 18])[0]
+        return frames * samples / rate
+    size = os.fstat(file.fileno()).st_size
+    if size >= 128:
+        file.seek(-128, os.SEEK_END)
+        if file.read(3) == b"TAG":
+            size -= 128
+    return (size - start - i) * 8 / bitrate
+
+
+def probe_ogg(file):
+    page = file.read(27)
+    if len(page) < 27 or page[:4] != b"OggS":
+        return None
+    file.seek(page[26], os.SEEK_CUR)
+    packet = file.read(20)
+    if packet[:7] == b"\x01vorbis":
+        rate, pre_skip = struct.unpack("<I", packet[12:16])[0], 0
+    elif packet[:8] == b"OpusHead":
+        # opus granules always count 48kHz samples, including the encoder delay
+        rate, pre_skip = 48000, struct.unpack("<H", packet[10:12])[0]
+    else:
+        return None
+    size = os.fstat(file.fileno()).st_size
+    file.seek(max(0, size - OGG_TAIL_SIZE))
+    tail = file.read()
+    i = len(tail)
+    while True:
+        i = tail.rfind(b"OggS", 0, i)
+        if i == -1 or i + 14 > len(tail):
+            return None
+        granule = struct.unpack("<q", tail[i + 6 : i + 14])[0]
+        if granule >= 0:
+            return max(0, granule - pre_skip) / rate
+
+
+HEADER_PROBES = {
+    "wav": probe_wav,
+    "aiff": probe_aiff,
+    "aif": probe_aiff,
+    "flac": probe_flac,
+    "mp3": probe_mp3,
+    "ogg": probe_ogg,
+    "opus": probe_ogg,
+}
+
+
+def probe_header(path):
+    probe = HEADER_PROBES.get(os.path.splitext(str(path))[1].lower()[1:], None)
+    if probe is None:
+        return None
+    try:
+        with open(path, "rb") as file:
+            duration = probe(file)
+    except (OSError, struct.error, IndexError, KeyError, ZeroDivisionError):
+        return None
+    if duration is None or duration <= 0:
+        return None
+    return duration
+
+
+def probe_duration(path):
+    duration = probe_header(path)
+    if duration is not None:
+        PROFILER.count("durations_from_header")
+        return duration
+    # containers without a parser still need a decoder, which is why this runs off the main thread
+    import moviepy
+
+    PROFILER.count("moviepy_clips")
+    try:
+        audiofile = MEDIA_HANDLES.open(moviepy.AudioFileClip, str(path))
+    except Exception:
+        return None
+    try:
+        # using the handle reopens the clip when it was evicted, which can fail as well
+        with audiofile.use() as clip:
+            return clip.duration
+    except Exception:
+        return None
+    finally:
+        audiofile.close()
+
+
+class ProbeRequest:
+    def __init__(self, music, priority, order):
+        self.music = music
+        self.priority = priority
+        self.order = order
+        self.running = False
+
+    @property
+    def sort_key(self):
+        return (self.priority, self.order)
+
+
+class DurationProber:
+    def __init__(self, workers):
+        self.queue = queue.PriorityQueue()
+        self.requests: dict = {}
+        self.finished = collections.deque()
+        self.workers = workers
+        self.threads: list[threading.Thread] = []
+        self.counter = itertools.count()
+        self.lock = threading.Lock()
+
+    def request(self, music, priority=PROBE_PREFETCH):
+        with self.lock:
+            request = self.requests.get(music, None)
+            if request is not None:
+                if request.running or request.priority <= priority:
+                    return
+                request.priority = priority
+                request.order = next(self.counter)
+            else:
+                request = ProbeRequest(music, priority, next(self.counter))
+                self.requests[music] = request
+            self.queue.put((*request.sort_key, request))
+            if len(self.threads) < self.workers:
+                thread = threading.Thread(target=self.worker_loop, daemon=True)
+                self.threads.append(thread)
+                thread.start()
+
+    def request_many(self, musics, priority=PROBE_PREFETCH):
+        for music in musics:
+            self.request(music, priority)
+
+    def cancel_playlist(self, playlist):
+        with self.lock:
+            for music in list(self.requests.keys()):
+                if music.playlist is playlist:
+                    self.requests.pop(music)
+
+    def is_probing(self, music):
+        return music in self.requests
+
+    def worker_loop(self):
+        while True:
+            priority, order, request = self.queue.get()
+            with self.lock:
+                if (
+                    self.requests.get(request.music, None) is not request
+                    or request.running
+                    or (priority, order) != request.sort_key
+                ):
+                    continue
+                request.running = True
+            try:
+                duration = self.probe(request.music)
+            except Exception:
+                # the request still has to finish, the track just shows no duration
+                duration = None
+            self.finished.append((request, duration))
+
+    def probe(self, music):
+        record = MEDIA_INDEX.lookup(music.realpath)
+        if record is not None and record["duration"] is not None:
+            return record["duration"]
+        # a pending conversion has no audio file yet, the source has the same length
+        duration = probe_duration(music.realpath if music.pending else music.audiopath)
+        if duration is not None and record is not None:
+            MEDIA_INDEX.update(music.realpath, duration=duration)
+        return duration
+
+    def update(self):
+        while len(self.finished) > 0:
+            request, duration = self.finished.popleft()
+            with self.lock:
+                if self.requests.get(request.music, None) is not request:
+                    continue
+                self.requests.pop(request.music)
+            request.music.set_probed_duration(duration)
+
+
+DURATION_PROBER = DurationProber(PROBE_WORKERS)
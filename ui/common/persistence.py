@@ -0,0 +1,92 @@
+import json
+import os
+import queue
+import threading
+
+import pygame
+
+from ui.common.profiler import PROFILER
+
+
+def write_atomic(path, text):
+    # a crash mid-write only ever loses the temporary file, never the previous snapshot
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb" if isinstance(text, bytes) else "w") as file:
+        file.write(text)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, path)
+
+
+def save_missing_covers(covers):
+    for surface, path in covers:
+        if not os.path.exists(path):
+            pygame.image.save(surface, path)
+
+
+def clean_yt_temp(thumbs, channels):
+    if not os.path.exists("data/yt_temp"):
+        return
+    for file in os.listdir("data/yt_temp"):
+        name = file.removesuffix(".png").removesuffix(".jpg")
+        if name.startswith("channel_"):
+            if name.removeprefix("channel_") not in channels:
+                os.remove(f"data/yt_temp/{file}")
+        else:
+            if name not in thumbs:
+                os.remove(f"data/yt_temp/{file}")
+
+
+class PersistenceWriter:
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.pending: dict[str, object] = {}
+        self.snapshots: dict[str, str] = {}
+        self.thread: threading.Thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, task, *args):
+        self.queue.put((task, args))
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.worker_loop, daemon=True)
+            self.thread.start()
+
+    def save_json(self, path, content):
+        # the content must be a fresh snapshot, it is serialized later on the writer thread
+        with self.lock:
+            queued = path in self.pending
+            self.pending[path] = content
+        if not queued:
+            self.submit(self.write_store, path)
+
+    def write_store(self, path):
+        with self.lock:
+            content = self.pending.pop(path)
+        text = json.dumps(content)
+        if path not in self.snapshots and os.path.exists(path):
+            with open(path, "r") as file:
+                self.snapshots[path] = file.read()
+        if self.snapshots.get(path, None) == text:
+            PROFILER.count("stores_unchanged")
+            return
+        write_atomic(path, text)
+        self.snapshots[path] = text
+        PROFILER.count("stores_written")
+
+    def worker_loop(self):
+        while True:
+            task, args = self.queue.get()
+            try:
+                task(*args)
+            except (OSError, TypeError, ValueError, pygame.error) as e:
+                # the writer has to outlive a failed store, the next save retries it
+                print(f"Could not save data: '{e}'")
+            finally:
+                self.queue.task_done()
+
+    def drain(self):
+        if self.thread is not None:
+            self.queue.join()
+
+
+PERSISTENCE = PersistenceWriter()
@@ -0,0 +1,105 @@
+import contextlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+PROFILE_FLAG = "--profile-startup"
+PROFILE_PATH = "data/startup_profile.json"
+
+
+class StartupProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.setting = False
+        self.start_time = 0
+        self.phases: list[dict] = []
+        self.counters: dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.first_frame = None
+
+    def start(self, argv):
+        # settings are loaded after a few phases already ran, so the setting is peeked here
+        if os.path.exists("data/settings.json"):
+            try:
+                with open("data/settings.json", "r") as file:
+                    self.setting = bool(json.load(file).get("profile_startup", False))
+            except (OSError, ValueError, AttributeError):
+                self.setting = False
+        self.enabled = PROFILE_FLAG in argv or self.setting
+        self.start_time = time.perf_counter()
+        if self.enabled:
+            tracemalloc.start()
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        memory = tracemalloc.get_traced_memory()[0]
+        try:
+            yield
+        finally:
+            self.phases.append(
+                {
+                    "name": name,
+                    "start": round(start - self.start_time, 5),
+                    "time": round(time.perf_counter() - start, 5),
+                    "allocated": tracemalloc.get_traced_memory()[0] - memory,
+                }
+            )
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            # the workers count too, from their own threads
+            with self.lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def frame(self):
+        # called at the start of update, the second call means the first frame was presented
+        if not self.enabled or self.first_frame is not None:
+            return
+        self.frames += 1
+        if self.frames >= 2:
+            self.first_frame = round(time.perf_counter() - self.start_time, 5)
+            # tracing slows every allocation, the session after startup runs without it
+            self.finish()
+
+    def get_report(self):
+        current, peak = tracemalloc.get_traced_memory()
+        with self.lock:
+            counters = dict(self.counters)
+        return {
+            "first_frame": self.first_frame,
+            "phases": self.phases,
+            "counters": counters,
+            "memory_current": current,
+            "memory_peak": peak,
+        }
+
+    def finish(self):
+        if not self.enabled:
+            return
+        report = self.get_report()
+        tracemalloc.stop()
+        self.enabled = False
+        with open(PROFILE_PATH, "w") as file:
+            json.dump(report, file, indent=4)
+        print("Startup profile:")
+        for phase in report["phases"]:
+            print(
+                f"  {phase['name']}: {phase['time'] * 1000:.1f} ms, "
+                f"{phase['allocated'] / 1024:.0f} KiB"
+            )
+        for name, amount in report["counters"].items():
+            print(f"  {name}: {amount}")
+        if report["first_frame"] is not None:
+            print(f"  first frame: {report['first_frame'] * 1000:.1f} ms")
+        print(f"  memory peak: {report['memory_peak'] / 1024 / 1024:.1f} MiB")
+        print(f"Report written to '{PROFILE_PATH}'")
+
+
+PROFILER = StartupProfiler()
@@ -0,0 +1,102 @@
+import os
+
+from ui.common.conversion import CONVERSION_QUEUE, PREVIEW_SUFFIX, remove_partial
+from ui.common.seek_stream import SEEK_STREAMS, read_seek_table
+
+PREVIEW_START = 2
+PREVIEW_FOLDER = "data/mp3_converted"
+
+
+def clean_previews():
+    # previews only live while their track converts, the ones found at startup were left by a crash
+    for file in os.listdir(PREVIEW_FOLDER):
+        if file.endswith(PREVIEW_SUFFIX):
+            remove_partial(os.path.join(PREVIEW_FOLDER, file))
+
+
+class ProgressivePlayback:
+    def __init__(self):
+        self.music = None
+        self.path: str = None
+        self.table = None
+        self.playing = False
+        self.leftovers: dict = {}
+
+    def start(self, music):
+        self.stop()
+        path = CONVERSION_QUEUE.request_preview(music)
+        if path is None:
+            return False
+        CONVERSION_QUEUE.promote(music)
+        self.music = music
+        self.path = path
+        self.leftovers[path] = music
+        return True
+
+    def stop(self):
+        self.music = self.path = self.table = None
+        self.playing = False
+
+    def writing(self):
+        return self.music is not None and CONVERSION_QUEUE.is_previewing(
+            self.music, self.path
+        )
+
+    def buffered(self):
+        if self.table is None:
+            return 0
+        try:
+            size = os.path.getsize(self.path) - self.table.start
+        except OSError:
+            return 0
+        return (
+            max(0, min(size, self.table.size))
+            / self.table.block_align
+            / self.table.rate
+        )
+
+    def growing(self):
+        # the mixer reads from its own thread, the stream keeps asking about its own preview
+        music, path = self.music, self.path
+        return lambda: CONVERSION_QUEUE.is_previewing(music, path)
+
+    def update(self):
+        self.clean_leftovers()
+        if self.music is None:
+            return None
+        if self.music.load_exc is not None:
+            return "failed"
+        if self.playing:
+            return None
+        writing = self.writing()
+        if self.table is None:
+            # the header is there once the converter wrote its first chunk
+            self.table = read_seek_table(self.path, True)
+        if self.table is None:
+            if writing:
+                return None
+            # the conversion finished before it could start over with a preview
+            return "failed" if self.music.pending else "converted"
+        if writing and self.buffered() < PREVIEW_START:
+            return None
+        if not SEEK_STREAMS.play(self.path, 0, self.growing() if writing else None):
+            return "failed"
+        self.playing = True
+        return "started"
+
+    def seek(self, music, pos):
+        if music is not self.music or not self.playing:
+            return False
+        growing = self.growing() if self.writing() else None
+        return SEEK_STREAMS.play(self.path, pos, growing)
+
+    def clean_leftovers(self):
+        for path, music in list(self.leftovers.items()):
+            if path == self.path or CONVERSION_QUEUE.is_previewing(music, path):
+                continue
+            remove_partial(path)
+            if not os.path.exists(path):
+                self.leftovers.pop(path)
+
+
+PROGRESSIVE = ProgressivePlayback()
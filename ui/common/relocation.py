@@ -0,0 +1,102 @@
+import os
+import pathlib
+
+REWRITE_MISSES = 32
+
+
+def entry_path(entry):
+    return entry[0] if isinstance(entry, list) else entry
+
+
+def rewrite_path(path: pathlib.Path, old_prefix: pathlib.Path, new_prefix):
+    if path.parts[: len(old_prefix.parts)] != old_prefix.parts:
+        return None
+    return new_prefix.joinpath(*path.parts[len(old_prefix.parts) :])
+
+
+def missing_prefixes(paths):
+    # the first missing folder is where the library was unmounted or moved from
+    roots = {}
+    prefixes: dict[pathlib.Path, list[pathlib.Path]] = {}
+    for path in paths:
+        # tracks share few folders, each of them is walked up only once
+        folder = path.parent
+        root = roots.get(folder, None)
+        if root is None:
+            root = folder
+            while root.parent != root and not os.path.isdir(root.parent):
+                root = root.parent
+            roots[folder] = root
+        prefixes.setdefault(root, []).append(path)
+    return prefixes
+
+
+def find_rewrite(path: pathlib.Path, folder: pathlib.Path):
+    # the longest tail of the old path found in the chosen folder tells which prefix it replaces
+    for i in range(1, len(path.parts)):
+        if folder.joinpath(*path.parts[i:]).exists():
+            return pathlib.Path(*path.parts[:i]), folder
+    return None
+
+
+class Relocation:
+    def __init__(self):
+        self.rewrites: dict[tuple[pathlib.Path, pathlib.Path], int] = {}
+        self.located: dict[pathlib.Path, pathlib.Path] = {}
+
+    @classmethod
+    def plan(cls, paths, folder):
+        self = cls()
+        folder = pathlib.Path(folder).resolve()
+        for group in missing_prefixes(paths).values():
+            misses = 0
+            for path in group:
+                rewrite = self.match(path)
+                if rewrite is None:
+                    if misses >= REWRITE_MISSES:
+                        continue
+                    rewrite = find_rewrite(path, folder)
+                    if rewrite is None:
+                        misses += 1
+                        continue
+                    self.rewrites[rewrite] = 0
+                new_path = rewrite_path(path, *rewrite)
+                if new_path.exists():
+                    self.rewrites[rewrite] += 1
+                    self.located[path] = new_path
+        self.rewrites = {
+            rewrite: found for rewrite, found in self.rewrites.items() if found > 0
+        }
+        return self
+
+    @property
+    def found(self):
+        return sum(self.rewrites.values())
+
+    def match(self, path):
+        # the deepest prefix wins when rewrites nest
+        best = None
+        for rewrite in self.rewrites:
+            if rewrite_path(path, *rewrite) is not None and (
+                best is None or len(rewrite[0].parts) > len(best[0].parts)
+            ):
+                best = rewrite
+        return best
+
+    def locate(self, path):
+        if path in self.located:
+            return self.located[path]
+        rewrite = self.match(path)
+        if rewrite is None or path.exists():
+            return None
+        new_path = rewrite_path(path, *rewrite)
+        return new_path if new_path.exists() else None
+
+    def apply(self, playlists, history_data):
+        # a single pass over the saved paths, the media index keeps digests so nothing converts again
+        relocated = sum(
+            playlist.relocate_missing(self.locate) for playlist in playlists
+        )
+        for history in history_data:
+            history.relocate(self.locate)
+        return relocated
@@ -0,0 +1,279 @@
+import collections
+import contextlib
+import io
+import os
+import struct
+import time
+
+import pygame
+
+from ui.common.media_probe import extended_to_float
+from ui.common.profiler import PROFILER
+
+MAX_SEEK_TABLES = 64
+GROWING_WAIT = 0.05
+GROWING_POLL = 0.005
+WAV_FIXED_FORMATS = frozenset([1, 3, 6, 7, 0xFFFE])
+AIFC_FIXED_FORMATS = frozenset([b"NONE", b"sowt", b"twos", b"fl32", b"fl64"])
+
+
+class SeekTable:
+    def __init__(self, form, kind, info, start, size, block_align, rate):
+        self.form = form
+        self.kind = kind
+        self.info = info
+        self.start = start
+        self.size = size - size % block_align
+        self.block_align = block_align
+        self.rate = rate
+
+    @property
+    def namehint(self):
+        return "wav" if self.form == b"RIFF" else "aiff"
+
+    def offset(self, pos):
+        frame = min(int(pos * self.rate), self.size // self.block_align)
+        return frame * self.block_align
+
+    def header(self, size):
+        # the format chunk is copied as it was, only the sizes shrink to what is left
+        if self.form == b"RIFF":
+            fmt = chunk(b"fmt ", self.info, "<")
+            return (
+                struct.pack("<4sI4s", b"RIFF", 4 + len(fmt) + 8 + size, b"WAVE")
+                + fmt
+                + struct.pack("<4sI", b"data", size)
+            )
+        frames = size // self.block_align
+        comm = chunk(b"COMM", self.info[:2] + struct.pack(">I", frames) + self.info[6:])
+        return (
+            struct.pack(">4sI4s", b"FORM", 4 + len(comm) + 16 + size, self.kind)
+            + comm
+            + struct.pack(">4sIII", b"SSND", 8 + size, 0, 0)
+        )
+
+
+def chunk(name, data, byteorder=">"):
+    return (
+        struct.pack(f"{byteorder}4sI", name, len(data)) + data + b"\0" * (len(data) % 2)
+    )
+
+
+def read_chunks(file, byteorder):
+    while True:
+        header = file.read(8)
+        if len(header) < 8:
+            return
+        name, size = struct.unpack(f"{byteorder}4sI", header)
+        following = file.tell() + size + size % 2
+        yield name, size
+        file.seek(following)
+
+
+def read_wav_table(file):
+    info = None
+    for name, size in read_chunks(file, "<"):
+        if name == b"fmt ":
+            info = file.read(size)
+            if len(info) < 16:
+                return None
+            tag, _, rate, _, block_align = struct.unpack("<HHIIH", info[:14])
+            # only formats with a fixed size per frame can be cut at any frame
+            if tag not in WAV_FIXED_FORMATS or not block_align or not rate:
+                return None
+        elif name == b"data":
+            if info is None:
+                return None
+            return b"RIFF", b"WAVE", info, file.tell(), size, block_align, rate
+    return None
+
+
+def read_aiff_table(file, kind):
+    info = None
+    for name, size in read_chunks(file, ">"):
+        if name == b"COMM":
+            info = file.read(size)
+            if len(info) < 18:
+                return None
+            channels, _, bits = struct.unpack(">HIH", info[:8])
+            rate = extended_to_float(info[8:18])
+            if kind == b"AIFC" and info[18:22] not in AIFC_FIXED_FORMATS:
+                return None
+            block_align = channels * ((bits + 7) // 8)
+            if not block_align or not rate:
+                return None
+        elif name == b"SSND":
+            if info is None:
+                return None
+            offset = struct.unpack(">I", file.read(8)[:4])[0]
+            start = file.tell() + offset
+            return b"FORM", kind, info, start, size - 8 - offset, block_align, rate
+    return None
+
+
+def read_seek_table(path, growing=False):
+    try:
+        with open(path, "rb") as file:
+            form = file.read(12)
+            if form[:4] == b"RIFF" and form[8:12] == b"WAVE":
+                table = read_wav_table(file)
+            elif form[:4] == b"FORM" and form[8:12] in [b"AIFF", b"AIFC"]:
+                table = read_aiff_table(file, form[8:12])
+            else:
+                return None
+            if table is None:
+                return None
+            form, kind, info, start, size, block_align, rate = table
+            # streamed writers leave the size unset, the rest of the file is the data then
+            # a file still being written announces its final size, the samples arrive later
+            if not growing:
+                size = min(size, os.fstat(file.fileno()).st_size - start)
+    except (OSError, struct.error):
+        return None
+    if size <= 0:
+        return None
+    return SeekTable(form, kind, info, start, size, block_align, rate)
+
+
+class SeekStream(io.RawIOBase):
+    def __init__(self, file, namehint, header, start, size, block_align, growing=None):
+        super().__init__()
+        self.file = file
+        self.namehint = namehint
+        self.header = header
+        self.start = start
+        self.size = len(header) + size
+        self.block_align = block_align
+        self.growing = growing
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self.pos = max(0, offset)
+        return self.pos
+
+    def readinto(self, buffer):
+        # the header lives in memory, the samples are read from the track when the mixer asks
+        view = memoryview(buffer).cast("B")
+        wanted = min(len(view), max(0, self.size - self.pos))
+        done = 0
+        if self.pos < len(self.header) and wanted > 0:
+            data = self.header[self.pos : self.pos + wanted]
+            view[: len(data)] = data
+            done = len(data)
+        silence = 0
+        if done < wanted:
+            read, silence = self.read_samples(
+                view[done:wanted], self.pos + done - len(self.header)
+            )
+            done += read
+        self.pos += done
+        return done + silence
+
+    def read_samples(self, view, offset):
+        self.file.seek(self.start + offset)
+        done = self.file.readinto(view)
+        if done >= len(view) or self.growing is None:
+            return done, 0
+        waited = 0
+        while done < len(view) and waited < GROWING_WAIT:
+            if not self.growing():
+                # the writer finished meanwhile, what it flushed last is still read
+                return done + self.file.readinto(view[done:]), 0
+            time.sleep(GROWING_POLL)
+            waited += GROWING_POLL
+            done += self.file.readinto(view[done:])
+        if done >= len(view):
+            return done, 0
+        # the writer fell behind, silence plays meanwhile and the missing samples are read next time
+        done -= (offset + done) % self.block_align
+        silence = (len(view) - done) // self.block_align * self.block_align
+        view[done : done + silence] = bytes(silence)
+        return done, silence
+
+    def close(self):
+        if not self.closed:
+            self.file.close()
+        super().close()
+
+
+class SeekStreams:
+    def __init__(self):
+        self.tables: collections.OrderedDict[tuple, SeekTable | None] = (
+            collections.OrderedDict()
+        )
+        self.stream: SeekStream = None
+
+    def get_table(self, path):
+        # the table is a few numbers and the format chunk, reading it costs a few small reads
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = (str(path), stat.st_size, stat.st_mtime_ns)
+        if key in self.tables:
+            self.tables.move_to_end(key)
+            return self.tables[key]
+        table = self.tables[key] = read_seek_table(path)
+        if len(self.tables) > MAX_SEEK_TABLES:
+            self.tables.popitem(False)
+        return table
+
+    def open(self, path, pos, growing=None):
+        # a file still being written changes with every read, its table isn't kept
+        table = self.get_table(path) if growing is None else read_seek_table(path, True)
+        if table is None:
+            return None
+        offset = table.offset(pos)
+        size = table.size - offset
+        # the file is closed again when the stream can't be built around it
+        try:
+            with contextlib.ExitStack() as stack:
+                stream = SeekStream(
+                    stack.enter_context(open(path, "rb")),
+                    table.namehint,
+                    table.header(size),
+                    table.start + offset,
+                    size,
+                    table.block_align,
+                    growing,
+                )
+                stack.pop_all()
+        except OSError:
+            return None
+        return stream
+
+    def play(self, path, pos, growing=None):
+        stream = self.open(path, pos, growing)
+        if stream is None:
+            return False
+        try:
+            pygame.mixer.music.load(stream, stream.namehint)
+            pygame.mixer.music.play(0)
+        except pygame.error:
+            stream.close()
+            return False
+        PROFILER.count("seek_streams")
+        self.close()
+        self.stream = stream
+        return True
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+
+SEEK_STREAMS = SeekStreams()
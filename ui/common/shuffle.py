@@ -0,0 +1,131 @@
+import collections
+import itertools
+import random
+
+SHUFFLE_HISTORY = 200
+SHUFFLE_WINDOW = 8
+
+
+class ShuffleBag:
+    def __init__(self, playlist):
+        self.playlist = playlist
+        # the tracks left in this round, drawn from the end, removed ones leave a None behind
+        self.bag: list = None
+        self.slots: dict = {}
+        self.history = collections.deque(maxlen=SHUFFLE_HISTORY)
+        self.ahead = []
+        self.current = None
+
+    def contains(self, music):
+        return self.playlist.musictable.get(music.audiopath, None) is music
+
+    def refill(self):
+        # the tracks that just played can't come back before a few others did
+        recent = set(itertools.islice(reversed(self.history), SHUFFLE_WINDOW))
+        if self.current is not None:
+            recent.add(self.current)
+        bag = [music for music in self.playlist.musiclist if music not in recent]
+        random.shuffle(bag)
+        window = min(SHUFFLE_WINDOW, len(bag))
+        for music in recent:
+            if self.contains(music):
+                bag.insert(random.randint(0, len(bag) - window), music)
+        if len(bag) > 1 and bag[-1] is self.current:
+            bag[-1], bag[-2] = bag[-2], bag[-1]
+        self.bag = bag
+        self.slots = {music: i for i, music in enumerate(bag)}
+
+    def peek_next(self):
+        if len(self.ahead) > 0:
+            return self.ahead[-1]
+        if self.bag is not None:
+            while len(self.bag) > 0 and self.bag[-1] is None:
+                self.bag.pop()
+        if not self.bag:
+            self.refill()
+        return self.bag[-1] if len(self.bag) > 0 else None
+
+    def peek_previous(self):
+        return self.history[-1] if len(self.history) > 0 else None
+
+    def start(self, music):
+        if music is self.current:
+            return
+        if len(self.history) > 0 and self.history[-1] is music:
+            # going back along the play order keeps the way forward as it was
+            self.history.pop()
+            if self.current is not None:
+                self.ahead.append(self.current)
+        else:
+            if self.current is not None:
+                self.history.append(self.current)
+            if len(self.ahead) > 0 and self.ahead[-1] is music:
+                self.ahead.pop()
+            else:
+                self.ahead.clear()
+            self.take(music)
+        self.current = music
+
+    def take(self, music):
+        idx = self.slots.pop(music, None)
+        if idx is not None:
+            self.bag[idx] = None
+
+    def add(self, music):
+        if self.bag is None:
+            return
+        # a random slot of the round, the track drawn next stays the same
+        if len(self.bag) <= 0:
+            self.bag.append(music)
+            self.slots[music] = 0
+            return
+        last = len(self.bag) - 1
+        self.bag.append(self.bag[last])
+        idx = random.randint(0, last)
+        self.bag[last] = self.bag[idx]
+        self.bag[idx] = music
+        for slot in [last + 1, last, idx]:
+            if self.bag[slot] is not None:
+                self.slots[self.bag[slot]] = slot
+
+    def discard(self, music):
+        self.take(music)
+        # a track plays once per round, but the history spans a few rounds
+        if music in self.history:
+            self.history = collections.deque(
+                [other for other in self.history if other is not music],
+                maxlen=SHUFFLE_HISTORY,
+            )
+        self.ahead = [other for other in self.ahead if other is not music]
+        if music is self.current:
+            self.current = None
+
+    def get_save_data(self):
+        if self.bag is None and self.current is None:
+            return None
+        # saved as positions in the saved paths, the tracks are only known by their path there
+        entries = {music: i for i, music in enumerate(self.playlist.musiclist)}
+        return {
+            "bag": None
+            if self.bag is None
+            else [entries[music] for music in self.bag if music in entries],
+            "history": [entries[music] for music in self.history if music in entries],
+            "ahead": [entries[music] for music in self.ahead if music in entries],
+            "current": entries.get(self.current, None),
+        }
+
+    def load_from_data(self, data, musics):
+        def restore(indices):
+            return [
+                musics[i]
+                for i in indices
+                if 0 <= i < len(musics) and musics[i] is not None
+            ]
+
+        if data.get("bag", None) is not None:
+            self.bag = restore(data["bag"])
+            self.slots = {music: i for i, music in enumerate(self.bag)}
+        self.history.extend(restore(data.get("history", [])))
+        self.ahead = restore(data.get("ahead", []))
+        if data.get("current", None) is not None:
+            self.current = (restore([data["current"]]) or [None])[0]
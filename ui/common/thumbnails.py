@@ -0,0 +1,92 @@
+import collections
+import os
+import threading
+
+import pygame
+
+from ui.common.cover_loader import COVER_LOADER, PRIORITY_VISIBLE
+from ui.common.media_index import MEDIA_INDEX
+
+THUMBNAIL_SIZES = {"row": 128, "bar": 320, "full": 1280}
+THUMBNAIL_CACHE_SIZE = 6
+
+
+def thumbnail_path(path, variant):
+    root, extension = os.path.splitext(str(path))
+    return f"{root}@{variant}{extension}"
+
+
+def cover_paths(path):
+    return [str(path)] + [thumbnail_path(path, variant) for variant in THUMBNAIL_SIZES]
+
+
+def scale_to_fit(surface: pygame.Surface, size):
+    width, height = surface.get_size()
+    ratio = size / max(width, height, 1)
+    if ratio >= 1:
+        return surface
+    new_size = (max(1, round(width * ratio)), max(1, round(height * ratio)))
+    if surface.get_bitsize() in [24, 32]:
+        return pygame.transform.smoothscale(surface, new_size)
+    return pygame.transform.scale(surface, new_size)
+
+
+def save_thumbnails(surface: pygame.Surface, path):
+    thumbnails = {}
+    for variant, size in THUMBNAIL_SIZES.items():
+        thumbnail = scale_to_fit(surface, size)
+        pygame.image.save(thumbnail, thumbnail_path(path, variant))
+        MEDIA_INDEX.set_artifact(thumbnail_path(path, variant), True)
+        thumbnails[variant] = thumbnail
+    return thumbnails
+
+
+def load_thumbnail(path, variant):
+    if not MEDIA_INDEX.artifact_exists(thumbnail_path(path, variant)):
+        # covers saved before the variants existed are converted the first time they are needed
+        return save_thumbnails(pygame.image.load(path), path)[variant]
+    return pygame.image.load(thumbnail_path(path, variant))
+
+
+def rename_cover(old_path, new_path):
+    THUMBNAIL_CACHE.forget(old_path)
+    for old, new in zip(cover_paths(old_path), cover_paths(new_path)):
+        MEDIA_INDEX.rename_artifact(old, new)
+
+
+class ThumbnailCache:
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.surfaces: collections.OrderedDict = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path, variant) -> pygame.Surface | None:
+        key = (str(path), variant)
+        with self.lock:
+            if key in self.surfaces:
+                self.surfaces.move_to_end(key)
+                return self.surfaces[key]
+        if not COVER_LOADER.is_loading(key):
+            COVER_LOADER.request(
+                key,
+                key[0],
+                lambda path: load_thumbnail(path, variant),
+                lambda path, surface: self.put(path, variant, surface),
+                PRIORITY_VISIBLE,
+            )
+
+    def put(self, path, variant, surface):
+        with self.lock:
+            self.surfaces[(str(path), variant)] = surface
+            self.surfaces.move_to_end((str(path), variant))
+            while len(self.surfaces) > self.capacity:
+                self.surfaces.popitem(False)
+
+    def forget(self, path):
+        with self.lock:
+            for key in list(self.surfaces.keys()):
+                if key[0] == str(path):
+                    self.surfaces.pop(key)
+
+
+THUMBNAIL_CACHE = ThumbnailCache(THUMBNAIL_CACHE_SIZE)
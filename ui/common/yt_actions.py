@@ -4,21 +4,17 @@ import shutil
 import pygame
 import subprocess
 import urllib.error
-import urllib.request
 from ui.common import *
 from ui.common.data import YTVideoFormat, YTVideoResult
+from ui.common.deferred_imports import DEFERRED_IMPORTS
 
 if typing.TYPE_CHECKING:
     from ui.yt_search import YTSearchUI
     from ui.yt_menus.yt_download import YTDownloadUI
 
-try:
-    import youtubesearchpython as fast_yt_search
-except ImportError:
-    fast_yt_search = None
-
-
 def get_yt_image_async(file_path, url):
+    import urllib.request
+
     if os.path.exists(file_path):
         image = pygame.image.load(file_path)
     else:
@@ -106,6 +102,7 @@ def download_channel_async(video: "YTVideoResult", ui: "YTSearchUI", error_img):
 
 
 def search_videos_fast_async(ui: "YTSearchUI", query):
+    fast_yt_search = DEFERRED_IMPORTS.load("youtubesearchpython")
     try:
         result = fast_yt_search.VideosSearch(query, limit=ui.fetch_amount).result()[
             "result"
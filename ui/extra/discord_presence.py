@@ -1,7 +1,6 @@
 import pygame
 import typing
 import threading
-from ui.common import parse_music_stem
 
 if typing.TYPE_CHECKING:
     from MILIMP import MILIMP
@@ -81,9 +80,7 @@ class DiscordPresence:
         small_text = None
 
         if self.app.music is not None:
-            state = (
-                f"Listening to: {parse_music_stem(self.app, self.app.music.realstem)}"
-            )
+            state = f"Listening to: {self.app.music.display_stem(self.app)}"
             details = f"Playlist: {self.app.music.playlist.name}"
             start = self.app.music_start_time
             small_image = "mili_miniplayer_icon"
@@ -1,6 +1,7 @@
 import mili
 import pygame
 from ui.common import *
+from ui.common.data import NotCached
 
 
 class MiniplayerUI:
@@ -185,6 +186,8 @@ class MiniplayerUI:
         self.prev_mpos = mpos
 
     def ui_line(self):
+        if self.app.music.duration in [None, NotCached]:
+            return
         totalw = self.window.size[0] - self.mult(8)
         pos = self.app.get_music_pos()
         percentage = (pos) / self.app.music.duration
@@ -208,7 +211,7 @@ class MiniplayerUI:
     def ui_cover(self):
         cover = ICONS.music_cover
         if self.app.music.cover is not None:
-            cover = self.app.music.cover
+            cover = self.app.music.cover_variant("bar")
         current = (
             self.app.music_controls.async_videoclip is not None
             and self.app.music_controls.music_videoclip_cover is not None
@@ -254,7 +257,7 @@ class MiniplayerUI:
                     "fill_color": MP_BG_FILL,
                 },
             )
-            if self.app.music_index > 0 or shift:
+            if self.app.music_controls.can_skip_previous() or shift:
                 self.ui_control_btn(
                     ICONS.back5 if shift else ICONS.skip_previous,
                     50,
@@ -269,10 +272,7 @@ class MiniplayerUI:
                 self.app.music_controls.action_play,
                 1,
             )
-            if (
-                self.app.music_index < len(self.app.music.playlist.musiclist) - 1
-                or shift
-            ):
+            if self.app.music_controls.can_skip_next() or shift:
                 self.ui_control_btn(
                     ICONS.skip5 if shift else ICONS.skip_next,
                     50,
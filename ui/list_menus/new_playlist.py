@@ -2,10 +2,31 @@ import os
 import mili
 import pygame
 import pathlib
+import functools
 from ui.common import *
-from ui.common.data import Playlist
+from ui.common.data import Playlist, PlaylistGroup
+from ui.common.folder_watcher import FOLDER_WATCHER
+from ui.common.ingest import INGEST
 from ui.common.entryline import UIEntryline
-import tkinter.filedialog as filedialog
+
+SUBFOLDER_MODES = {
+    "ignore": (
+        "Subfolders: ignored",
+        "Only the tracks directly inside the folder are added",
+    ),
+    "merge": (
+        "Subfolders: included",
+        "The tracks inside every subfolder are added to the playlist",
+    ),
+    "groups": (
+        "Subfolders: as groups",
+        "Every subfolder becomes a group inside the playlist",
+    ),
+    "playlists": (
+        "Subfolders: as playlists",
+        "Every subfolder becomes a separate playlist",
+    ),
+}
 
 
 class NewPlaylistUI(UIComponent):
@@ -17,6 +38,7 @@ class NewPlaylistUI(UIComponent):
         self.cache = mili.ImageCache()
         self.create_type = "empty"
         self.selected_folder = None
+        self.subfolders = "ignore"
 
     def ui(self):
         self.mili.id_checkpoint(3000 + 200)
@@ -61,16 +83,22 @@ class NewPlaylistUI(UIComponent):
             | mili.PADLESS,
         ) as row:
             with self.mili.begin(
-                (0, 0, row.data.rect.w / 2.01, 0),
+                (0, 0, row.data.rect.w / 3.02, 0),
                 {"resizey": True, "padx": 0, "pady": 0},
             ) as left_cont:
                 self.ui_section_btn(left_cont, "empty", "Empty")
 
             with self.mili.begin(
-                (0, 0, row.data.rect.w / 2.01, 0),
+                (0, 0, row.data.rect.w / 3.02, 0),
+                {"resizey": True, "padx": 0, "pady": 0},
+            ) as middle_cont:
+                self.ui_section_btn(middle_cont, "folder", "Load Folder")
+
+            with self.mili.begin(
+                (0, 0, row.data.rect.w / 3.02, 0),
                 {"resizey": True, "padx": 0, "pady": 0},
             ) as right_cont:
-                self.ui_section_btn(right_cont, "folder", "Load Folder")
+                self.ui_section_btn(right_cont, "linked", "Link Folder")
 
         if self.create_type == "empty":
             self.ui_empty_playlist_modal()
@@ -100,9 +128,11 @@ class NewPlaylistUI(UIComponent):
                 self.app.cursor_hover = True
             if cont.hovered:
                 self.app.tick_tooltip(
-                    "Create an empty playlist with a name"
-                    if ctype == "empty"
-                    else "Create a playlist with all the tracks inside a folder"
+                    {
+                        "empty": "Create an empty playlist with a name",
+                        "folder": "Create a playlist with all the tracks inside a folder",
+                        "linked": "Create a playlist that follows the tracks added, removed or renamed inside a folder",
+                    }[ctype]
                 )
 
     def ui_empty_playlist_modal(self):
@@ -160,6 +190,8 @@ class NewPlaylistUI(UIComponent):
                 self.anim_create,
                 tooltip="Confirm and create the playlist",
             )
+        if self.create_type == "folder":
+            self.ui_subfolders_option()
         self.mili.text_element(
             "Creating might take some time if video files are present",
             {
@@ -173,7 +205,27 @@ class NewPlaylistUI(UIComponent):
             {"fillx": True, "blocking": None},
         )
 
+    def ui_subfolders_option(self):
+        text, tooltip = SUBFOLDER_MODES[self.subfolders]
+        if it := self.mili.element(None, {"align": "center", "blocking": None}):
+            if it.hovered and self.app.can_interact():
+                self.mili.rect({"color": (MODALB_CV[0],) * 3, "border_radius": "10"})
+            self.mili.text(text, {"size": self.mult(18)})
+            if self.app.can_interact():
+                if it.left_just_released:
+                    self.action_cycle_subfolders()
+                if it.hovered or it.unhover_pressed:
+                    self.app.cursor_hover = True
+                if it.hovered:
+                    self.app.tick_tooltip(f"{tooltip} (click to change)")
+
+    def action_cycle_subfolders(self):
+        modes = list(SUBFOLDER_MODES.keys())
+        self.subfolders = modes[(modes.index(self.subfolders) + 1) % len(modes)]
+
     def action_folder_from_dialog(self):
+        import tkinter.filedialog as filedialog
+
         result = filedialog.askdirectory(mustexist=True)
         if result:
             self.selected_folder = result
@@ -222,13 +274,8 @@ class NewPlaylistUI(UIComponent):
             )
             self.selected_folder = None
             return
-        path = pathlib.Path(self.selected_folder)
+        path = pathlib.Path(self.selected_folder).resolve()
         name = path.name
-        paths = [
-            (path / file).resolve()
-            for file in os.listdir(path)
-            if (path / file).suffix[1:].lower() in FORMATS
-        ]
         original = None
         for p in self.app.playlists.copy():
             if p.name == name:
@@ -244,16 +291,57 @@ class NewPlaylistUI(UIComponent):
                 if btn == 1:
                     self.selected_folder = None
                     return
+        # linked folders only follow the top level, that's all the watcher looks at
+        mode = self.subfolders if self.create_type == "folder" else "ignore"
+        folder = str(path) if self.create_type == "linked" else None
         if original is None:
-            playlist = Playlist(name, paths)
+            playlist = Playlist(name, [], loading_image=ICONS.loading, folder=folder)
             self.app.playlists.append(playlist)
         else:
-            realpaths = original.realpaths
-            for newpath in paths:
-                if newpath not in realpaths:
-                    original.load_music(newpath, ICONS.loading)
+            playlist = original
+            if folder is not None:
+                playlist.folder = folder
+                FOLDER_WATCHER.watch(playlist)
+        # tracks already in the playlist are skipped when their placeholder is created
+        INGEST.scan(
+            playlist,
+            path,
+            functools.partial(self.route_scanned, playlist, path, mode),
+            recursive=mode != "ignore",
+        )
         self.close()
 
+    def route_scanned(self, playlist: Playlist, root, mode, folder, files):
+        if folder == root or mode == "merge":
+            INGEST.add_placeholders(playlist, files)
+            return
+        if len(files) <= 0:
+            return
+        parts = folder.relative_to(root).parts
+        if mode == "groups":
+            name = " / ".join(parts)
+            group = None
+            for g in playlist.groups:
+                if g.name == name:
+                    group = g
+            if group is None:
+                idx = max([g.idx for g in playlist.groups], default=-1) + 1
+                group = PlaylistGroup(name, playlist, [], idx)
+                playlist.groups.append(group)
+            for music in INGEST.add_placeholders(playlist, files):
+                group.add(music)
+            return
+        # playlist names end up in file names, so the path separators can't stay
+        name = " - ".join([root.name, *parts])
+        target = None
+        for p in self.app.playlists:
+            if p.name == name:
+                target = p
+        if target is None:
+            target = Playlist(name, [], loading_image=ICONS.loading)
+            self.app.playlists.append(target)
+        INGEST.add_placeholders(target, files)
+
     def remove_duplicates(self, name):
         for p in self.app.playlists.copy():
             if p.name == name:
@@ -266,9 +354,9 @@ class NewPlaylistUI(UIComponent):
                 )
                 if btn == 1:
                     return False
-                for music in p.musiclist:
-                    if music is self.app.music:
-                        self.app.end_music()
+                if self.app.music is not None and self.app.music.playlist is p:
+                    self.app.end_music()
+                p.detach_workers()
                 self.app.playlists.remove(p)
         return True
 
@@ -1,9 +1,10 @@
 import os
 import mili
 import pygame
-import pathlib
 from ui.common import *
 from ui.common.entryline import UIEntryline
+from ui.common.media_index import MEDIA_INDEX
+from ui.common.thumbnails import rename_cover
 
 
 class RenamePlaylistUI(UIComponent):
@@ -118,34 +119,23 @@ class RenamePlaylistUI(UIComponent):
 
     def final_rename(self, name):
         old_name = self.app.menu_data.name
-        for file in os.listdir("data/mp3_converted"):
-            if file.startswith(old_name):
-                old_path = pathlib.Path(f"data/mp3_converted/{file}").resolve()
-                new_path = pathlib.Path(
-                    f"data/mp3_converted/{name}{file.removeprefix(old_name)}"
+        # artifacts from before the digest names are found by playlist name, they follow it
+        for realpath in self.app.menu_data.realpaths:
+            legacy_audio = f"data/mp3_converted/{old_name}_{realpath.stem}.mp3"
+            if MEDIA_INDEX.artifact_exists(legacy_audio):
+                MEDIA_INDEX.rename_artifact(
+                    legacy_audio, f"data/mp3_converted/{name}_{realpath.stem}.mp3"
                 )
-                if not os.path.exists(new_path):
-                    os.rename(old_path, new_path)
-        for file in os.listdir("data/music_covers"):
-            if file.startswith(old_name):
-                old_path = pathlib.Path(f"data/music_covers/{file}").resolve()
-                new_path = pathlib.Path(
-                    f"data/music_covers/{name}{file.removeprefix(old_name)}"
+            legacy_cover = f"data/music_covers/{old_name}_{realpath.stem}.png"
+            if MEDIA_INDEX.artifact_exists(legacy_cover):
+                rename_cover(
+                    legacy_cover, f"data/music_covers/{name}_{realpath.stem}.png"
                 )
-                if not os.path.exists(new_path):
-                    os.rename(old_path, new_path)
         if os.path.exists(f"data/covers/{old_name}.png"):
             if not os.path.exists(f"data/covers/{name}.png"):
                 os.rename(f"data/covers/{old_name}.png", f"data/covers/{name}.png")
-        self.app.menu_data.__init__(
-            name,
-            [
-                [music.realpath, "converted"] if music.converted else music.realpath
-                for music in self.app.menu_data.musiclist
-            ],
-            self.app.menu_data.groups,
-            ICONS.loading,
-        )
+        # renamed in place, the tracks, groups, shuffle bag and folder watch stay as they are
+        self.app.menu_data.name = name
 
     def close(self):
         self.entryline.text = ""
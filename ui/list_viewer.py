@@ -2,6 +2,7 @@ import mili
 import pygame
 from ui.common import *
 from ui.common.data import Playlist
+from ui.common.cover_loader import COVER_LOADER, PRIORITY_VISIBLE
 from ui.list_menus.new_playlist import NewPlaylistUI
 from ui.list_menus.rename_playlist import RenamePlaylistUI
 
@@ -151,6 +152,8 @@ class ListViewerUI(UIComponent):
             imagesize = self.mult(70)
             padsize = 0
             cover = playlist.cover
+            if cover is ICONS.loading:
+                COVER_LOADER.bump(playlist, PRIORITY_VISIBLE)
             if cover is None:
                 cover = ICONS.playlist_cover
             if cover is not None:
@@ -189,6 +192,9 @@ class ListViewerUI(UIComponent):
             if self.app.can_interact():
                 if cont.hovered or cont.unhover_pressed:
                     self.app.cursor_hover = True
+                    self.app.tick_tooltip(
+                        f"{playlist.track_count} track{'s' if playlist.track_count != 1 else ''}"
+                    )
                 if cont.left_just_released:
                     self.app.playlist_viewer.enter(playlist)
                 elif (
@@ -267,11 +273,16 @@ class ListViewerUI(UIComponent):
             self.app.close_menu()
             return
         try:
-            for music in self.app.menu_data.musiclist:
-                if music is self.app.music:
-                    self.app.end_music()
-                self.app.remove_from_history(music)
-            self.app.playlists.remove(self.app.menu_data)
+            playlist = self.app.menu_data
+            if self.app.music is not None and self.app.music.playlist is playlist:
+                self.app.end_music()
+            playlist.detach_workers()
+            self.app.history_data = [
+                history
+                for history in self.app.history_data
+                if history.playlist is not playlist
+            ]
+            self.app.playlists.remove(playlist)
         except Exception:
             pass
         self.app.close_menu()
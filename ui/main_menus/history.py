@@ -1,7 +1,8 @@
 import mili
 import pygame
 from ui.common import *
-from ui.common.data import HistoryData
+from ui.common.data import HistoryData, NotCached
+from ui.common.media_probe import DURATION_PROBER, PROBE_URGENT
 
 
 class HistoryUI(UIComponent):
@@ -84,7 +85,10 @@ class HistoryUI(UIComponent):
             self.scrollbar.style["short_size"] = self.mult(self.sbar_size)
             self.scrollbar.update(cont)
             self.ui_scrollbar()
-            for history in reversed(self.app.history_data):
+            for history in reversed(self.app.history_data.copy()):
+                if history.resolve() is None:
+                    self.app.history_data.remove(history)
+                    continue
                 self.ui_history(history, cont.data.absolute_rect)
             if len(self.app.history_data) <= 0:
                 self.mili.text_element(
@@ -117,8 +121,10 @@ class HistoryUI(UIComponent):
 
     def ui_history(self, history: HistoryData, parent_rect):
         if history.duration == "not cached" and history.music.pos_supported:
-            history.music.cache_duration()
-            history.duration = history.music.duration
+            if history.music.duration is NotCached:
+                DURATION_PROBER.request(history.music, PROBE_URGENT)
+            else:
+                history.duration = history.music.duration
         with self.mili.begin(
             (0, 0, 0, 0),
             {
@@ -150,7 +156,10 @@ class HistoryUI(UIComponent):
                 self.mili.element((0, 0, 0, self.mult(60)), {"blocking": False})
 
     def ui_history_time(self, history: HistoryData, cont_rect):
-        if history.music.pos_supported:
+        if history.music.pos_supported and history.duration not in [
+            None,
+            "not cached",
+        ]:
             data = self.mili.line_element(
                 [("-49.5", 0), ("49.5", 0)],
                 {"color": (120,) * 3, "size": self.mult(2)},
@@ -200,7 +209,7 @@ class HistoryUI(UIComponent):
                     {"align": "center", "blocking": False},
                 )
             self.mili.text_element(
-                parse_music_stem(self.app, history.music.realstem),
+                history.music.display_stem(self.app),
                 {
                     "size": self.mult(16),
                     "growx": False,
@@ -217,7 +226,7 @@ class HistoryUI(UIComponent):
         self.app.playlist_viewer.enter(history.music.playlist)
         self.app.play_music(
             history.music,
-            history.music.playlist.get_group_sorted_musics().index(history.music),
+            history.music.playlist.index_of(history.music),
         )
         self.app.set_music_pos(history.position)
         self.app.playlist_viewer.set_scroll_to_music()
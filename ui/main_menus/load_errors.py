@@ -0,0 +1,248 @@
+import mili
+import pygame
+
+from ui.common import *
+from ui.common.load_errors import LOAD_ERRORS, LoadError
+from ui.common.profiler import PROFILER
+from ui.common.relocation import Relocation
+
+
+class LoadErrorsUI(UIComponent):
+    def init(self):
+        self.anim_close = animation(-5)
+        self.anim_remove = animation(-2)
+        self.anim_relocate = animation(-2)
+        self.cache = mili.ImageCache()
+        self.scroll = mili.Scroll()
+        self.scrollbar = mili.Scrollbar(self.scroll, {"short_size": 7, "axis": "y"})
+        self.sbar_size = self.scrollbar.style["short_size"]
+
+    def ui(self):
+        self.mili.id_checkpoint(3000 + 700)
+        handle_arrow_scroll(self.app, self.scroll, self.scrollbar)
+
+        with self.mili.begin(
+            ((0, 0), self.app.split_size),
+            {"ignore_grid": True, "blocking": True} | mili.CENTER,
+        ) as shadowit:
+            if shadowit.left_just_released:
+                self.close()
+            self.mili.image(
+                SURF, {"fill": True, "fill_color": (0, 0, 0, 200), "cache": self.cache}
+            )
+
+            with self.mili.begin(
+                (0, 0, 0, 0),
+                {
+                    "fillx": "90",
+                    "filly": "75",
+                    "align": "center",
+                    "spacing": self.mult(13),
+                    "offset": (
+                        0,
+                        -self.mult(50)
+                        * (self.app.music is not None and not self.app.split_screen)
+                        - self.app.tbarh / 2,
+                    ),
+                    "blocking": None,
+                },
+            ):
+                self.mili.rect({"color": (MODAL_CV,) * 3, "border_radius": "5"})
+
+                self.ui_modal_content()
+
+            self.ui_overlay_btn(
+                self.anim_close,
+                self.close,
+                ICONS.close,
+                tooltip="Close",
+            )
+
+    def ui_modal_content(self):
+        missing = sum(error.missing for error in LOAD_ERRORS.errors)
+        with self.mili.begin(
+            None,
+            mili.RESIZE
+            | mili.PADLESS
+            | mili.CENTER
+            | mili.X
+            | {"clip_draw": False, "blocking": None},
+        ):
+            self.mili.text_element(
+                f"Load errors ({len(LOAD_ERRORS.errors)})",
+                {"size": self.mult(26)},
+                None,
+                mili.CENTER | {"blocking": None},
+            )
+            if missing > 0:
+                self.ui_image_btn(
+                    ICONS.uploadf,
+                    self.action_relocate,
+                    self.anim_relocate,
+                    30,
+                    tooltip="Choose the folder the missing tracks were moved to, or the drive they are on now",
+                )
+            self.ui_image_btn(
+                ICONS.delete,
+                self.action_remove_all,
+                self.anim_remove,
+                30,
+                tooltip="Remove every missing track from its playlist",
+            )
+        with self.mili.begin(
+            None,
+            {"fillx": True, "filly": True, "blocking": None} | mili.PADLESS,
+        ) as cont:
+            self.scroll.update(cont)
+            self.scrollbar.style["short_size"] = self.mult(self.sbar_size)
+            self.scrollbar.update(cont)
+            self.ui_scrollbar()
+            for error in LOAD_ERRORS.errors:
+                self.ui_error(error, cont.data.absolute_rect)
+            if len(LOAD_ERRORS.errors) <= 0:
+                self.mili.text_element(
+                    "No load errors",
+                    {"size": self.mult(20), "color": (200,) * 3},
+                    None,
+                    {"align": "center", "blocking": None},
+                )
+
+        self.mili.element((0, 0, 0, self.mult(4)), {"blocking": None})
+
+    def ui_scrollbar(self):
+        if self.scrollbar.needed:
+            with self.mili.begin(
+                self.scrollbar.bar_rect, self.scrollbar.bar_style | {"blocking": None}
+            ):
+                self.mili.rect({"color": (BSBAR_CV,) * 3})
+                if handle := self.mili.element(
+                    self.scrollbar.handle_rect, self.scrollbar.handle_style
+                ):
+                    self.mili.rect(
+                        {"color": (cond(self.app, handle, *SHANDLE_CV) * 1.2,) * 3}
+                    )
+                    self.scrollbar.update_handle(handle)
+                    if (
+                        handle.hovered or handle.unhover_pressed
+                    ) and self.app.can_interact():
+                        self.app.cursor_hover = True
+                        self.app.tick_tooltip(None)
+
+    def ui_error(self, error: LoadError, parent_rect):
+        with self.mili.begin(
+            (0, 0, 0, 0),
+            {
+                "fillx": "97" if self.scrollbar.needed else "99",
+                "resizey": True,
+                "offset": (
+                    self.scrollbar.needed * -self.mult(self.sbar_size / 2),
+                    self.scroll.get_offset()[1],
+                ),
+                "pady": 2,
+                "align": "center",
+                "blocking": None,
+            },
+        ) as it:
+            if not it.data.absolute_rect.colliderect(parent_rect):
+                self.mili.element((0, 0, 0, self.mult(40)), {"blocking": False})
+                return
+            self.mili.rect({"color": (MENUB_CV[0],) * 3})
+            self.mili.text_element(
+                error.playlist.name,
+                {"size": self.mult(15), "color": (150,) * 3, "align": "left"},
+                None,
+                {"align": "first", "blocking": False},
+            )
+            self.mili.text_element(
+                error.message,
+                {
+                    "size": self.mult(16),
+                    "growx": False,
+                    "wraplen": "100",
+                    "slow_grow": True,
+                    "font_align": pygame.FONT_LEFT,
+                    "align": "left",
+                },
+                None,
+                {"fillx": True, "blocking": False},
+            )
+
+    def action_relocate(self):
+        from tkinter import filedialog
+
+        result = filedialog.askdirectory(mustexist=True)
+        if not result:
+            return
+        relocation = Relocation.plan(
+            [
+                path
+                for playlist in self.app.playlists
+                for path in playlist.missing_paths()
+            ],
+            result,
+        )
+        if relocation.found <= 0:
+            pygame.display.message_box(
+                "Relocation failed",
+                f"None of the missing tracks were found in '{result}'.",
+                "error",
+                None,
+                ("Understood",),
+            )
+            return
+        rewrites = "\n".join(
+            f"'{old}' -> '{new}' ({found} track{'s' if found != 1 else ''})"
+            for (old, new), found in relocation.rewrites.items()
+        )
+        btn = pygame.display.message_box(
+            "Confirm relocation",
+            f"The missing tracks will be relocated by rewriting these folders:\n{rewrites}",
+            "info",
+            None,
+            ("Proceed", "Cancel"),
+        )
+        if btn == 1:
+            return
+        with PROFILER.phase("relocate library"):
+            relocated = relocation.apply(self.app.playlists, self.app.history_data)
+        LOAD_ERRORS.prune(self.app.playlists)
+        pygame.display.message_box(
+            "Relocation finished",
+            f"Relocated {relocated} track{'s' if relocated != 1 else ''}.",
+            "info",
+            None,
+            ("Understood",),
+        )
+        if len(LOAD_ERRORS.errors) <= 0:
+            self.close()
+
+    def action_remove_all(self):
+        btn = pygame.display.message_box(
+            "Confirm removal",
+            "Are you sure you want to remove every missing track from its playlist? The tracks won't be deleted from disk.",
+            "warn",
+            None,
+            ("Proceed", "Cancel"),
+        )
+        if btn == 1:
+            return
+        for playlist in self.app.playlists:
+            playlist.missing = []
+        LOAD_ERRORS.clear()
+        self.close()
+
+    def close(self):
+        # the missing tracks stay saved, the next startup reports them again
+        LOAD_ERRORS.clear()
+        self.app.modal_state = "none"
+
+    def event(self, event):
+        if self.app.listening_key:
+            return False
+        if event.type == pygame.MOUSEWHEEL:
+            handle_wheel_scroll(event, self.app, self.scroll, self.scrollbar)
+
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+            self.close()
+            return True
+        return False
@@ -30,7 +30,7 @@ class MusicFullscreenUI(UIComponent):
                 and self.app.focused
             )
             if self.app.music.cover is not None:
-                cover = self.app.music.cover
+                cover = self.app.music.cover_variant("full")
             if (
                 self.app.music_controls.music_videoclip_cover is not None
                 and self.app.focused
@@ -270,6 +270,7 @@ class SettingsUI(UIComponent):
 
     def action_shuffle(self):
         self.app.shuffle = not self.app.shuffle
+        self.app.music_controls.queue_next()
 
     def change_volume(self, value=None):
         if value is None:
@@ -287,6 +288,7 @@ class SettingsUI(UIComponent):
 
     def action_loop(self):
         self.app.loops = not self.app.loops
+        self.app.music_controls.queue_next()
 
     def action_keybinds(self):
         self.app.modal_state = "keybinds"
@@ -1,10 +1,13 @@
+import os
 import mili
 import pygame
-import random
 import pathlib
 from ui.common import *
 
-from ui.common.data import NotCached, AsyncVideoclipGetter
+from ui.common.data import NotCached, AsyncVideoclipGetter, MusicData
+from ui.common.conversion import CONVERSION_QUEUE
+from ui.common.progressive import PROGRESSIVE
+from ui.common.media_probe import DURATION_PROBER, PROBE_URGENT
 from ui.extra.miniplayer import MiniplayerUI
 
 
@@ -40,6 +43,7 @@ class MusicControlsUI(UIComponent):
         self.videoclip_rects = []
         self.clean_ui = False
         self.slider_hovered = False
+        self.queued: tuple[MusicData, int] = None
 
     def ui(self):
         if self.app.split_screen:
@@ -126,7 +130,7 @@ class MusicControlsUI(UIComponent):
         ):
             cover = ICONS.music_cover
             if self.app.music.cover is not None:
-                cover = self.app.music.cover
+                cover = self.app.music.cover_variant("full")
             if (
                 self.music_videoclip_cover is not None
                 and self.app.focused
@@ -178,16 +182,15 @@ class MusicControlsUI(UIComponent):
                     and self.music_videoclip_cover is not None
                     and pygame.key.get_mods() & pygame.KMOD_CTRL
                 ):
-                    self.app.music.cover = self.music_videoclip_cover.copy()
-                    pygame.image.save(
-                        self.app.music.cover,
-                        f"data/music_covers/{self.app.music.playlist.name}_{self.app.music.realstem}.png",
-                    )
+                    self.save_videoclip_cover()
+
+    def save_videoclip_cover(self):
+        self.app.music.set_cover(self.music_videoclip_cover.copy())
 
     def ui_cover(self):
         bigcover = False
         imgsize = 0
-        cover = self.app.music.cover
+        cover = self.app.music.cover_variant("bar")
         if self.music_videoclip_cover is not None and self.app.focused:
             cover = self.music_videoclip_cover
         if cover is not None:
@@ -215,11 +218,7 @@ class MusicControlsUI(UIComponent):
                     it.just_released_button == pygame.BUTTON_MIDDLE
                     and self.music_videoclip_cover is not None
                 ):
-                    self.app.music.cover = self.music_videoclip_cover.copy()
-                    pygame.image.save(
-                        self.app.music.cover,
-                        f"data/music_covers/{self.app.music.playlist.name}_{self.app.music.realstem}.png",
-                    )
+                    self.save_videoclip_cover()
                 if it.absolute_hover:
                     bigcover = True
                     self.app.cursor_hover = True
@@ -238,6 +237,10 @@ class MusicControlsUI(UIComponent):
             else:
                 self.ui_slider()
                 self.ui_time()
+        elif self.app.music.pos_supported and self.app.music.duration is NotCached:
+            self.ui_indeterminate_slider()
+            if not self.small_cont:
+                self.ui_time()
         elif not self.small_cont:
             self.mili.text_element(
                 "Audio format does not support track positioning",
@@ -253,8 +256,9 @@ class MusicControlsUI(UIComponent):
 
     def ui_time(self):
         pos = self.app.get_music_pos()
+        duration = self.app.music.duration
         txt, txtstyle = (
-            format_music_time(pos, self.app.music.duration),
+            format_music_time(pos, None if duration is NotCached else duration),
             {"color": (120,) * 3, "size": self.mult(20)},
         )
         size = self.mili.text_size(txt, txtstyle)
@@ -271,6 +275,29 @@ class MusicControlsUI(UIComponent):
             {"ignore_grid": True, "z": 9999, "parent_id": 0, "blocking": None},
         )
 
+    def ui_indeterminate_slider(self):
+        # the duration is still being probed, a sweeping bar shows the track is playing meanwhile
+        xoffset = self.app.split_w if self.app.split_screen else 0
+        totalw = self.width - self.mult(15)
+        height = self.mult(3 if self.small_cont else 5)
+        bottom = self.app.window.size[1] - self.mult(6 if self.small_cont else 10)
+        segmentw = totalw / 4
+        progress = (
+            pygame.time.get_ticks() % INDETERMINATE_PERIOD
+        ) / INDETERMINATE_PERIOD
+        with self.mili.begin(
+            pygame.Rect(0, 0, totalw, height).move_to(
+                midbottom=(xoffset + self.width / 2, bottom)
+            ),
+            {"ignore_grid": True, "parent_id": 0, "z": 9999, "blocking": None},
+        ):
+            self.mili.rect({"color": (30,) * 3})
+            self.mili.rect_element(
+                {"color": (255, 0, 0)},
+                (progress * (totalw + segmentw) - segmentw, 0, segmentw, height),
+                {"ignore_grid": True, "blocking": None},
+            )
+
     def ui_small_slider(self):
         xoffset = self.app.split_w if self.app.split_screen else 0
         totalw = self.width - self.mult(15)
@@ -294,6 +321,19 @@ class MusicControlsUI(UIComponent):
             ),
             {"ignore_grid": True, "parent_id": 0, "z": 99999, "blocking": None},
         )
+        bufferedw = self.get_buffered_width(totalw)
+        if bufferedw is not None:
+            self.mili.line_element(
+                [(-totalw / 2, 0), (-totalw / 2 + bufferedw, 0)],
+                {"color": (90,) * 3, "size": self.mult(3)},
+                pygame.Rect(0, 0, totalw, 2).move_to(
+                    midbottom=(
+                        xoffset + self.width / 2,
+                        self.app.window.size[1] - self.mult(6),
+                    )
+                ),
+                {"ignore_grid": True, "parent_id": 0, "z": 99999, "blocking": None},
+            )
         self.mili.line_element(
             [(-totalw / 2, 0), (-totalw / 2 + sizeperc, 0)],
             {"color": (255, 0, 0), "size": self.mult(3)},
@@ -331,6 +371,13 @@ class MusicControlsUI(UIComponent):
         ) as sbar:
             self.slider.update_area(sbar)
             self.mili.rect({"color": (30,) * 3})
+            bufferedw = self.get_buffered_width(totalw)
+            if bufferedw is not None:
+                self.mili.rect_element(
+                    {"color": (70,) * 3},
+                    (0, 0, bufferedw, self.mult(5)),
+                    {"ignore_grid": True, "blocking": None},
+                )
 
             redbar = self.mili.rect_element(
                 {"color": (255, 0, 0)},
@@ -380,6 +427,12 @@ class MusicControlsUI(UIComponent):
             else:
                 self.track_hover_pos = None
 
+    def get_buffered_width(self, totalw):
+        # a track playing while it converts can only be moved within what was written so far
+        if PROGRESSIVE.music is not self.app.music or not PROGRESSIVE.writing():
+            return None
+        return totalw * min(1, PROGRESSIVE.buffered() / self.app.music.duration)
+
     def ui_slider_hovered_time(self, sbar: mili.Interaction, handle: mili.Interaction):
         hperc = (
             pygame.mouse.get_pos()[0] - sbar.data.absolute_rect.x
@@ -445,7 +498,7 @@ class MusicControlsUI(UIComponent):
             {"fillx": True, "pady": 0, "spacing": 0},
         ) as cont:
             txt, txtstyle = (
-                f"{parse_music_stem(self.app, self.app.music.realstem)}",
+                f"{self.app.music.display_stem(self.app)}",
                 {"size": self.mult(22), "align": "left"},
             )
             size = self.mili.text_size(txt, txtstyle).x
@@ -480,7 +533,7 @@ class MusicControlsUI(UIComponent):
     def ui_big_cover(self):
         if self.app.split_screen:
             return
-        cover = self.app.music.cover
+        cover = self.app.music.cover_variant("full")
         if self.music_videoclip_cover is not None:
             cover = self.music_videoclip_cover
         if cover is None or cover is ICONS.music_cover:
@@ -531,7 +584,7 @@ class MusicControlsUI(UIComponent):
                     dots=True,
                     tooltip="Options",
                 )
-            if self.app.music_index > 0:
+            if self.can_skip_previous():
                 self.ui_control_btn(
                     ICONS.skip_previous,
                     self.action_skip_previous,
@@ -562,7 +615,7 @@ class MusicControlsUI(UIComponent):
                 True,
                 tooltip="Forward 5 seconds",
             )
-            if self.app.music_index < len(self.app.music.playlist.musiclist) - 1:
+            if self.can_skip_next():
                 self.ui_control_btn(
                     ICONS.skip_next,
                     self.action_skip_next,
@@ -644,7 +697,7 @@ class MusicControlsUI(UIComponent):
             return
         if not self.app.focused:
             return
-        image = self.app.music.cover
+        image = self.app.music.cover_variant("bar")
         if self.music_videoclip_cover is not None:
             image = self.music_videoclip_cover
             if self.async_videoclip.small_output is not None:
@@ -774,6 +827,7 @@ class MusicControlsUI(UIComponent):
 
     def action_loop(self):
         self.app.music_loops = not self.app.music_loops
+        self.queue_next()
         self.app.close_menu()
         if not self.app.split_screen:
             self.action_dots()
@@ -795,7 +849,7 @@ class MusicControlsUI(UIComponent):
         self.app.discord_presence.update()
 
     def move_pos_5(self, amount):
-        if not self.app.music.pos_supported and self.app.music.duration in [
+        if not self.app.music.pos_supported or self.app.music.duration in [
             None,
             NotCached,
         ]:
@@ -817,6 +871,9 @@ class MusicControlsUI(UIComponent):
         self.move_pos_5(-5)
 
     def action_skip_next(self, stop_if_end=False, consider_loop=False):
+        if self.app.shuffle:
+            self.skip_shuffled(self.app.music.playlist.shuffle_bag.peek_next())
+            return
         if len(self.app.music.playlist.musiclist) <= 0:
             if stop_if_end:
                 self.app.end_music()
@@ -829,8 +886,7 @@ class MusicControlsUI(UIComponent):
                 if stop_if_end:
                     self.app.end_music()
                 return
-        allmusics = self.app.music.playlist.get_group_sorted_musics()
-        new_music = allmusics[new_idx]
+        new_music = self.app.music.playlist.play_order[new_idx]
         doscroll = (
             new_music.group is not self.app.music.group
             or new_music.group is None
@@ -841,13 +897,16 @@ class MusicControlsUI(UIComponent):
             self.app.playlist_viewer.set_scroll_to_music(True)
 
     def action_skip_previous(self):
+        if self.app.shuffle:
+            # back along the order the tracks really played in
+            self.skip_shuffled(self.app.music.playlist.shuffle_bag.peek_previous(), -1)
+            return
         if len(self.app.music.playlist.musiclist) <= 0:
             return
         new_idx = self.app.music_index - 1
         if new_idx < 0:
             return
-        allmusics = self.app.music.playlist.get_group_sorted_musics()
-        new_music = allmusics[new_idx]
+        new_music = self.app.music.playlist.play_order[new_idx]
         doscroll = (
             new_music.group is not self.app.music.group
             or new_music.group is None
@@ -857,31 +916,107 @@ class MusicControlsUI(UIComponent):
         if doscroll:
             self.app.playlist_viewer.set_scroll_to_music(True, -1)
 
+    def skip_shuffled(self, new_music: MusicData, incdir=1):
+        if new_music is None:
+            return
+        doscroll = (
+            new_music.group is not self.app.music.group
+            or new_music.group is None
+            or new_music.group.mode == "v"
+        )
+        self.app.play_music(new_music, new_music.playlist.index_of(new_music))
+        if doscroll:
+            self.app.playlist_viewer.set_scroll_to_music(True, incdir)
+
+    def can_skip_previous(self):
+        if self.app.shuffle:
+            return self.app.music.playlist.shuffle_bag.peek_previous() is not None
+        return self.app.music_index > 0
+
+    def can_skip_next(self):
+        if self.app.shuffle:
+            return len(self.app.music.playlist.musiclist) > 1
+        return self.app.music_index < len(self.app.music.playlist.musiclist) - 1
+
     def action_rewind(self):
         self.app.close_menu()
         self.app.play_music(self.app.music, self.app.music_index)
 
-    def music_auto_finish(self):
+    def get_next_track(self):
+        # what plays once the current track finishes, None when playback stops there
+        music = self.app.music
+        musiclist = music.playlist.musiclist
         if self.app.music_loops:
-            self.app.play_music(self.app.music, self.app.music_index)
-            return
+            return music, self.app.music_index
         if self.app.shuffle:
-            music_available = self.app.music.playlist.musiclist.copy()
-            music_available.remove(self.app.music)
-            new_music = random.choice(music_available)
-            doscroll = (
-                new_music.group is not self.app.music.group
-                or new_music.group is None
-                or new_music.group.mode == "v"
-            )
-            self.app.play_music(
-                new_music,
-                self.app.music.playlist.musiclist.index(new_music),
-            )
-            if doscroll:
-                self.app.playlist_viewer.set_scroll_to_music(True)
+            new_music = music.playlist.shuffle_bag.peek_next()
+            if new_music is None:
+                return None
+            return new_music, music.playlist.index_of(new_music)
+        new_idx = self.app.music_index + 1
+        if new_idx >= len(musiclist):
+            if not self.app.loops or len(musiclist) <= 0:
+                return None
+            new_idx = 0
+        return music.playlist.play_order[new_idx], new_idx
+
+    def queue_next(self):
+        # the mixer opens the next track while this one plays and switches without a gap
+        stale, self.queued = self.queued, None
+        queued = self.get_queueable()
+        if queued is not None:
+            try:
+                pygame.mixer.music.queue(queued[0].audiopath)
+                self.queued = queued
+                return
+            except pygame.error:
+                pass
+        if stale is not None and self.app.music is not None:
+            # the mixer would still switch to the old next track, only loading again forgets it
+            self.app.reload_music()
+
+    def get_queueable(self):
+        if not self.app.gapless or self.app.music is None:
+            return None
+        if PROGRESSIVE.music is self.app.music and not PROGRESSIVE.playing:
+            return None
+        queued = self.get_next_track()
+        if queued is None:
+            return None
+        music = queued[0]
+        if music.pending:
+            CONVERSION_QUEUE.promote(music)
+            return None
+        if not os.path.exists(music.audiopath):
+            return None
+        if music.duration is NotCached:
+            DURATION_PROBER.request(music, PROBE_URGENT)
+        return queued
+
+    def music_auto_finish(self):
+        queued, self.queued = self.queued, None
+        following = self.get_next_track()
+        if following is None:
+            self.app.end_music()
             return
-        self.action_skip_next(True, True)
+        new_music, new_idx = following
+        # the queue is only trusted when nothing changed the order since it was filled
+        started = (
+            queued is not None
+            and queued[0] is new_music
+            and pygame.mixer.music.get_busy()
+        )
+        if new_music is self.app.music:
+            self.app.play_music(new_music, new_idx, started)
+            return
+        doscroll = (
+            new_music.group is not self.app.music.group
+            or new_music.group is None
+            or new_music.group.mode == "v"
+        )
+        self.app.play_music(new_music, new_idx, started)
+        if doscroll:
+            self.app.playlist_viewer.set_scroll_to_music(True)
 
     def event(self, event):
         if event.type == MUSIC_ENDEVENT:
@@ -129,12 +129,9 @@ class AddToGroupUI(UIComponent):
                         self.app.tick_tooltip(None)
 
     def add(self, group: PlaylistGroup):
-        self.music.group = group
-        group.musics.append(self.music)
+        group.add(self.music)
         if self.music is self.app.music:
-            self.app.music_index = self.music.playlist.get_group_sorted_musics().index(
-                self.music
-            )
+            self.app.music_index = self.music.playlist.index_of(self.music)
 
         self.close()
 
@@ -3,7 +3,6 @@ import pygame
 import pathlib
 import mili._core
 from ui.common import *
-import tkinter.filedialog as filedialog
 
 
 class ChangeCoverUI(UIComponent):
@@ -167,7 +166,7 @@ class ChangeCoverUI(UIComponent):
         self.is_reset = False
 
         playlist = self.app.playlist_viewer.playlist
-        allmusics = playlist.get_group_sorted_musics()
+        allmusics = playlist.play_order
         shift = pygame.key.get_pressed()[pygame.K_LSHIFT]
         if len(allmusics) <= 0:
             self.message = "Cannot generate from empty playlist"
@@ -247,6 +246,8 @@ class ChangeCoverUI(UIComponent):
         self.selected_image = new_surf
 
     def action_file_from_dialog(self):
+        import tkinter.filedialog as filedialog
+
         path = filedialog.askopenfilename()
         self.apply_from_path(path)
 
@@ -4,7 +4,7 @@ import pathlib
 from ui.common import *
 from ui.common.entryline import UIEntryline
 from ui.common.data import PlaylistGroup
-import tkinter.filedialog as filedialog
+from ui.common.ingest import INGEST
 
 
 class PlaylistAddUI(UIComponent):
@@ -206,6 +206,8 @@ class PlaylistAddUI(UIComponent):
                 break
 
     def action_music_from_dialog(self):
+        import tkinter.filedialog as filedialog
+
         paths = filedialog.askopenfilenames()
         paths = [pathlib.Path(path) for path in paths]
         paths = [file for file in paths if file.suffix[1:].lower() in FORMATS]
@@ -215,7 +217,8 @@ class PlaylistAddUI(UIComponent):
         self.selected_files = paths
 
     def music_from_dropfile(self, path: pathlib.Path):
-        if path.is_file() and path.suffix[1:].lower() in FORMATS:
+        # dropped folders are scanned for tracks once confirmed
+        if path.is_dir() or path.suffix[1:].lower() in FORMATS:
             if self.selected_files is None:
                 self.selected_files = []
             self.selected_files.append(path)
@@ -230,8 +233,7 @@ class PlaylistAddUI(UIComponent):
                 ("Understood",),
             )
             return
-        for path in self.selected_files:
-            self.app.playlist_viewer.playlist.load_music(path, ICONS.loading)
+        INGEST.submit(self.app.playlist_viewer.playlist, self.selected_files)
         self.close()
 
     def action_confirm_group(self):
@@ -3,6 +3,7 @@ import mili
 import pygame
 from ui.common import *
 from ui.common.data import MusicData
+from ui.common.media_index import MEDIA_INDEX
 from ui.common.entryline import UIEntryline
 
 
@@ -128,17 +129,7 @@ class RenameMusicUI(UIComponent):
             self.close()
             return
 
-        mp3path = f"data/mp3_converted/{self.app.playlist_viewer.playlist.name}_{self.music.realstem}.mp3"
-        newmp3path = f"data/mp3_converted/{self.app.playlist_viewer.playlist.name}_{new_stem}.mp3"
-        if os.path.exists(mp3path):
-            if not os.path.exists(newmp3path):
-                os.rename(mp3path, newmp3path)
-
-        coverpath = f"data/music_covers/{self.app.playlist_viewer.playlist.name}_{self.music.realstem}.png"
-        if os.path.exists(coverpath):
-            newcoverpath = f"data/music_covers/{self.app.playlist_viewer.playlist.name}_{new_stem}.png"
-            if not os.path.exists(newcoverpath):
-                os.rename(coverpath, newcoverpath)
+        MEDIA_INDEX.rename(self.music.realpath, new_path)
 
         idx = self.app.playlist_viewer.playlist.musiclist.index(self.music)
         self.app.playlist_viewer.playlist.remove(self.music.audiopath)
@@ -2,13 +2,21 @@ import mili
 import pygame
 import pathlib
 import platform
-import threading
 import subprocess
 from ui.common import *
-import moviepy
-import tkinter.filedialog as filedialog
-from ui.common.data import convert_music_async
-from ui.common.data import Playlist, MusicData, PlaylistGroup
+from ui.common.conversion import CONVERSION_QUEUE, PRIORITY_USER
+from ui.common.cover_loader import COVER_LOADER, PRIORITY_VISIBLE, PRIORITY_PREFETCH
+from ui.common.data import (
+    Playlist,
+    MusicData,
+    PlaylistGroup,
+    NotCached,
+    open_audioclip,
+)
+from ui.common.media_index import MEDIA_INDEX
+from ui.common.media_handles import MEDIA_HANDLES
+from ui.common.media_probe import DURATION_PROBER
+from ui.common.ingest import INGEST
 from ui.playlist_menus.playlist_add import PlaylistAddUI
 from ui.common.entryline import UIEntryline
 from ui.playlist_menus.move_music import MoveMusicUI
@@ -53,8 +61,8 @@ class PlaylistViewerUI(UIComponent):
         scores = {}
         rawsearch = self.search_entryline.text.strip()
         search = rawsearch.lower()
-        for apath in [music.audiopath for music in self.playlist.musiclist]:
-            path = self.playlist.musictable[apath].realpath
+        for music in self.playlist.musiclist:
+            path = music.realpath
             score = 0
             rawname = str(path.stem)
             name = rawname.lower()
@@ -70,13 +78,16 @@ class PlaylistViewerUI(UIComponent):
                     score += 10
                 if rawword.lower() in name.replace(" ", ""):
                     score += 5
-            scores[apath] = score
+            scores[music] = score
         return [
             v[0] for v in sorted(list(scores.items()), key=lambda x: x[1], reverse=True)
         ]
 
     def enter(self, playlist):
         self.playlist = playlist
+        DURATION_PROBER.request_many(
+            music for music in playlist.musiclist if music.duration is NotCached
+        )
         self.app.change_state("playlist")
 
     def ui_top_buttons(self):
@@ -165,10 +176,10 @@ class PlaylistViewerUI(UIComponent):
             {"filly": True},
         ) as scroll_cont:
             if self.search_active:
-                paths = self.sort_searched_songs()
+                musics = self.sort_searched_songs()
             else:
-                paths = self.playlist.get_group_sorted_musics(paths=True)
-            if len(paths) > 0:
+                musics = self.playlist.play_order
+            if len(musics) > 0:
                 self.scroll.update(scroll_cont)
                 self.scrollbar.style["short_size"] = self.mult(self.sbar_size)
                 self.scrollbar.update(scroll_cont)
@@ -183,8 +194,7 @@ class PlaylistViewerUI(UIComponent):
                     if len(group.musics) <= 0 and not self.search_active:
                         self.ui_group(group, empty=True)
 
-                for path in paths:
-                    music = self.playlist.musictable[path]
+                for music in musics:
                     if music.check():
                         continue
                     if last_group is not None and music.group != last_group:
@@ -368,8 +378,17 @@ class PlaylistViewerUI(UIComponent):
         )
 
     def ui_pending(self, music: MusicData):
-        self.mili.text_element(
-            f"'{parse_music_stem(self.app, music.realstem)}' is being converted...",
+        job = CONVERSION_QUEUE.get_job(music)
+        position = CONVERSION_QUEUE.position(music)
+        text = f"'{music.display_stem(self.app)}' is being converted..."
+        if INGEST.is_ingesting(music):
+            text = f"'{music.display_stem(self.app)}' is being added..."
+        elif job is not None and job.running:
+            text = f"{text} {int(job.progress * 100)}%"
+        elif position is not None:
+            text = f"'{music.display_stem(self.app)}' is waiting for conversion (#{position})"
+        it = self.mili.text_element(
+            text,
             {
                 "size": self.mult(16),
                 "color": (170,) * 3,
@@ -378,8 +397,25 @@ class PlaylistViewerUI(UIComponent):
                 "wraplen": self.app.split_w * 0.95,
             },
             None,
-            {"offset": self.scroll.get_offset(), "fillx": True, "blocking": None},
+            {"offset": self.scroll.get_offset(), "fillx": True},
         )
+        if job is None or not self.app.can_interact():
+            return
+        if it.hovered or it.unhover_pressed:
+            self.app.cursor_hover = True
+        if it.hovered:
+            self.app.tick_tooltip(
+                "Left click to play while converting, right click to cancel"
+                if job.new_path is not None
+                else "Left click to convert first, right click to cancel"
+            )
+        if it.left_just_released:
+            if job.new_path is not None:
+                self.action_start_playing(music)
+            else:
+                CONVERSION_QUEUE.promote(music)
+        elif it.just_released_button == pygame.BUTTON_RIGHT:
+            CONVERSION_QUEUE.cancel(music)
 
     def ui_scrollbar(self):
         if self.scrollbar.needed:
@@ -437,6 +473,7 @@ class PlaylistViewerUI(UIComponent):
                 self.ui_title_txt(coversize)
             if self.search_active:
                 self.ui_search()
+            self.ui_ingest_progress()
         self.mili.line_element(
             [("-49.5", 0), ("49.5", 0)],
             {"size": 1, "color": (100,) * 3},
@@ -445,6 +482,20 @@ class PlaylistViewerUI(UIComponent):
         )
         return ret
 
+    def ui_ingest_progress(self):
+        progress = INGEST.get_progress(self.playlist)
+        if progress is None:
+            return
+        text = f"Adding tracks: {progress.done}/{progress.total} ({progress.throughput:.1f} tracks/s)"
+        if progress.scanning > 0:
+            text = f"{text}, scanning folders... {progress.found} found"
+        self.mili.text_element(
+            text,
+            {"size": self.mult(16), "color": (170,) * 3},
+            None,
+            {"align": "center", "blocking": None},
+        )
+
     def ui_search(self):
         with self.mili.begin(
             (0, 0, self.app.split_w - self.mult(20), 0),
@@ -590,9 +641,7 @@ class PlaylistViewerUI(UIComponent):
                             )
                         self.ui_music_interaction(music, mit)
                         if self.app.can_interact() and mit.hovered:
-                            self.app.tick_tooltip(
-                                f"{parse_music_stem(self.app, music.realstem)}"
-                            )
+                            self.app.tick_tooltip(f"{music.display_stem(self.app)}")
 
     def ui_music(self, music: MusicData, offscreen=False):
         if offscreen:
@@ -614,6 +663,8 @@ class PlaylistViewerUI(UIComponent):
             },
         ) as cont:
             if cont.data.absolute_rect.colliderect(((0, 0), self.app.split_size)):
+                if music.cover is ICONS.loading:
+                    COVER_LOADER.bump(music, PRIORITY_VISIBLE)
                 self.ui_music_bg(cont, music)
                 imagesize = padsize = 0
                 if (
@@ -660,7 +711,7 @@ class PlaylistViewerUI(UIComponent):
                         {"cache": mili.ImageCache.get_next_cache(), "ready": scaled},
                     )
                 self.mili.text_element(
-                    parse_music_stem(self.app, music.realstem),
+                    music.display_stem(self.app),
                     {
                         "size": self.mult(18),
                         "growx": False,
@@ -681,6 +732,8 @@ class PlaylistViewerUI(UIComponent):
                 self.ui_music_interaction(music, cont)
             else:
                 self.mili.element((0, 0, 0, self.mult(70)), {"blocking": False})
+                if music.cover is ICONS.loading:
+                    COVER_LOADER.bump(music, PRIORITY_PREFETCH)
                 if cont.data.absolute_rect.top > self.app.window.size[1] * 1.2:
                     offscreen = True
         return offscreen
@@ -800,16 +853,14 @@ class PlaylistViewerUI(UIComponent):
         self.app.open_menu(music, *buttons)
 
     def action_change_cover(self):
+        import tkinter.filedialog as filedialog
+
         music: MusicData = self.app.menu_data
         path = filedialog.askopenfilename()
         if path:
             try:
                 img = pygame.image.load(pathlib.Path(path).resolve()).convert_alpha()
-                music.cover = img
-                pygame.image.save(
-                    img,
-                    f"data/music_covers/{self.playlist.name}_{music.realstem}.png",
-                )
+                music.set_cover(img)
             except Exception as e:
                 pygame.display.message_box(
                     "Error loading cover image",
@@ -835,9 +886,7 @@ class PlaylistViewerUI(UIComponent):
     def action_remove_from_group(self):
         self.app.menu_data.group.remove(self.app.menu_data)
         if self.app.menu_data is self.app.music:
-            self.app.music_index = self.playlist.get_group_sorted_musics().index(
-                self.app.menu_data
-            )
+            self.app.music_index = self.playlist.index_of(self.app.menu_data)
         self.app.close_menu()
 
     def action_convert(self):
@@ -845,7 +894,7 @@ class PlaylistViewerUI(UIComponent):
             "Confirm conversion",
             "Are you sure you want to convert this audio file to an MP3 file? "
             "The original file will not be modified. MP3 files allow track positioning. "
-            f"You can find the converted file at 'data/mp3_converted/{self.playlist.name}_{self.app.menu_data.realstem}.mp3' "
+            f"You can find the converted file at 'data/mp3_converted/{self.app.menu_data.digest}.mp3' "
             "which will be played automatically.",
             "warn",
             None,
@@ -854,10 +903,8 @@ class PlaylistViewerUI(UIComponent):
         if btn == 1:
             return
         music = self.app.menu_data
-        new_path = pathlib.Path(
-            f"data/mp3_converted/{self.playlist.name}_{music.realstem}.mp3"
-        ).resolve()
-        if os.path.exists(new_path):
+        new_path = music.converted_path
+        if MEDIA_INDEX.artifact_exists(new_path):
             self.app.close_menu()
             if music is self.app.music:
                 self.app.end_music()
@@ -865,7 +912,7 @@ class PlaylistViewerUI(UIComponent):
             return
 
         try:
-            audiofile = moviepy.AudioFileClip(str(music.realpath))
+            audiofile = MEDIA_HANDLES.open(open_audioclip, music.realpath)
         except Exception as exc:
             pygame.display.message_box(
                 "Could not convert music",
@@ -887,10 +934,7 @@ class PlaylistViewerUI(UIComponent):
         music.audiopath = new_path
         music.playlist.musictable.pop(music.realpath)
         music.playlist.musictable[music.audiopath] = music
-        thread = threading.Thread(
-            target=convert_music_async, args=(music, audiofile, new_path)
-        )
-        thread.start()
+        CONVERSION_QUEUE.submit(music, audiofile, new_path, priority=PRIORITY_USER)
 
     def action_search(self):
         if self.search_active:
@@ -967,15 +1011,16 @@ class PlaylistViewerUI(UIComponent):
             self.app.close_menu()
             return
         try:
-            if self.app.menu_data == self.app.music:
+            music = self.app.menu_data
+            if music == self.app.music:
                 self.app.end_music()
-            self.app.remove_from_history(self.app.menu_data)
-            path = self.app.menu_data.audiopath
-            self.playlist.remove(path)
-            if btn == 1:
-                mp3_path = f"data/mp3_converted/{self.playlist.name}_{self.app.menu_data.realstem}.mp3"
-                if os.path.exists(mp3_path):
-                    os.remove(mp3_path)
+            self.app.remove_from_history(music)
+            self.playlist.remove(music.audiopath)
+            # the same source in another playlist still plays from this conversion
+            if btn == 1 and not any(
+                playlist.uses_digest(music.digest) for playlist in self.app.playlists
+            ):
+                MEDIA_INDEX.remove_artifact(music.converted_path)
         except Exception:
             pass
         self.app.close_menu()
@@ -998,16 +1043,12 @@ class PlaylistViewerUI(UIComponent):
             if music is self.app.music:
                 musictochangeindex = music
         if musictochangeindex is not None:
-            self.app.music_index = self.playlist.get_group_sorted_musics().index(
-                musictochangeindex
-            )
+            self.app.music_index = self.playlist.index_of(musictochangeindex)
         self.playlist.groups.remove(self.app.menu_data)
         self.app.close_menu()
 
     def action_start_playing(self, music: MusicData):
-        self.app.play_music(
-            music, music.playlist.get_group_sorted_musics().index(music)
-        )
+        self.app.play_music(music, music.playlist.index_of(music))
 
     def stop_searching(self):
         self.search_active = False
@@ -1058,9 +1099,7 @@ class PlaylistViewerUI(UIComponent):
                 self.reorder_music_group(inc)
 
             if self.middle_selected is self.app.music:
-                self.app.music_index = self.playlist.get_group_sorted_musics().index(
-                    self.middle_selected
-                )
+                self.app.music_index = self.playlist.index_of(self.middle_selected)
         else:
             self.reorder_group(inc)
 
@@ -1081,14 +1120,13 @@ class PlaylistViewerUI(UIComponent):
 
         for group in sel_group.playlist.groups:  # move the index of each group to the delta that was created while moving sel_group around
             group.idx += ref_list.index(group) - old_idxs[group]
+        self.playlist.invalidate_order()
 
         for music in (
             sel_group.musics
         ):  # if any music inside the group was playing, reset its index
             if music is self.app.music:
-                self.app.music_index = self.playlist.get_group_sorted_musics().index(
-                    music
-                )
+                self.app.music_index = self.playlist.index_of(music)
                 break
 
     def reorder_music_nogroup(self, inc):
@@ -1124,6 +1162,7 @@ class PlaylistViewerUI(UIComponent):
                 music
             )  # if no group moved modify its index in the original list
             self.playlist.musiclist.insert(r_newidx, music)
+        self.playlist.invalidate_order()
 
     def reorder_music_group(self, inc):
         music = self.middle_selected
@@ -1134,6 +1173,7 @@ class PlaylistViewerUI(UIComponent):
 
         music.group.musics.remove(music)
         music.group.musics.insert(new_idx, music)
+        self.playlist.order_regrouped(music.group)
 
     def event(self, event):
         modal_exit = False
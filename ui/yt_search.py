@@ -18,15 +18,7 @@ from ui.common.yt_actions import (
     save_thumbnail_async,
 )
 from ui.common.entryline import UIEntryline
-
-try:
-    import webview
-except ImportError:
-    webview = None
-try:
-    import youtubesearchpython as fast_yt_search
-except ImportError:
-    fast_yt_search = None
+from ui.common.deferred_imports import DEFERRED_IMPORTS
 
 
 class YTSearchUI(UIComponent):
@@ -691,7 +683,9 @@ class YTSearchUI(UIComponent):
         webbrowser.open(self.app.menu_data.url)
 
     def action_open_embed(self):
-        if webview is None and not os.path.exists("ytembed.exe"):
+        if not DEFERRED_IMPORTS.is_available("webview") and not os.path.exists(
+            "ytembed.exe"
+        ):
             pygame.display.message_box(
                 "Missing Python Dependency 'pywebview'",
                 "To open the video embed in-app you must install the pywebview library with pip",
@@ -743,7 +737,7 @@ class YTSearchUI(UIComponent):
             if not found:
                 return True
         else:
-            if not fast_yt_search:
+            if not DEFERRED_IMPORTS.is_available("youtubesearchpython"):
                 pygame.display.message_box(
                     "Missing Dependency 'youtube-search-python'",
                     "Searching with mode 'youtube-search-python' relies on the 'youtube-search-python' python package dependency that must be pip installed. If that isn't an option use the search mode 'yt-dlp' with yt-dlp installed.",